@@ -0,0 +1,121 @@
+"""
+golden对比：固定seed的合成文档跑完整流程，特征文件和TEI的sha256必须和golden.json中记录的一致；
+同时检查流式抽取等不同路径生成的特征和完整流程的结果逐字节相同
+
+python -m benchmarks.golden            # 检查，不一致时返回非0
+python -m benchmarks.golden --update   # 确认输出的变化是预期的之后，更新golden.json
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+from grobid.feature_factory import FeatureFactory
+
+from benchmarks import synthetic_alto
+from benchmarks.pipeline import run_all
+from benchmarks.stub_labeler import label_segment
+
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.json")
+
+GOLDEN_DOCS = {
+    "small": dict(pages=2, blocks=3, lines=3, tokens=6, fonts=2, seed=1),
+    "default": dict(pages=4, blocks=6, lines=5, tokens=8, fonts=4, seed=0),
+    "long": dict(pages=40, blocks=8, lines=6, tokens=12, fonts=6, seed=7),
+}
+
+OUTPUT_FILES = ["segment.feature", "fulltext.feature", "tei.xml"]
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _check_paths(alto_path, output_dir):
+    """其它生成路径和完整流程的输出对比，返回不一致的路径名"""
+    with open(os.path.join(output_dir, "segment.feature")) as f:
+        expected = [l.rstrip("\n") for l in f]
+
+    errors = []
+
+    # 不预先解析整个文档，边读边抽取
+    streamed = list(FeatureFactory(alto_path).iter_segment_rows())
+    if streamed != expected:
+        errors.append("iter_segment_rows(streaming)")
+
+    ff = FeatureFactory(alto_path)
+    ff.prepare()
+    if list(ff.iter_segment_rows()) != expected:
+        errors.append("iter_segment_rows(parsed)")
+
+    # low_memory：segment和fulltext都逐页读取，不保留整个文档
+    with open(os.path.join(output_dir, "fulltext.feature")) as f:
+        expected_fulltext = [l.rstrip("\n") for l in f]
+
+    ff = FeatureFactory(alto_path, low_memory=True)
+    ff.prepare()
+    ff.build_segment_feature(dump=False)
+    ff.build_fulltext_feature(label_segment(expected), dump=False)
+    if list(ff.iter_feature_rows("fulltext")) != expected_fulltext:
+        errors.append("build_fulltext_feature(low_memory)")
+
+    return errors
+
+
+def compute_digests():
+    digests = {}
+    errors = []
+
+    with tempfile.TemporaryDirectory(prefix="grobid_golden_") as tmp_dir:
+        for name, kwargs in sorted(GOLDEN_DOCS.items()):
+            doc_dir = os.path.join(tmp_dir, name)
+            os.makedirs(doc_dir)
+            alto_path = synthetic_alto.write_alto(os.path.join(doc_dir, "alto.xml"), **kwargs)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_all(alto_path, doc_dir)
+                errors.extend("%s: %s" % (name, e) for e in _check_paths(alto_path, doc_dir))
+
+            digests[name] = {f: _digest(os.path.join(doc_dir, f)) for f in OUTPUT_FILES}
+
+    return digests, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="byte-identical output check against golden digests")
+    parser.add_argument("--update", action="store_true", help="rewrite golden.json with the current outputs")
+    args = parser.parse_args()
+
+    digests, errors = compute_digests()
+
+    if args.update:
+        with open(GOLDEN_PATH, "w") as w:
+            json.dump(digests, w, indent=2, sort_keys=True)
+            w.write("\n")
+        print("updated %s" % GOLDEN_PATH)
+    else:
+        with open(GOLDEN_PATH) as f:
+            golden = json.load(f)
+
+        for name, files in sorted(golden.items()):
+            for file_name, digest in sorted(files.items()):
+                if digests.get(name, {}).get(file_name) != digest:
+                    errors.append("%s: %s differs from golden" % (name, file_name))
+
+    for error in errors:
+        print(error)
+
+    if not errors:
+        print("ok")
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+low_memory模式的内存上限检查：生成一个很多页的合成ALTO，逐页读取跑完segment和fulltext特征，
+tracemalloc统计的内存峰值超过--ceiling时返回非0
+
+python -m benchmarks.memory_ceiling                    # 2000页，上限64 MiB
+python -m benchmarks.memory_ceiling --pages 500 --ceiling 32 --compare
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from grobid.feature_factory import FeatureFactory
+
+from benchmarks import synthetic_alto
+from benchmarks.stub_labeler import label_segment
+
+
+def measure(alto_path, low_memory):
+    """跑完segment特征 -> 分类(stub) -> fulltext特征 -> 生成特征行，返回 (内存峰值, 耗时, fulltext行数)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        ff = FeatureFactory(alto_path, low_memory=low_memory)
+        ff.prepare()
+        ff.build_segment_feature(dump=False)
+        ff.build_fulltext_feature(label_segment(ff.iter_feature_rows("segment")), dump=False)
+        rows = sum(1 for _ in ff.iter_feature_rows("fulltext"))
+
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return peak, elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="peak memory of the low_memory feature pipeline")
+    parser.add_argument("--ceiling", type=float, default=64, help="peak memory limit in MiB")
+    parser.add_argument("--compare", action="store_true", help="also measure the fully parsed mode")
+    synthetic_alto.add_arguments(parser)
+    parser.set_defaults(pages=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="grobid_memory_") as tmp_dir:
+        alto_path = synthetic_alto.write_alto(os.path.join(tmp_dir, "synthetic.xml"), **synthetic_alto.doc_kwargs(args))
+        print("%d pages, %.1f MiB" % (args.pages, os.path.getsize(alto_path) / 1024 ** 2))
+
+        modes = [("low_memory", True)] + ([("parsed", False)] if args.compare else [])
+        results = {}
+        for name, low_memory in modes:
+            results[name] = measure(alto_path, low_memory)
+            peak, elapsed, rows = results[name]
+            print("%-12s peak %8.2f MiB %8.2fs %8d fulltext rows" % (name, peak / 1024 ** 2, elapsed, rows))
+
+    peak = results["low_memory"][0] / 1024 ** 2
+    if peak > args.ceiling:
+        print("low_memory peak %.2f MiB exceeds the ceiling of %.2f MiB" % (peak, args.ceiling))
+        return 1
+
+    print("ok")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+按阶段运行一个ALTO文档的完整流程，分类用stub_labeler代替wapiti
+run_benchmarks和golden共用
+"""
+import os
+
+from grobid.alto_file import AltoFile
+from grobid.feature_factory import FeatureFactory
+from grobid.labels import LabelSequence
+from grobid.tei_builder import build_tei_body
+
+from benchmarks.stub_labeler import label_segment, label_fulltext
+
+
+def _parse(state):
+    from grobid.alto_document import parse_alto
+    state["doc"] = parse_alto(state["alto_path"])
+
+
+def _raw_from_alto(state):
+    alto_file = AltoFile(state["alto_path"], state["doc"])
+    alto_file._get_raw_from_alto()
+    state["alto_file"] = alto_file
+
+
+def _main_areas(state):
+    state["main_area"] = state["alto_file"].calc_page_main_areas()
+
+
+def _extract_for_segment(state):
+    ff = FeatureFactory(state["alto_path"], state["doc"])
+    ff.prepare()
+    ff.feature_map["segment"] = ff._extract_for_segment()
+    state["ff"] = ff
+
+
+def _dump_segment(state):
+    path = os.path.join(state["output_dir"], "segment.feature")
+    state["ff"]._dump_feature("segment", path)
+    state["segment_path"] = path
+
+
+def _label_segment(state):
+    with open(state["segment_path"]) as f:
+        state["segment_labels"] = label_segment(f)
+
+
+def _extract_for_fulltext(state):
+    ff = state["ff"]
+    ff.block_map = ff._build_block_map(LabelSequence.from_lines(state["segment_labels"]))
+    ff.feature_map["fulltext"] = ff._extract_fulltext({})
+
+
+def _dump_fulltext(state):
+    path = os.path.join(state["output_dir"], "fulltext.feature")
+    state["ff"]._dump_feature("fulltext", path)
+    state["fulltext_path"] = path
+
+
+def _label_fulltext(state):
+    with open(state["fulltext_path"]) as f:
+        state["fulltext_labels"] = label_fulltext(f)
+
+
+def _build_tei(state):
+    state["tei"] = build_tei_body(state["fulltext_labels"])
+
+
+# (阶段名, 函数, 是否计入基准测试)
+STAGES = [
+    ("parse_alto", _parse, True),
+    ("_get_raw_from_alto", _raw_from_alto, True),
+    ("calc_page_main_areas", _main_areas, True),
+    ("_extract_for_segment", _extract_for_segment, True),
+    ("_dump_feature(segment)", _dump_segment, True),
+    ("label_segment(stub)", _label_segment, False),
+    ("_extract_for_fulltext", _extract_for_fulltext, True),
+    ("_dump_feature(fulltext)", _dump_fulltext, True),
+    ("label_fulltext(stub)", _label_fulltext, False),
+    ("build_tei_body", _build_tei, True),
+]
+
+
+def new_state(alto_path, output_dir):
+    return {"alto_path": alto_path, "output_dir": output_dir}
+
+
+def run_all(alto_path, output_dir):
+    """跑完所有阶段，返回state，输出文件在output_dir中"""
+    state = new_state(alto_path, output_dir)
+    for _, func, _ in STAGES:
+        func(state)
+
+    with open(os.path.join(output_dir, "tei.xml"), "w") as w:
+        w.write(state["tei"])
+
+    return state
@@ -0,0 +1,100 @@
+"""
+分阶段的基准测试：每个阶段的耗时、tokens/sec和内存峰值(tracemalloc)
+
+python -m benchmarks.run_benchmarks --pages 200 --repeat 3
+python -m benchmarks.run_benchmarks --alto some.xml --json result.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import synthetic_alto
+from benchmarks.pipeline import STAGES, new_state
+
+
+def _run_stage(func, state, trace):
+    # calc_page_main_areas等会print，不计入结果
+    with contextlib.redirect_stdout(io.StringIO()):
+        if trace:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        func(state)
+        elapsed = time.perf_counter() - start
+
+        peak = 0
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def bench_document(alto_path, repeat=3):
+    """返回 (token数, [(阶段名, 最短耗时, 内存峰值)])"""
+    timings = {}
+    peaks = {}
+
+    with tempfile.TemporaryDirectory(prefix="grobid_bench_") as output_dir:
+        # 先跑repeat次只计时，再跑一次用tracemalloc统计内存，tracemalloc会明显拖慢速度
+        for i in range(repeat + 1):
+            trace = i == repeat
+            state = new_state(alto_path, output_dir)
+
+            for name, func, _ in STAGES:
+                elapsed, peak = _run_stage(func, state, trace)
+                if trace:
+                    peaks[name] = peak
+                else:
+                    timings[name] = min(timings.get(name, elapsed), elapsed)
+
+        token_count = state["doc"].token_count()
+
+    return token_count, [(name, timings[name], peaks[name]) for name, _, measured in STAGES if measured]
+
+
+def format_report(token_count, results):
+    lines = ["%-26s %10s %14s %12s" % ("stage", "seconds", "tokens/sec", "peak MiB")]
+    for name, elapsed, peak in results:
+        rate = token_count / elapsed if elapsed else float("inf")
+        lines.append("%-26s %10.4f %14.0f %12.2f" % (name, elapsed, rate, peak / 1024 ** 2))
+
+    lines.append("%-26s %10.4f   (%d tokens)" % ("total", sum(r[1] for r in results), token_count))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-stage throughput of the feature / TEI pipeline")
+    parser.add_argument("--alto", help="benchmark an existing ALTO file instead of a synthetic one")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results as json")
+    synthetic_alto.add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="grobid_bench_") as tmp_dir:
+        alto_path = args.alto
+        if not alto_path:
+            alto_path = synthetic_alto.write_alto(os.path.join(tmp_dir, "synthetic.xml"),
+                **synthetic_alto.doc_kwargs(args))
+
+        token_count, results = bench_document(alto_path, args.repeat)
+
+    print(format_report(token_count, results))
+
+    if args.json:
+        with open(args.json, "w") as w:
+            json.dump({
+                "tokens": token_count,
+                "stages": [{"stage": name, "seconds": elapsed, "tokens_per_sec": token_count / elapsed if elapsed else None,
+                    "peak_bytes": peak} for name, elapsed, peak in results],
+            }, w, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+代替wapiti的确定性分类器，只看每行的第一个特征(token)，用于基准测试和golden对比
+"""
+
+SEGMENT_LABELS = {"Table": "<header>", "Figure": "<header>"}
+FULLTEXT_LABELS = {"Section": "<section>", "3": "<section>", "(": "<citation_marker>",
+    "Table": "<table>", "Figure": "<figure>", "%": "<equation>"}
+
+
+def _label_rows(rows, label_map, default):
+    prev = None
+    for row in rows:
+        row = row.rstrip("\r\n")
+        if not row.strip():
+            continue
+
+        label = label_map.get(row.split(" ", 1)[0], default)
+        yield row + "\t" + ("I-" + label if label != prev else label) + "\n"
+        prev = label
+
+
+def label_segment(rows):
+    """返回wapiti格式的 "特征行\\t标签" 行"""
+    return list(_label_rows(rows, SEGMENT_LABELS, "<body>"))
+
+
+def label_fulltext(rows):
+    return list(_label_rows(rows, FULLTEXT_LABELS, "<paragraph>"))
+
+
+STUB_LABELERS = {
+    "segment": label_segment,
+    "fulltext": label_fulltext,
+}
@@ -0,0 +1,112 @@
+"""
+生成合成的ALTO文档，页数、block数、行数、每行token数和字体数都可以配置，同一个seed生成的文档完全一致
+
+python -m benchmarks.synthetic_alto out.xml --pages 50 --blocks 8 --lines 6 --tokens 10 --fonts 4
+"""
+import argparse
+import random
+
+from xml.sax.saxutils import quoteattr
+
+
+WORDS = ["The", "model", "is", "trained", "on", "2019", "data", ".", "We", "use", "a", "CRF", "(", "see", ")",
+    "Section", "3", ",", "results", "-", "john@example.com", "https://x.org", "January", "Table", "1", "of",
+    "NLP", "tasks", ":", "accuracy", "improves", "by", "12.5", "%", "Figure", "references", "In", "this",
+    "paper", "we", "R&D", "<x>"]
+
+FONT_STYLES = ["", "bold", "italics", "bold italics", "superscript"]
+
+PAGE_WIDTH = 595.276
+PAGE_HEIGHT = 841.890
+
+
+def iter_alto(pages=4, blocks=6, lines=5, tokens=8, fonts=4, seed=0):
+    """逐段生成ALTO文本，tokens为每行的最大token数"""
+    r = random.Random(seed)
+
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<alto xmlns="http://www.loc.gov/standards/alto/ns-v3#"><Description></Description><Styles>'
+    for f in range(fonts):
+        yield '<TextStyle ID="font%d" FONTFAMILY="f%d" FONTSIZE="%.3f" FONTTYPE="serif" ' \
+            'FONTWIDTH="proportional" FONTCOLOR="#000000" FONTSTYLE="%s"/>' % (
+                f, f, 8 + 2 * f + 0.5, FONT_STYLES[f % len(FONT_STYLES)])
+    yield '</Styles><Layout>'
+
+    string_id = 0
+    line_height = 12.0
+    for p in range(1, pages + 1):
+        yield '<Page ID="Page%d" PHYSICAL_IMG_NR="%d" WIDTH="%.3f" HEIGHT="%.3f"><PrintSpace>' % (
+            p, p, PAGE_WIDTH, PAGE_HEIGHT)
+
+        # 页眉和页码这样的小block
+        yield '<TextBlock ID="p%d_hd" HPOS="%.3f" VPOS="20.000" HEIGHT="8.000" WIDTH="30.000">' \
+            '<TextLine ID="p%d_hd_l" HPOS="%.3f" VPOS="20.000" HEIGHT="8.000" WIDTH="30.000">' \
+            '<String ID="p%d_hd_w" CONTENT="%d" HPOS="%.3f" VPOS="20.000" WIDTH="10.000" HEIGHT="8.000" STYLEREFS="font0"/>' \
+            '</TextLine></TextBlock>' % (p, PAGE_WIDTH / 2, p, PAGE_WIDTH / 2, p, p, PAGE_WIDTH / 2)
+
+        y = 60.0
+        column_height = (PAGE_HEIGHT - 120) / max(1, blocks)
+        for b in range(blocks):
+            bx = 72.0 + (p % 2) * 5
+            block_lines = r.randint(1, lines)
+            yield '<TextBlock ID="p%d_b%d" HPOS="%.3f" VPOS="%.3f" HEIGHT="%.3f" WIDTH="%.3f">' % (
+                p, b, bx, y, block_lines * line_height, 420.0)
+
+            for l in range(block_lines):
+                x = bx + (r.random() < 0.2) * 12
+                ly = y + l * line_height
+                yield '<TextLine ID="p%d_l%d_%d" HPOS="%.3f" VPOS="%.3f" HEIGHT="10.000" WIDTH="400.000">' % (
+                    p, b, l, x, ly)
+
+                n = r.randint(1, tokens)
+                for t in range(n):
+                    w = r.choice(WORDS)
+                    if t == n - 1 and r.random() < 0.1:
+                        w = "-"
+                    string_id += 1
+                    width = 5.0 * len(w)
+                    yield '<String ID="p%d_w%d" CONTENT=%s HPOS="%.3f" VPOS="%.3f" WIDTH="%.3f" HEIGHT="10.000" ' \
+                        'STYLEREFS="font%d"/>' % (p, string_id, quoteattr(w), x, ly, width, r.randrange(fonts))
+                    x += width + 3
+                    if t != n - 1:
+                        yield '<SP WIDTH="3.000" VPOS="%.3f" HPOS="%.3f"/>' % (ly, x - 3)
+
+                yield '</TextLine>'
+
+            yield '</TextBlock>'
+            y += max(column_height, block_lines * line_height + 10)
+
+        yield '</PrintSpace></Page>'
+
+    yield '</Layout></alto>\n'
+
+
+def write_alto(path, **kwargs):
+    with open(path, "w") as w:
+        for chunk in iter_alto(**kwargs):
+            w.write(chunk)
+
+    return path
+
+
+def add_arguments(parser):
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--blocks", type=int, default=6)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=8)
+    parser.add_argument("--fonts", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def doc_kwargs(args):
+    return dict(pages=args.pages, blocks=args.blocks, lines=args.lines, tokens=args.tokens,
+        fonts=args.fonts, seed=args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="generate a synthetic ALTO document")
+    parser.add_argument("output")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    write_alto(args.output, **doc_kwargs(args))
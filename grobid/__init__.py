@@ -1,6 +1,42 @@
-from grobid.classifier import classifier, set_model_path
-from grobid.feature_factory import FeatureFactory
-from grobid.tei_builder import build_tei_body
+from grobid.classifier import classifier, classify_rows, set_model_path, set_worker_pool_size, set_label_cache, set_label_backend, set_micro_batching
 
-from grobid.cmd_utils import alto_parser
-from grobid.alto_file import AltoFile
\ No newline at end of file
+# 其余的子模块在第一次访问时才导入，`import grobid` 不会加载numpy和词表
+_lazy_attrs = {
+    "FeatureFactory": "grobid.feature_factory",
+    "build_tei_body": "grobid.tei_builder",
+    "build_tei_json": "grobid.tei_builder",
+    "write_tei": "grobid.tei_builder",
+    "alto_parser": "grobid.cmd_utils",
+    "set_alto_cache": "grobid.cmd_utils",
+    "AltoFile": "grobid.alto_file",
+    "AltoDocument": "grobid.alto_document",
+    "parse_alto": "grobid.alto_document",
+    "process_corpus": "grobid.batch",
+    "aalto_parser": "grobid.aio",
+    "aclassifier": "grobid.aio",
+    "aclassify_rows": "grobid.aio",
+    "aprocess_pdf": "grobid.aio",
+    "add_sink": "grobid.instrument",
+    "remove_sink": "grobid.instrument",
+    "LogSink": "grobid.instrument",
+    "PrometheusExporter": "grobid.instrument",
+    "GrobidServer": "grobid.server",
+    "DirectorySink": "grobid.output_sink",
+    "ShardedSink": "grobid.output_sink",
+    "CorpusManifest": "grobid.manifest",
+}
+
+
+def __getattr__(name):
+    if name not in _lazy_attrs:
+        raise AttributeError("module 'grobid' has no attribute %r" % name)
+
+    import importlib
+
+    value = getattr(importlib.import_module(_lazy_attrs[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attrs))
@@ -0,0 +1,210 @@
+import asyncio
+import importlib
+import os
+import tempfile
+import weakref
+
+from grobid import cmd_utils
+from grobid.instrument import ainstrumented, document
+from grobid.labels import LabelSequence
+
+# 包里的grobid.classifier是classifier函数，这里需要模块本身来读取当前的模型、缓存和worker设置
+_classifier = importlib.import_module("grobid.classifier")
+
+# 同时运行的pdfalto / wapiti子进程数上限，见set_concurrency
+alto_concurrency = os.cpu_count() or 1
+label_concurrency = os.cpu_count() or 1
+
+# asyncio.Semaphore绑定在事件循环上，每个循环一份
+_semaphores = weakref.WeakKeyDictionary()
+
+# 写入wapiti stdin时每多少行等待一次drain
+FEED_CHUNK = 256
+
+
+def set_concurrency(alto=None, label=None):
+    """设置同时运行的pdfalto和wapiti子进程数，为None时不修改"""
+    global alto_concurrency, label_concurrency
+
+    if alto is not None:
+        alto_concurrency = alto
+    if label is not None:
+        label_concurrency = label
+
+    _semaphores.clear()
+    return True
+
+
+def _semaphore(name):
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = {
+            "alto": asyncio.Semaphore(alto_concurrency),
+            "label": asyncio.Semaphore(label_concurrency),
+        }
+
+    return _semaphores[loop][name]
+
+
+async def _kill(proc):
+    # 被取消或者出错时不留下子进程
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+async def _run(args):
+    proc = await asyncio.create_subprocess_exec(*args,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        return await proc.wait()
+    finally:
+        await _kill(proc)
+
+
+@ainstrumented("alto_parser", cmd_utils._pdf_bytes)
+async def aalto_parser(pdf_path, output_path, options=()):
+    """alto_parser的异步版本，返回pdfalto的退出码；缓存的读写放在线程中"""
+    alto_cache = cmd_utils.alto_cache
+    args = [cmd_utils.alto_path, *options, pdf_path, output_path]
+
+    if alto_cache is None:
+        async with _semaphore("alto"):
+            return await _run(args)
+
+    version = await asyncio.to_thread(cmd_utils.alto_version)
+    key = await asyncio.to_thread(alto_cache.key, pdf_path, cmd_utils.alto_path, version, *options)
+    if await asyncio.to_thread(alto_cache.get, key, output_path):
+        return 0
+
+    async with _semaphore("alto"):
+        ret = await _run(args)
+
+    if ret == 0 and os.path.exists(output_path):
+        await asyncio.to_thread(alto_cache.put, key, output_path)
+
+    return ret
+
+
+async def _feed_rows(stdin, rows):
+    try:
+        for i, row in enumerate(rows, 1):
+            stdin.write((row + "\n").encode("utf-8"))
+            if i % FEED_CHUNK == 0:
+                await stdin.drain()
+        await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        stdin.close()
+
+
+@ainstrumented("wapiti", cmd_utils._rows_count, lambda model_path, rows: {"model": os.path.basename(model_path)})
+async def awapiti_label_rows(model_path, rows):
+    """wapiti_label_rows的异步版本，写入stdin和读取stdout在同一个事件循环中交替进行"""
+    async with _semaphore("label"):
+        proc = await asyncio.create_subprocess_exec(cmd_utils.wapiti_path, "label", "-m", model_path,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        feeder = asyncio.ensure_future(_feed_rows(proc.stdin, rows))
+
+        try:
+            lines = [l.decode("utf-8") async for l in proc.stdout]
+            await feeder
+            await proc.wait()
+        finally:
+            feeder.cancel()
+            await _kill(proc)
+
+    return LabelSequence.from_lines(lines)
+
+
+def _cache_lookup(label_cache, model_path, rows):
+    key = label_cache.key(model_path, rows)
+    return key, label_cache.get(key)
+
+
+@ainstrumented("classifier", lambda labels, *args: {"rows": len(labels)}, lambda model_type, rows: {"model": model_type})
+async def aclassify_rows(model_type, rows):
+    """classify_rows的异步版本，同样使用分类结果缓存和常驻worker"""
+    if model_type not in _classifier.wapiti_model_map:
+        return LabelSequence.from_labels([])
+
+    model_path = _classifier.wapiti_model_map[model_type]
+    rows = list(rows)
+
+    label_cache = _classifier.label_cache
+    key = None
+    if label_cache is not None:
+        # key要hash所有的特征行(第一次还要hash整个模型文件)，不能在事件循环中计算
+        key, labels = await asyncio.to_thread(_cache_lookup, label_cache, model_path, rows)
+        if labels is not None:
+            return labels
+
+    if _classifier.label_backend == "crf" or _classifier.micro_batching is not None:
+        # 进程内解码是纯计算、合并分类需要阻塞等待批次，都放在线程中不阻塞事件循环
+        labels = await asyncio.to_thread(_classifier._label_rows, model_type, rows)
+    elif _classifier.worker_pool_size > 0:
+        # 常驻worker本身就限制了并发，这里只是不阻塞事件循环
+        pool = _classifier._get_worker_pool(model_type)
+        labels = LabelSequence.from_lines(await asyncio.to_thread(pool.label_lines, rows))
+    else:
+        labels = await awapiti_label_rows(model_path, rows)
+
+    # wapiti异常退出时结果不完整，不缓存
+    if key is not None and len(labels) == sum(1 for r in rows if r.strip()):
+        await asyncio.to_thread(label_cache.put, key, labels)
+
+    return labels
+
+
+async def aclassifier(model_type, feature_path):
+    """classifier的异步版本，返回 "特征行\\t标签" 行"""
+    with open(feature_path) as f:
+        rows = [l.rstrip("\r\n") for l in f]
+
+    labels = await aclassify_rows(model_type, rows)
+    return list(labels.result_lines(r for r in rows if r.strip()))
+
+
+@ainstrumented("process_pdf", labels=lambda pdf_path, *args, **kwargs: {"doc": pdf_path})
+async def aprocess_pdf(pdf_path, output_dir=None, executor=None, low_memory=False, output_format="tei"):
+    """
+    把一个PDF(或已经转换好的ALTO文件)转换成TEI
+    pdfalto和wapiti是异步子进程；特征抽取和TEI生成是纯python计算，在executor中执行(默认为事件循环的线程池，
+    也可以传入ProcessPoolExecutor)
+    output_dir不为空时返回写入的TEI文件路径，否则返回TEI内容
+    low_memory为True时特征抽取逐页读取ALTO文件，不在内存中保留整个文档
+    output_format为 "json" 时返回build_tei_json的结果(写入文件时为.json文件的路径)
+    """
+    from grobid import batch
+
+    loop = asyncio.get_running_loop()
+
+    with document(pdf_path), tempfile.TemporaryDirectory(prefix="grobid_alto_") as alto_dir:
+        job = {"idx": 0, "path": pdf_path, "alto_dir": alto_dir, "output_dir": output_dir, "low_memory": low_memory,
+            "output_format": output_format}
+
+        if pdf_path.lower().endswith(".pdf"):
+            name = os.path.splitext(os.path.basename(pdf_path))[0]
+            alto_path = os.path.join(alto_dir, name + ".xml")
+
+            ret = await aalto_parser(pdf_path, alto_path)
+            if ret != 0:
+                raise RuntimeError("pdfalto exited with %d on %s" % (ret, pdf_path))
+        else:
+            alto_path = pdf_path
+
+        job["alto_path"] = alto_path
+
+        job = await loop.run_in_executor(executor, batch.build_segment_rows, job)
+        job["segment_labels"] = await aclassify_rows("segment", job["segment_rows"])
+
+        job = await loop.run_in_executor(executor, batch.build_fulltext_rows, job)
+        job["fulltext_labels"] = await aclassify_rows("fulltext", job["fulltext_rows"])
+
+        job = await loop.run_in_executor(executor, batch.build_tei, job)
+
+    return job["tei"]
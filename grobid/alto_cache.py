@@ -0,0 +1,33 @@
+import hashlib
+import shutil
+
+from grobid.file_cache import FileCache, file_digest
+
+
+class AltoCache(FileCache):
+    """
+    按PDF内容寻址的pdfalto输出缓存
+
+    key = sha256(PDF内容 + pdfalto版本 + 参数)，条目为pdfalto输出的ALTO文件
+    """
+    suffix = ".xml"
+
+    def key(self, pdf_path, *parts):
+        h = hashlib.sha256(file_digest(pdf_path).encode())
+        for part in parts:
+            h.update(b"\0" + str(part).encode())
+        return h.hexdigest()
+
+    def get(self, key, output_path):
+        """命中时把缓存的ALTO拷贝到output_path并返回True"""
+        f = self.open_entry(key)
+        if f is None:
+            return False
+
+        with f, open(output_path, "wb") as w:
+            shutil.copyfileobj(f, w)
+        return True
+
+    def put(self, key, alto_path):
+        with open(alto_path, "rb") as f:
+            self.write_entry(key, lambda w: shutil.copyfileobj(f, w))
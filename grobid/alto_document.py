@@ -0,0 +1,297 @@
+import io
+import mmap
+import re
+
+from collections import deque, namedtuple
+from xml.etree.ElementTree import iterparse
+
+from grobid.feature_utils import build_font_feature_map
+from grobid.instrument import instrumented
+
+
+def _local_name(tag):
+    """去掉ALTO的namespace前缀，"{ns}String" -> "String" """
+    return tag.rpartition("}")[2]
+
+
+class AltoToken:
+    __slots__ = ("idx", "id", "content", "hpos", "vpos", "width", "height", "style", "line")
+
+    def __init__(self, attrs, line, idx):
+        # idx为token在文档中的顺序，和TokenTable中的下标一致
+        self.idx = idx
+        self.id = attrs.get("ID", "")
+        self.content = attrs.get("CONTENT", "")
+        self.hpos = float(attrs["HPOS"])
+        self.vpos = float(attrs["VPOS"])
+        self.width = float(attrs["WIDTH"])
+        self.height = float(attrs["HEIGHT"])
+        self.style = attrs.get("STYLEREFS", "")
+        self.line = line
+
+
+class AltoLine:
+    __slots__ = ("id", "hpos", "vpos", "width", "height", "tokens", "block")
+
+    def __init__(self, attrs, block):
+        self.id = attrs["ID"]
+        self.hpos = float(attrs["HPOS"])
+        self.vpos = float(attrs["VPOS"])
+        self.width = float(attrs["WIDTH"])
+        self.height = float(attrs["HEIGHT"])
+        self.tokens = []
+        self.block = block
+
+    def rect(self):
+        return (self.hpos, self.vpos, self.hpos + self.width, self.vpos + self.height)
+
+
+class AltoBlock:
+    __slots__ = ("id", "hpos", "vpos", "width", "height", "lines", "page")
+
+    def __init__(self, attrs, page):
+        self.id = attrs["ID"]
+        self.hpos = float(attrs["HPOS"])
+        self.vpos = float(attrs["VPOS"])
+        self.width = float(attrs["WIDTH"])
+        self.height = float(attrs["HEIGHT"])
+        self.lines = []
+        self.page = page
+
+    def rect(self):
+        return (self.hpos, self.vpos, self.hpos + self.width, self.vpos + self.height)
+
+    def token_count(self):
+        return sum(len(line.tokens) for line in self.lines)
+
+
+class AltoPage:
+    __slots__ = ("idx", "id", "number", "width", "height", "blocks")
+
+    def __init__(self, attrs, idx):
+        # idx为页在文档中的下标(从0开始)，number为PHYSICAL_IMG_NR
+        self.idx = idx
+        self.id = attrs.get("ID", "")
+        self.number = int(attrs.get("PHYSICAL_IMG_NR", 0))
+        self.width = float(attrs["WIDTH"])
+        self.height = float(attrs["HEIGHT"])
+        self.blocks = []
+
+    def token_count(self):
+        return sum(block.token_count() for block in self.blocks)
+
+
+class AltoDocument:
+    """
+    pdfalto输出的ALTO文件的内存模型，只解析一次，AltoFile和FeatureFactory共享
+
+    AltoDocument -> pages -> blocks -> lines -> tokens，
+    每一层都保留了指向上一层的引用(token.line.block.page)
+    lines为TextLine的ID -> AltoLine，只有parse_alto解析的整个文档才有
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.fonts = {}
+        self.pages = []
+        self.lines = {}
+
+    def iter_blocks(self):
+        for page in self.pages:
+            yield from page.blocks
+
+    def iter_lines(self):
+        for block in self.iter_blocks():
+            yield from block.lines
+
+    def iter_tokens(self):
+        for line in self.iter_lines():
+            yield from line.tokens
+
+    def token_count(self):
+        return sum(page.token_count() for page in self.pages)
+
+
+# blocks为每个TextBlock的 (页码, left, top, width, height)
+AltoPrescan = namedtuple("AltoPrescan", ["page_count", "token_count", "page_token_counts", "blocks",
+    "page_block_counts", "block_token_counts"])
+
+_PAGE_TAG = re.compile(rb"<(?:\w+:)?Page\b([^>]*)>")
+_BLOCK_TAG = re.compile(rb"<(?:\w+:)?TextBlock\b([^>]*)>")
+_STRING_TAG = re.compile(rb"<(?:\w+:)?String\b")
+_PAGE_END_TAG = re.compile(rb"</(?:\w+:)?Page\s*>")
+_ATTR = re.compile(rb'(\w+)="([^"]*)"')
+
+
+def prescan_alto(alto_path):
+    """
+    不构造xml树，直接在mmap的文件内容上用正则统计页数、token数和TextBlock的位置
+    流式处理时用来提前得到文档级别的信息(token总数、正文区域)
+    """
+    page_token_counts = []
+    page_block_counts = []
+    blocks = []
+    block_token_counts = []
+
+    with open(alto_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+        page_starts = [(m.start(), dict(_ATTR.findall(m.group(1)))) for m in _PAGE_TAG.finditer(content)]
+        page_ends = [start for start, _ in page_starts[1:]] + [len(content)]
+
+        for (start, page_attrs), end in zip(page_starts, page_ends):
+            page_number = int(page_attrs.get(b"PHYSICAL_IMG_NR", 0))
+            page_token_counts.append(sum(1 for _ in _STRING_TAG.finditer(content, start, end)))
+
+            block_starts = list(_BLOCK_TAG.finditer(content, start, end))
+            block_ends = [m.start() for m in block_starts[1:]] + [end]
+            page_block_counts.append(len(block_starts))
+
+            for m, block_end in zip(block_starts, block_ends):
+                attrs = dict(_ATTR.findall(m.group(1)))
+                blocks.append((page_number, float(attrs[b"HPOS"]), float(attrs[b"VPOS"]),
+                    float(attrs[b"WIDTH"]), float(attrs[b"HEIGHT"])))
+                block_token_counts.append(sum(1 for _ in _STRING_TAG.finditer(content, m.end(), block_end)))
+
+    return AltoPrescan(len(page_token_counts), sum(page_token_counts), page_token_counts, blocks,
+        page_block_counts, block_token_counts)
+
+
+def iter_alto_pages(alto_path, doc=None, pages=None, index_lines=False, first_page=0, first_token=0):
+    """
+    用iterparse逐页解析ALTO，每解析完一页就yield一个AltoPage，之后的页还没有读取
+
+    doc不为空时，字体信息写入doc.fonts(ALTO中Styles在Layout之前，第一页yield之前就已经可用)
+    pages为需要的页的下标(从0开始)，如range(0, 3)；其余的页不构造对象，读完最后一页需要的页后停止解析
+    index_lines为True时同时把行登记到doc.lines；流式处理时不登记，只保留当前页
+    alto_path也可以是文件对象；first_page / first_token为其中第一页、第一个token在整个文档中的下标
+    """
+    line_index = doc.lines if doc is not None and index_lines else None
+    styles = []
+    last_page = max(pages) if pages else None
+
+    page_idx = first_page - 1
+    page = None
+    block = None
+    line = None
+    # 跳过的页不构造对象，但是要照常计数，保证AltoToken.idx是文档内的下标
+    in_page = in_print_space = in_block = in_line = False
+    token_idx = first_token
+
+    for event, elem in iterparse(alto_path, events=("start", "end")):
+        name = _local_name(elem.tag)
+
+        if event == "start":
+            if name == "String":
+                if in_line:
+                    if line is not None:
+                        line.tokens.append(AltoToken(elem.attrib, line, token_idx))
+                    token_idx += 1
+            elif name == "TextLine":
+                in_line = in_block
+                if block is not None:
+                    line = AltoLine(elem.attrib, block)
+                    block.lines.append(line)
+                    if line_index is not None:
+                        line_index[line.id] = line
+            elif name == "TextBlock":
+                in_block = in_print_space
+                if in_print_space and page is not None:
+                    block = AltoBlock(elem.attrib, page)
+                    page.blocks.append(block)
+            elif name == "PrintSpace":
+                in_print_space = in_page
+            elif name == "Page":
+                in_page = True
+                page_idx += 1
+                if pages is None or page_idx in pages:
+                    page = AltoPage(elem.attrib, page_idx)
+            elif name == "Layout":
+                if doc is not None:
+                    doc.fonts = build_font_feature_map(styles)
+            elif name == "TextStyle":
+                styles.append(elem.attrib)
+            continue
+
+        if name == "TextLine":
+            line = None
+            in_line = False
+        elif name == "TextBlock":
+            block = None
+            in_block = False
+        elif name == "PrintSpace":
+            in_print_space = False
+        elif name == "Page":
+            in_page = False
+            # 已经转成了AltoPage，释放element
+            elem.clear()
+
+            if page is not None:
+                yield page
+                page = None
+
+            if last_page is not None and page_idx >= last_page:
+                break
+
+    if doc is not None and not doc.fonts:
+        doc.fonts = build_font_feature_map(styles)
+
+
+def iter_alto_page_range(alto_path, start, stop, doc=None, first_token=0):
+    """
+    只解析第start到stop页(不含stop)：把Page之前的部分(Styles等)、这几页和最后一页之后的闭合标签拼成一个小的ALTO，
+    不需要从头解析前面的页；first_token为第start页第一个token在文档中的下标
+    """
+    with open(alto_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+        page_starts = [m.start() for m in _PAGE_TAG.finditer(content)]
+        stop = min(stop, len(page_starts))
+        if start >= stop:
+            return iter(())
+
+        doc_end = _PAGE_END_TAG.search(content, page_starts[-1]).end()
+        end = page_starts[stop] if stop < len(page_starts) else doc_end
+        ranges = [(0, page_starts[0]), (page_starts[start], end), (doc_end, len(content))]
+
+    return iter_alto_pages(_RangeReader(alto_path, ranges), doc, first_page=start, first_token=first_token)
+
+
+class _RangeReader(io.RawIOBase):
+    """依次读取文件中的几段字节，iterparse每次只读一小块，不把这几页的内容整个复制到内存中"""
+    def __init__(self, path, ranges):
+        self._file = open(path, "rb")
+        self._ranges = deque(ranges)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._ranges:
+            start, end = self._ranges[0]
+            if start < end:
+                self._file.seek(start)
+                size = self._file.readinto(memoryview(buffer)[:end - start])
+                if size:
+                    self._ranges[0] = (start + size, end)
+                    return size
+
+            self._ranges.popleft()
+
+        # iterparse不会关闭传入的文件对象，读完时关闭
+        self._file.close()
+        return 0
+
+    def close(self):
+        # 提前停止解析时，对象被回收时关闭
+        self._file.close()
+        super().close()
+
+
+def _document_counts(doc, alto_path):
+    return {"pages": len(doc.pages), "blocks": sum(len(p.blocks) for p in doc.pages),
+        "lines": sum(1 for _ in doc.iter_lines()), "tokens": doc.token_count()}
+
+
+@instrumented("parse_alto", _document_counts)
+def parse_alto(alto_path):
+    """用iterparse解析整个ALTO，字体、页、块、行、token只解析一次"""
+    doc = AltoDocument(alto_path)
+    doc.pages = list(iter_alto_pages(alto_path, doc, index_lines=True))
+
+    return doc
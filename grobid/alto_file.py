@@ -1,147 +1,152 @@
-from bs4 import BeautifulSoup
 from collections import Counter
 
+from grobid.alto_document import parse_alto, iter_alto_pages
+
 
 def get_counter_max(counter):
     items = counter.items()
     return max(items, key=lambda x:x[1])
 
 
+def page_tokens_in_zones(page, zones):
+    """
+    tokens_in_zones的单页版本，流式处理时使用：page为AltoPage，zones的格式和tokens_in_zones相同
+    返回该页token是否落在zones内的bool数组，下标为页内的顺序；没有zone时返回None
+    """
+    page_zones = zones.get(page.idx + 1) if isinstance(zones, dict) else zones
+    if not page_zones:
+        return None
+
+    from grobid.spatial_index import GridIndex, as_rect_array
+    from grobid.token_table import TokenTable
+
+    table = TokenTable.from_pages([page], first_page_id=page.idx + 1)
+    return GridIndex(table.bbox).intersects_any(as_rect_array(page_zones))
+
+
 class AltoFile:
-    def __init__(self, alto_path):
+    def __init__(self, alto_path, alto_doc=None):
+        """alto_doc为已经解析好的AltoDocument，为空时按需解析alto_path"""
         self.alto_path = alto_path
         self.pdf_data = None
+        self._alto_doc = alto_doc
         self._page_sizes = []
         self._line_rects = {}
+        self._spatial_indexes = {}
 
-    def _get_raw_from_alto(self):
-        self.line_ids = []
-
-        with open(self.alto_path, "rb") as f:
-            content = f.read()
-            root = BeautifulSoup(content, "xml")
-
-        all_pages = root.find_all("PrintSpace")
-        self.pdf_data = []
-
-        for i, page in enumerate(all_pages, start=1):
-            # page_data = defaultdict(list)
-            page_data = [('words', 'bbox', 'block_ids', 'line_ids', 'page_id', 'labels')]
-            for token in root.find_all("String"):
-                top_left = (float(token.attrs["HPOS"]), float(token.attrs["VPOS"]))
-                height = float(token.attrs["HEIGHT"])
-                width = float(token.attrs["WIDTH"])
-                bottom_right = (top_left[0] + height, top_left[1] + width)
+    @property
+    def alto_doc(self):
+        if self._alto_doc is None:
+            self._alto_doc = parse_alto(self.alto_path)
 
-                words = token.attrs["CONTENT"]
-                bbox = (top_left[0], top_left[1], bottom_right[0], bottom_right[1])
-                line_id = token.parent.attrs["ID"]
-                block_id = token.parent.parent.attrs["ID"]
-                page_id = i
-                label = None
+        return self._alto_doc
 
-                page_data.append((words, bbox, block_id, line_id, page_id, label))
+    def _get_raw_from_alto(self):
+        # numpy相关的模块在第一次用到时才导入，只做特征抽取时不需要加载
+        from grobid.token_table import TokenTable
 
-            self.pdf_data.append(page_data)
-            self._page_sizes.append((float(page.parent.attrs["WIDTH"]), float(page.parent.attrs["HEIGHT"])))
+        # 所有页共用一张按列存储的token表，每页只是其中的一段
+        self.pdf_data = TokenTable.from_document(self.alto_doc)
+        self._page_sizes = self.pdf_data.page_sizes
 
         return True
 
     def json(self):
-        if not self.pdf_data:
+        if self.pdf_data is None:
             self._get_raw_from_alto()
 
-        json_data = []
-        for page_data in self.pdf_data:
-            keys = page_data[0]
-            page_json = {k:[] for k in keys}
-            for token in page_data[1:]:
-                for k, v in zip(keys, token):
-                    page_json[k].append(v)
-
-            json_data.append(page_json)
-
-        return json_data
+        return list(self.pdf_data.pages())
 
     def page_sizes(self):
+        if self.pdf_data is None:
+            self._get_raw_from_alto()
+
         return self._page_sizes
 
-    def get_line_zones(self):
-        with open(self.alto_path, "rb") as f:
-            content = f.read()
-            root = BeautifulSoup(content, "xml")
+    def spatial_index(self, page_idx):
+        """第page_idx页(从0开始)的token和行的网格索引，每页只建一次"""
+        if page_idx not in self._spatial_indexes:
+            from grobid.spatial_index import PageSpatialIndex
 
-        for line in root.find_all("TextLine"):
-            line_id = line.attrs["ID"]
-            top_left = float(line.attrs["HPOS"]), float(line.attrs["VPOS"])
-            bottom_right = top_left[0] + float(line.attrs["WIDTH"]), top_left[1] + float(line.attrs["HEIGHT"])
+            if self.pdf_data is None:
+                self._get_raw_from_alto()
 
-            self._line_rects[line_id] = (top_left[0], top_left[1], bottom_right[0], bottom_right[1])
+            tokens = self.pdf_data.page_slice(page_idx)
+            lines = self.pdf_data.line_slice(page_idx)
+            self._spatial_indexes[page_idx] = PageSpatialIndex(
+                self.pdf_data.bbox[tokens], self.pdf_data.line_bbox[lines], tokens.start, lines.start)
 
-        return self._line_rects
+        return self._spatial_indexes[page_idx]
 
-    def calc_page_main_areas(self):
-        with open(self.alto_path, "rb") as f:
-            content = f.read()
-            root = BeautifulSoup(content, "xml")
-
-        blocks = root.find_all("TextBlock")
-
-        left_even = set()
-        right_even = set()
-        left_odd = set()
-        right_odd = set()
-        top_set = set()
-        bottom_set = set()
-
-        for block in blocks:
-            top = float(block.attrs["VPOS"])
-            left = float(block.attrs["HPOS"])
-            width = float(block.attrs["WIDTH"])
-            height = float(block.attrs["HEIGHT"])
-
-            # small blocks can indicate that it's page numbers, some journal header info, etc. No need in them
-            if left == 0 or height < 20 or width < 20 or height * width < 3000:
-                continue
+    def tokens_in_zones(self, zones):
+        """
+        返回所有token是否落在zones(和zone相交)内的bool数组，下标和AltoToken.idx一致
+        zones为rect列表时作用于每一页，也可以是 {页码(从1开始): rect列表}
+        """
+        import numpy as np
+        from grobid.spatial_index import as_rect_array
 
-            # 奇偶分开计数
-            if int(block.parent.parent.attrs["PHYSICAL_IMG_NR"]) % 2 == 0:
-                left_even.add(int(left))
-                right_even.add(int(left + width))
-            else:
-                left_odd.add(int(left))
-                right_odd.add(int(left + width))
+        if self.pdf_data is None:
+            self._get_raw_from_alto()
 
-            top_set.add(int(top))
-            bottom_set.add(int(top + height))
+        mask = np.zeros(len(self.pdf_data), dtype=bool)
 
-        page_size = len(root.find_all("Page"))
+        for page_idx in range(self.pdf_data.page_count()):
+            page_zones = zones.get(page_idx + 1) if isinstance(zones, dict) else zones
+            if not page_zones:
+                continue
 
-        page_areas = []
+            page_mask = self.spatial_index(page_idx).tokens_in_zones(as_rect_array(page_zones))
+            mask[self.pdf_data.page_slice(page_idx)] = page_mask
 
-        if left_even and left_odd:
-            page_even_x = 0
-            page_even_width = 0
-            if page_size > 1:
-                page_even_x = min(left_even)
-                page_even_width = max(right_even) - page_even_x + 1
+        return mask
 
-            page_odd_x = min(left_odd)
-            page_odd_width = max(right_odd) - page_odd_x + 1
+    def get_line_zones(self):
+        for line in self.alto_doc.iter_lines():
+            self._line_rects[line.id] = line.rect()
 
-            page_y = min(top_set)
-            page_height = max(bottom_set) - page_y + 1
+        return self._line_rects
 
-            page_areas.append((page_odd_x, page_y, page_odd_width, page_height))
-            page_areas.append((page_even_x, page_y, page_even_width, page_height))
+    def _block_geometry(self):
+        return ((block.page.number, block.hpos, block.vpos, block.width, block.height)
+            for block in self.alto_doc.iter_blocks())
 
-        print(page_areas)
-        page_rect = (page_areas[0][0], page_areas[0][1], \
-            page_areas[0][0] + page_areas[0][2], page_areas[0][1] + page_areas[0][3])
+    def page_main_areas(self):
+        """奇数页和偶数页各自的正文区域，MainAreas(odd, even)"""
+        from grobid.geometry import calc_main_areas
 
-        return page_rect
+        return calc_main_areas(self._block_geometry(), len(self.alto_doc.pages))
 
-if __name__ == '__main__':
-    alto_path = "/Users/hyy/mytask/b_paper/backend/stuff/2022.acl-long.148.2.xml"
-    alto_file = AltoFile(alto_path)
-    print(alto_file.calc_page_main_areas())
\ No newline at end of file
+    def calc_page_main_areas(self):
+        return self.page_main_areas().odd
+
+    def iter_pages(self, pages=None):
+        """
+        逐页生成和json()中每一页相同格式的token列，pages为需要的页的下标(从0开始)，如range(0, 3)
+        文档还没有解析时边读边生成，读完需要的最后一页就停止
+        """
+        from grobid.token_table import TokenTable
+
+        if self.pdf_data is not None:
+            for page_idx in range(self.pdf_data.page_count()):
+                if pages is None or page_idx in pages:
+                    yield self.pdf_data.page(page_idx)
+            return
+
+        if self._alto_doc is not None:
+            page_iter = (page for page in self._alto_doc.pages if pages is None or page.idx in pages)
+        else:
+            page_iter = iter_alto_pages(self.alto_path, pages=pages)
+
+        for page in page_iter:
+            yield TokenTable.from_pages([page], first_page_id=page.idx + 1).page(0)
+
+
+def calc_main_area(blocks, page_size):
+    """
+    blocks为 (页码, left, top, width, height)，page_size为文档的页数
+    返回奇数页的正文区域 (x0, y0, x1, y1)，所有页都使用这个区域；没有足够的正文block时为None
+    """
+    from grobid.geometry import calc_main_areas
+
+    return calc_main_areas(blocks, page_size).odd
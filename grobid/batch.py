@@ -0,0 +1,481 @@
+import contextlib
+import json
+import os
+import tempfile
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from grobid.classifier import classify_rows
+from grobid.cmd_utils import alto_parser
+from grobid.feature_factory import FeatureFactory
+from grobid.file_cache import file_digest
+from grobid.manifest import load_checkpoint, save_checkpoint
+from grobid.output_sink import OutputRecord
+from grobid.tei_builder import build_tei_body, build_tei_json
+
+
+CorpusResult = namedtuple("CorpusResult", ["path", "tei", "error"])
+
+# (阶段名, 执行器类型)，阶段的执行函数见 STAGE_FUNCS
+# pdfalto和wapiti都是子进程，线程就够了；特征抽取和TEI是纯python计算，放到进程池
+PIPELINE_STAGES = [
+    ("alto", "thread"),
+    ("segment_features", "process"),
+    ("segment_labels", "thread"),
+    ("fulltext_features", "process"),
+    ("fulltext_labels", "thread"),
+    ("tei", "process"),
+]
+
+# 需要读取ALTO文件的阶段，从检查点恢复时ALTO文件必须还在
+ALTO_STAGES = ("segment_features", "fulltext_features")
+
+
+def _doc_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _sink_key(path, digest):
+    """sink中的记录名：文件名加上内容的sha256前16位，不同目录下的同名文件不会互相覆盖"""
+    return "%s-%s" % (_doc_name(path), digest[:16])
+
+
+def run_alto(job):
+    pdf_path = job["path"]
+    if job.get("need_key") and "doc_key" not in job:
+        # 输出写入sink或output_dir时用内容的sha256区分同名的文件，在线程中计算，不阻塞主线程
+        job["doc_key"] = file_digest(pdf_path)
+
+    if not pdf_path.lower().endswith(".pdf"):
+        # 已经是ALTO文件
+        job["alto_path"] = pdf_path
+        return job
+
+    # 有清单时ALTO文件在多次运行之间保留，用文档的sha256命名
+    alto_path = os.path.join(job["alto_dir"], "%s.%s.xml" % (job.get("doc_key", job["idx"]), _doc_name(pdf_path)))
+
+    ret = alto_parser(pdf_path, alto_path)
+    if ret != 0:
+        raise RuntimeError("pdfalto exited with %d on %s" % (ret, pdf_path))
+
+    job["alto_path"] = alto_path
+    return job
+
+
+def build_segment_rows(job):
+    ff = FeatureFactory(job["alto_path"], low_memory=job.get("low_memory", False))
+    ff.prepare()
+    ff.build_segment_feature(dump=False)
+
+    job["segment_rows"] = list(ff.iter_feature_rows("segment"))
+    job["segment_line_ids"] = ff.segment_line_ids
+    job["segment_line_blocks"] = ff.segment_line_blocks
+    return job
+
+
+def _classify(model_type, rows):
+    """wapiti异常退出时标签不完整，在分类阶段就失败，不把不完整的结果交给(或保存到检查点给)下一个阶段"""
+    labels = classify_rows(model_type, rows)
+    row_count = sum(1 for r in rows if r.strip())
+    if len(labels) != row_count:
+        raise ValueError("got %d labels for %d rows" % (len(labels), row_count))
+
+    return labels
+
+
+def label_segment(job):
+    job["segment_labels"] = _classify("segment", job["segment_rows"])
+    return job
+
+
+def build_fulltext_rows(job):
+    ff = FeatureFactory(job["alto_path"], low_memory=job.get("low_memory", False))
+    ff.prepare()
+    ff.build_fulltext_feature(job.pop("segment_labels"), dump=False, line_ids=job.pop("segment_line_ids", None),
+                              line_blocks=job.pop("segment_line_blocks", None))
+
+    del job["segment_rows"]
+    job["fulltext_rows"] = list(ff.iter_feature_rows("fulltext"))
+    return job
+
+
+def label_fulltext(job):
+    job["fulltext_labels"] = _classify("fulltext", job["fulltext_rows"])
+    return job
+
+
+def build_tei(job):
+    """job["output_format"]为 "json" 时生成build_tei_json的结果，否则为TEI xml"""
+    fulltext_rows = job.pop("fulltext_rows")
+    fulltext_labels = job.pop("fulltext_labels")
+    fulltext_result = list(fulltext_labels.result_lines(fulltext_rows))
+
+    as_json = job.get("output_format") == "json"
+    tei = build_tei_json(fulltext_result) if as_json else build_tei_body(fulltext_result)
+
+    if job.get("output_dir"):
+        # 批量处理时文件名带上内容的sha256，不同目录下的同名文件不会互相覆盖
+        name = _sink_key(job["path"], job["doc_key"]) if "doc_key" in job else _doc_name(job["path"])
+        tei_path = os.path.join(job["output_dir"], name + (".json" if as_json else ".tei.xml"))
+        with open(tei_path, "w+") as w:
+            if as_json:
+                json.dump(tei, w, ensure_ascii=False)
+            else:
+                w.write(tei)
+        tei = tei_path
+
+    job["tei"] = tei
+    return job
+
+
+STAGE_FUNCS = {
+    "alto": run_alto,
+    "segment_features": build_segment_rows,
+    "segment_labels": label_segment,
+    "fulltext_features": build_fulltext_rows,
+    "fulltext_labels": label_fulltext,
+    "tei": build_tei,
+}
+
+
+class CheckpointedStage:
+    """
+    阶段函数执行完之后把job保存成检查点，路径记录在job["checkpoint"]中；job中没有checkpoint_dir时和原函数相同
+    job中有resume_from时，先从这个检查点恢复之前的阶段的结果
+    alto阶段不保存检查点，它的输出就是ALTO文件
+    """
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+    def __call__(self, job):
+        resume_from = job.pop("resume_from", None)
+        if resume_from is not None:
+            state = load_checkpoint(resume_from)
+            # 下标、输出目录等以本次运行为准
+            state.update(job)
+            job = state
+
+        job.pop("checkpoint", None)
+        job = self.func(job)
+
+        if job.get("checkpoint_dir") and self.name != "alto":
+            job["checkpoint"] = save_checkpoint(os.path.join(job["checkpoint_dir"], self.name + ".pkl.gz"), job)
+
+        return job
+
+
+def _resume_point(stages):
+    """
+    stages为CorpusManifest.stages()的结果，返回 (下一个要执行的阶段的下标, 检查点, ALTO文件路径)
+    从后往前找最后一个完成、检查点还在的阶段；之后还有需要读取ALTO的阶段时，ALTO文件也必须还在
+
+    最后一个阶段完成、但输出没有记录下来时(如sink还没有fsync就被终止)，从前一个阶段的检查点重新执行最后一个阶段，
+    返回的下标总是小于阶段数
+    """
+    names = [name for name, _ in PIPELINE_STAGES]
+
+    status, alto_path, _ = stages.get("alto", (None, None, None))
+    if status != "done" or not alto_path or not os.path.exists(alto_path):
+        alto_path = None
+
+    for stage_idx in range(len(names) - 2, 0, -1):
+        status, checkpoint, _ = stages.get(names[stage_idx], (None, None, None))
+        if status != "done" or not checkpoint or not os.path.exists(checkpoint):
+            continue
+        if alto_path is None and any(name in ALTO_STAGES for name in names[stage_idx + 1:]):
+            continue
+
+        return stage_idx + 1, checkpoint, alto_path
+
+    return (1, None, alto_path) if alto_path else (0, None, None)
+
+
+def _resume_job(manifest, path, digest):
+    """按清单决定文档从哪个阶段开始，已经完成的文档start_stage为阶段数，finished为之前的输出"""
+    manifest.register(digest, path)
+    job = {"doc_key": digest, "checkpoint_dir": manifest.checkpoint_dir(digest)}
+
+    output = manifest.output(digest)
+    if output is not None and _output_exists(output):
+        job["start_stage"] = len(PIPELINE_STAGES)
+        job["finished"] = output
+        return job
+
+    job["start_stage"], checkpoint, alto_path = _resume_point(manifest.stages(digest))
+    if checkpoint is not None:
+        job["resume_from"] = checkpoint
+    if alto_path is not None:
+        job["alto_path"] = alto_path
+
+    return job
+
+
+def _output_exists(output):
+    if "record" in output:
+        record = OutputRecord(*output["record"])
+        return os.path.exists(record.path) and os.path.getsize(record.path) >= record.offset + record.length
+
+    return os.path.exists(output.get("checkpoint") or output["path"])
+
+
+def _restore_output(output):
+    """清单中记录的最终输出还原成CorpusResult.tei"""
+    if "record" in output:
+        return OutputRecord(*output["record"])
+    if "checkpoint" in output:
+        return load_checkpoint(output["checkpoint"])["tei"]
+
+    return output["path"]
+
+
+def _duplicate_result(path, output, error):
+    """和本次运行中之前的文件内容相同，结果为那个文件的输出"""
+    return CorpusResult(path, None if error is not None else _restore_output(output), error)
+
+
+def _noop():
+    return None
+
+
+class Pipeline:
+    """
+    多阶段流水线：每个阶段有自己的执行器和并发上限，不同文档的不同阶段可以同时进行
+
+    stages: [(name, func, executor, concurrency)]
+    max_in_flight: 同时在流水线中(包括等待按序输出)的文档数上限，超过后不再读取新的输入，实现反压
+    """
+    def __init__(self, stages, max_in_flight):
+        self.stages = stages
+        self.max_in_flight = max_in_flight
+
+    def run(self, items, ordered=True, start_stage=None, on_stage=None):
+        """
+        items为输入的迭代器，生成 (下标, 结果, 异常)
+
+        start_stage(item)返回该输入从第几个阶段开始(之前的阶段已经完成)，等于阶段数时直接作为结果输出
+        on_stage(阶段名, 下标, 结果, 异常)在每个阶段完成或失败时调用，在调用run的线程中执行
+        """
+        items = enumerate(items)
+        exhausted = False
+
+        ready = [deque() for _ in self.stages]
+        running = {}
+        finished = {}
+        next_output = 0
+        in_flight = 0
+
+        while True:
+            while not exhausted and in_flight < self.max_in_flight:
+                try:
+                    idx, item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                in_flight += 1
+                stage_idx = start_stage(item) if start_stage is not None else 0
+                if stage_idx < len(self.stages):
+                    ready[stage_idx].append((idx, item))
+                elif ordered:
+                    finished[idx] = (item, None)
+                else:
+                    in_flight -= 1
+                    yield idx, item, None
+
+            # 从后往前提交，优先让已经走到后面的文档完成
+            for stage_idx in range(len(self.stages) - 1, -1, -1):
+                name, func, executor, concurrency = self.stages[stage_idx]
+                stage_running = sum(1 for s, _ in running.values() if s == stage_idx)
+
+                while ready[stage_idx] and stage_running < concurrency:
+                    idx, item = ready[stage_idx].popleft()
+                    running[executor.submit(func, item)] = (stage_idx, idx)
+                    stage_running += 1
+
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+            else:
+                done = ()
+
+            for future in done:
+                stage_idx, idx = running.pop(future)
+                error = future.exception()
+                result = None if error else future.result()
+
+                if on_stage is not None:
+                    on_stage(self.stages[stage_idx][0], idx, result, error)
+
+                if error is None and stage_idx + 1 < len(self.stages):
+                    ready[stage_idx + 1].append((idx, result))
+                    continue
+
+                if not ordered:
+                    in_flight -= 1
+                    yield idx, result, error
+                else:
+                    finished[idx] = (result, error)
+
+            while next_output in finished:
+                result, error = finished.pop(next_output)
+                in_flight -= 1
+                yield next_output, result, error
+                next_output += 1
+
+            if exhausted and not running and not any(ready):
+                break
+
+
+def process_corpus(paths, output_dir=None, workers=None, label_workers=None, alto_workers=None,
+                   max_in_flight=None, ordered=True, low_memory=False, sink=None, manifest=None):
+    """
+    批量把PDF(或已经转换好的ALTO文件)转换成TEI，pdfalto、特征抽取、分类和TEI生成在不同文档之间流水线并行
+
+    workers: 特征抽取和TEI生成的进程数，默认为cpu数
+    label_workers / alto_workers: 每个分类阶段同时运行的wapiti子进程数 / 同时运行的pdfalto子进程数，默认和workers相同
+    max_in_flight: 同时处理中的文档数上限，默认为 4 * workers
+    ordered: 为True时按输入顺序返回结果，否则按完成顺序返回
+    low_memory: 为True时特征抽取不解析整个ALTO文件，逐页读取，见FeatureFactory的low_memory
+
+    sink: 输出的TEI写入sink(见grobid.output_sink，如ShardedSink)，记录名为 (文件名-内容sha256的前16位, "tei.xml")，
+        由调用方关闭；TEI在主进程中写入，和output_dir不能同时使用
+
+    manifest: grobid.manifest.CorpusManifest，记录每个文档完成的阶段并保存检查点；
+        重新运行时已经完成的文档直接返回之前的输出，未完成的文档从最后一个完成的阶段之后继续，失败的阶段重新执行。
+        sink中的记录在sink fsync之后才在清单中标记为完成；
+        同一次运行中内容相同的文件只处理一次，结果和第一个文件相同
+
+    生成CorpusResult(path, tei, error)，output_dir不为空时tei为写入的文件路径(output_dir/<文件名>-<内容sha256的前16位>.tei.xml)，
+    有sink时为OutputRecord，否则为TEI内容
+    """
+    workers = workers or os.cpu_count() or 1
+    label_workers = label_workers or workers
+    alto_workers = alto_workers or workers
+    max_in_flight = max_in_flight or 4 * workers
+
+    if output_dir and sink is not None:
+        raise ValueError("output_dir and sink cannot be used together")
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    concurrency = {"process": workers, "thread": label_workers}
+
+    if manifest is not None:
+        alto_context = contextlib.nullcontext(manifest.alto_dir())
+    else:
+        alto_context = tempfile.TemporaryDirectory(prefix="grobid_alto_")
+
+    with alto_context as alto_dir, \
+            ProcessPoolExecutor(max_workers=workers) as process_pool, \
+            ThreadPoolExecutor(max_workers=2 * label_workers + alto_workers) as thread_pool:
+
+        executors = {"process": process_pool, "thread": thread_pool}
+
+        # fork方式的进程池在第一次submit时fork出全部worker，要在任何阶段启动wapiti子进程之前完成，
+        # 否则worker会继承wapiti stdin的写端，wapiti读不到EOF(从检查点恢复时第一个执行的可能就是分类阶段)
+        process_pool.submit(_noop).result()
+
+        stages = []
+        for name, kind in PIPELINE_STAGES:
+            stage_concurrency = alto_workers if name == "alto" else concurrency[kind]
+            func = STAGE_FUNCS[name] if manifest is None else CheckpointedStage(name, STAGE_FUNCS[name])
+            stages.append((name, func, executors[kind], stage_concurrency))
+
+        jobs = ({"idx": idx, "path": path, "alto_dir": alto_dir, "output_dir": output_dir, "low_memory": low_memory,
+                 "need_key": bool(output_dir) or sink is not None} for idx, path in enumerate(paths))
+
+        paths_by_idx = {}
+        keys_by_idx = {}
+        # 本次运行中内容相同的文件只处理一次：digest -> 第一个文件的结果 (输出, 异常)，和还在等待这个结果的文件
+        results_by_key = {}
+        waiting = {}
+
+        def track(jobs):
+            for job in jobs:
+                if manifest is not None:
+                    digest = manifest.document_key(job["path"])
+                    if digest in keys_by_idx.values() or digest in results_by_key:
+                        # 不进入流水线，直接作为结果输出，在结果中换成第一个文件的输出
+                        job.update(doc_key=digest, duplicate=True, start_stage=len(PIPELINE_STAGES))
+                    else:
+                        job.update(_resume_job(manifest, job["path"], digest))
+                    keys_by_idx[job["idx"]] = digest
+
+                paths_by_idx[job["idx"]] = job["path"]
+                yield job
+
+        on_stage = None
+        if manifest is not None:
+            def on_stage(name, idx, job, error):
+                if error is not None:
+                    manifest.fail(keys_by_idx[idx], name, error)
+                else:
+                    manifest.complete(keys_by_idx[idx], name, job["alto_path"] if name == "alto" else job.get("checkpoint"))
+
+        # 已经写入sink、还没有fsync的文档，sink的syncs增加之后才在清单中标记为完成；
+        # 没有syncs的sink写入之后立即标记
+        unsynced = []
+        synced = getattr(sink, "syncs", None)
+
+        def finish(digest, output, keep=()):
+            manifest.set_output(digest, output)
+            manifest.cleanup(digest, keep)
+
+        def commit_synced(force=False):
+            nonlocal synced
+            if force and sink is not None:
+                sink.flush()
+            current = getattr(sink, "syncs", None)
+            if force or current is None or current != synced:
+                synced = current
+                for digest, output in unsynced:
+                    finish(digest, output)
+                del unsynced[:]
+
+        pipeline = Pipeline(stages, max_in_flight)
+        try:
+            for idx, job, error in pipeline.run(track(jobs), ordered=ordered,
+                                                start_stage=lambda job: job.get("start_stage", 0), on_stage=on_stage):
+                path = paths_by_idx.pop(idx)
+                digest = keys_by_idx.pop(idx, None)
+
+                if error is None and job.get("duplicate"):
+                    if digest in results_by_key:
+                        yield _duplicate_result(path, *results_by_key[digest])
+                    else:
+                        waiting.setdefault(digest, []).append(path)
+                    continue
+
+                output = None
+                if error is not None:
+                    tei = None
+                elif "finished" in job:
+                    output = job["finished"]
+                    tei = _restore_output(output)
+                elif sink is not None:
+                    tei = sink.write(_sink_key(path, job["doc_key"]), "tei.xml", job["tei"])
+                    output = {"record": list(tei)}
+                    if manifest is not None:
+                        unsynced.append((digest, output))
+                        commit_synced()
+                else:
+                    tei = job["tei"]
+                    if manifest is not None:
+                        if output_dir:
+                            output = {"path": tei}
+                            finish(digest, output)
+                        else:
+                            output = {"checkpoint": job["checkpoint"]}
+                            finish(digest, output, keep=[job["checkpoint"]])
+
+                yield CorpusResult(path, tei, error)
+
+                if manifest is not None:
+                    results_by_key[digest] = (output, error)
+                    for other in waiting.pop(digest, ()):
+                        yield _duplicate_result(other, output, error)
+        finally:
+            if manifest is not None:
+                commit_synced(force=True)
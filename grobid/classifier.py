@@ -1,22 +1,204 @@
 import os
-from grobid.cmd_utils import wapiti_infer
+import atexit
+
+from grobid.cmd_utils import wapiti_infer, wapiti_label_rows
+from grobid.instrument import instrumented
+from grobid.label_cache import LabelCache
+from grobid.labels import LabelSequence
+from grobid.wapiti_worker import WapitiPool
 
 wapiti_model_map = {
     "segment": "seg_model.wapiti",
     "fulltext": "fulltext_model.wapiti",
 }
 
+# 每个模型常驻的wapiti进程数，0表示每次调用都启动一个新进程
+worker_pool_size = 0
+_worker_pools = {}
+
+# 分类结果缓存，默认关闭，见set_label_cache
+label_cache = None
+
+# 分类的实现："wapiti" 调用wapiti程序，"crf" 在进程内用grobid.crf解码，见set_label_backend
+label_backend = "wapiti"
+_crf_models = {}
+
+# 跨文档合并分类请求的参数，为None时不合并，见set_micro_batching
+micro_batching = None
+_batchers = {}
+
+
+def _get_worker_pool(model_type):
+    if model_type not in _worker_pools:
+        _worker_pools[model_type] = WapitiPool(wapiti_model_map[model_type], worker_pool_size)
+
+    return _worker_pools[model_type]
+
+
+def close_worker_pools():
+    for pool in _worker_pools.values():
+        pool.close()
+
+    _worker_pools.clear()
+
+
+def _get_batcher(model_type):
+    if model_type not in _batchers:
+        from grobid.micro_batch import MicroBatcher
+
+        _batchers[model_type] = MicroBatcher(lambda rows: _run_labeler(model_type, rows),
+            name=model_type, **micro_batching)
+
+    return _batchers[model_type]
+
+
+def close_batchers():
+    for batcher in _batchers.values():
+        batcher.close()
+
+    _batchers.clear()
+
+
+def set_micro_batching(max_documents=16, max_rows=20000, max_wait=0.005, concurrency=1):
+    """
+    开启跨文档合并分类请求，同时调用classify_rows的多个文档合并成一次wapiti调用，见grobid.micro_batch
+    max_documents为0时关闭；每个批次的统计见batcher_stats
+    """
+    global micro_batching
+
+    close_batchers()
+    micro_batching = None
+    if max_documents:
+        micro_batching = {"max_documents": max_documents, "max_rows": max_rows,
+            "max_wait": max_wait, "concurrency": concurrency}
+
+    return True
+
+
+def batcher_stats():
+    """每个模型的批次统计：批次数、批次大小的分布、排队时间等"""
+    return {model_type: batcher.stats() for model_type, batcher in _batchers.items()}
+
+
+def set_worker_pool_size(size):
+    """开启常驻worker模式，size为每个模型的进程数；size为0时回到每次调用启动进程"""
+    global worker_pool_size
+
+    close_worker_pools()
+    worker_pool_size = size
+
+    return True
+
+
+def set_label_cache(max_entries=1024, cache_dir=None, max_bytes=1024 ** 3):
+    """开启分类结果缓存，max_entries为0时关闭；cache_dir不为空时缓存同时写入磁盘"""
+    global label_cache
+
+    label_cache = LabelCache(max_entries, cache_dir, max_bytes) if max_entries else None
+    return label_cache
+
+
+def set_label_backend(backend):
+    """backend为 "wapiti" 或 "crf"，两者的分类结果相同；crf不需要wapiti程序，模型在第一次使用时加载"""
+    global label_backend
+
+    if backend not in ("wapiti", "crf"):
+        raise ValueError("unknown label backend: %s" % backend)
+
+    label_backend = backend
+    return True
+
+
+def _get_crf_model(model_type):
+    if model_type not in _crf_models:
+        # numpy在第一次用到时才导入，不拖慢 `import grobid`
+        from grobid.crf import WapitiModel
+
+        _crf_models[model_type] = WapitiModel.load(wapiti_model_map[model_type])
+
+    return _crf_models[model_type]
+
+
+def _model_label(model_type, *args):
+    return {"model": model_type}
+
+
+@instrumented("classifier", lambda ret, *args: {"rows": len(ret)}, _model_label)
 def classifier(model_type, feature_path):
     if model_type not in wapiti_model_map:
         return []
 
+    if label_cache is not None or label_backend == "crf" or micro_batching is not None:
+        with open(feature_path) as f:
+            rows = [l.rstrip("\r\n") for l in f]
+
+        # 不经过classify_rows的instrumented，一次调用只记录一个classifier事件
+        labels = _classify_rows(model_type, rows)
+        return list(labels.result_lines(r for r in rows if r.strip()))
+
+    if worker_pool_size > 0:
+        with open(feature_path) as f:
+            return _get_worker_pool(model_type).label_lines(f)
+
     results =  wapiti_infer(wapiti_model_map[model_type], feature_path)
     return results
 
+@instrumented("classifier", lambda labels, *args: {"rows": len(labels)}, _model_label)
+def classify_rows(model_type, rows):
+    """
+    不经过特征文件，直接对内存中的特征行分类，rows可以是FeatureFactory.iter_feature_rows的生成器
+    返回和特征行按下标对齐的LabelSequence
+    """
+    return _classify_rows(model_type, rows)
+
+def _classify_rows(model_type, rows):
+    if model_type not in wapiti_model_map:
+        return LabelSequence.from_labels([])
+
+    if label_cache is None:
+        return _label_rows(model_type, rows)
+
+    rows = list(rows)
+    key = label_cache.key(wapiti_model_map[model_type], rows)
+
+    labels = label_cache.get(key)
+    if labels is None:
+        labels = _label_rows(model_type, rows)
+        # wapiti异常退出时结果不完整，不缓存
+        if len(labels) == sum(1 for r in rows if r.strip()):
+            label_cache.put(key, labels)
+
+    return labels
+
+def _label_rows(model_type, rows):
+    if micro_batching is not None:
+        return _get_batcher(model_type).label(rows)
+
+    return _run_labeler(model_type, rows)
+
+def _run_labeler(model_type, rows):
+    if label_backend == "crf":
+        return LabelSequence.from_labels(_get_crf_model(model_type).label_rows(rows))
+
+    if worker_pool_size > 0:
+        return LabelSequence.from_lines(_get_worker_pool(model_type).label_lines(rows))
+
+    return wapiti_label_rows(wapiti_model_map[model_type], rows)
+
 def set_model_path(model_path):
     for key in wapiti_model_map:
-        model_name = wapiti_model_map[key]
+        model_name = os.path.basename(wapiti_model_map[key])
         wapiti_model_map[key] = os.path.join(model_path, model_name)
         assert os.path.exists(wapiti_model_map[key])
 
-    return True
\ No newline at end of file
+    # 已经启动的worker加载的是旧模型，缓存的结果也是旧模型的
+    close_worker_pools()
+    _crf_models.clear()
+    if label_cache is not None:
+        label_cache.invalidate()
+
+    return True
+
+
+atexit.register(close_worker_pools)
+atexit.register(close_batchers)
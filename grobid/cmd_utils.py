@@ -1,33 +1,108 @@
+import os
 import subprocess
+import threading
+
+from grobid.alto_cache import AltoCache
+from grobid.instrument import instrumented
+from grobid.labels import LabelSequence
 
 alto_path = "/usr/bin/pdfalto"
 wapiti_path = "/usr/bin/wapiti"
 
-def alto_parser(pdf_path, output_path):
-    ret = subprocess.call([alto_path, pdf_path, output_path])
+# 默认不开启缓存，见set_alto_cache
+alto_cache = None
+_alto_versions = {}
+
+def set_alto_cache(cache_dir, max_bytes=10 * 1024 ** 3):
+    """开启pdfalto输出缓存，cache_dir为None时关闭"""
+    global alto_cache
+
+    alto_cache = AltoCache(cache_dir, max_bytes) if cache_dir else None
+    return alto_cache
+
+def alto_version():
+    """pdfalto的版本信息，作为缓存key的一部分；换了pdfalto之后旧的缓存自然失效"""
+    if alto_path not in _alto_versions:
+        try:
+            p = subprocess.run([alto_path, "-v"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=10)
+            version = p.stdout.decode(errors="replace").strip()
+        except (OSError, subprocess.TimeoutExpired):
+            version = ""
+
+        stat = os.stat(alto_path) if os.path.exists(alto_path) else None
+        _alto_versions[alto_path] = "%s|%s|%s" % (version, stat and stat.st_size, stat and stat.st_mtime)
+
+    return _alto_versions[alto_path]
+
+def _pdf_bytes(ret, pdf_path, output_path, options=()):
+    return {"bytes": os.path.getsize(pdf_path) if os.path.exists(pdf_path) else 0}
+
+def _rows_count(labels, model_path, rows):
+    return {"rows": len(labels)}
+
+@instrumented("alto_parser", _pdf_bytes)
+def alto_parser(pdf_path, output_path, options=()):
+    """options为额外的pdfalto命令行参数"""
+    if alto_cache is None:
+        return subprocess.call([alto_path, *options, pdf_path, output_path])
+
+    key = alto_cache.key(pdf_path, alto_path, alto_version(), *options)
+    if alto_cache.get(key, output_path):
+        return 0
+
+    ret = subprocess.call([alto_path, *options, pdf_path, output_path])
+    if ret == 0 and os.path.exists(output_path):
+        alto_cache.put(key, output_path)
+
     return ret
 
-def wapiti_infer(model_path, feature_path):
-    p = subprocess.Popen(" ".join([wapiti_path, "label", "-m", model_path, feature_path]), shell=True, stdout=subprocess.PIPE)
+def _non_empty(lines):
+    return (l for l in lines if l.strip())
 
-    ret = []
+@instrumented("wapiti", lambda ret, *args: {"rows": len(ret)}, lambda model_path, feature_path: {"model": os.path.basename(model_path)})
+def wapiti_infer(model_path, feature_path):
+    p = subprocess.Popen([wapiti_path, "label", "-m", model_path, feature_path], stdout=subprocess.PIPE)
 
-    result_idx = 0
-    results = p.stdout.readlines()
+    results = [l.decode() for l in p.stdout]
+    p.wait()
 
+    # wapiti按输入顺序逐行输出，跳过空行后一一对应
     with open(feature_path) as f:
-        for l in f:
-            result_line = results[result_idx].decode()
+        ret = [result_line for _, result_line in zip(_non_empty(f), _non_empty(results))]
 
-            while not result_line.startswith(l.strip()):
-                result_idx += 1
-                result_line = results[result_idx].decode()
+    return ret
 
-            ret.append(results[result_idx].decode())
+def _feed_rows(stdin, rows):
+    try:
+        for row in rows:
+            stdin.write(row + "\n")
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
 
-            result_idx += 1
+@instrumented("wapiti", _rows_count, lambda model_path, rows: {"model": os.path.basename(model_path)})
+def wapiti_label_rows(model_path, rows):
+    """
+    特征行直接从rows写入wapiti的stdin，不落盘；返回和特征行按下标对齐的LabelSequence
+    rows可以是生成器，写入在单独的线程中进行，避免和读取stdout互相阻塞
+    """
+    p = subprocess.Popen([wapiti_path, "label", "-m", model_path],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        universal_newlines=True, encoding="utf-8")
 
-    return ret
+    feeder = threading.Thread(target=_feed_rows, args=(p.stdin, rows), daemon=True)
+    feeder.start()
+
+    labels = LabelSequence.from_lines(p.stdout)
+
+    feeder.join()
+    p.wait()
+
+    return labels
 
 if __name__ == '__main__':
     ret = wapiti_infer("/Users/hyy/mytask/b_paper/playground/Wapiti/data/seg_model.wapiti", "/Users/hyy/mytask/b_paper/playground/wapiti_out/self_extract.segment.feature")
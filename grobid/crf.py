@@ -0,0 +1,317 @@
+"""
+不启动wapiti进程，直接在进程内用wapiti训练好的CRF模型分类
+
+模型文件格式(wapiti的mdl_save)：
+    #mdl#<模型类型>#<非0权重数>
+    #rdr#<模板数>/<列数>/<autouni>
+    <模板>                      每个字符串都是 "长度:内容,\\n"
+    #qrk#<标签数>  <标签>...
+    #qrk#<观测数>  <观测>...
+    <特征下标>=<权重(%a十六进制浮点数)>...
+
+观测以 u / b / * 开头，分别对应unigram、bigram和两者都有：
+unigram观测o对标签y的权重为 theta[uoff[o] + y]，bigram观测对 (y', y) 的权重为 theta[boff[o] + y' * Y + y]
+解码和wapiti的tag_viterbi一致：在log空间中求和，取第一个最大值
+"""
+import re
+
+import numpy as np
+
+
+MODEL_TYPES = {0: "maxent", 1: "memm", 2: "crf"}
+
+# 超出序列范围的位置的取值，和wapiti的pat_exec一致
+_BEFORE = ["_x-1", "_x-2", "_x-3", "_x-4", "_x-#"]
+_AFTER = ["_x+1", "_x+2", "_x+3", "_x+4", "_x+#"]
+
+_COMMAND = re.compile(r"%([xXtTmM])\[(@?)(-?\d+),(\d+)(?:,\"((?:[^\"\\]|\\.)*)\")?\]")
+
+# wapiti正则中的字符类
+_CLASSES = {
+    "a": "A-Za-z", "d": "0-9", "l": "a-z", "p": re.escape("!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~"),
+    "s": " \\t\\n\\r\\f\\v", "u": "A-Z", "w": "A-Za-z0-9", "x": "0-9A-Fa-f",
+}
+
+
+class WapitiModelError(ValueError):
+    pass
+
+
+def _wapiti_regex(source):
+    """把wapiti模板中的简单正则(^ $ . * + ? 和 \\d \\a 等字符类)转换成python的正则"""
+    out = []
+    i = 0
+    while i < len(source):
+        c = source[i]
+        if c == "\\" and i + 1 < len(source):
+            n = source[i + 1]
+            if n.lower() in _CLASSES:
+                chars = _CLASSES[n.lower()]
+                out.append(("[%s]" if n.islower() else "[^%s]") % chars)
+            else:
+                out.append(re.escape(n))
+            i += 2
+            continue
+
+        out.append(c if c in "^$.*+?" else re.escape(c))
+        i += 1
+
+    return re.compile("".join(out))
+
+
+class Pattern:
+    """一个特征模板，如 "U05:%x[-1,0]/%x[0,0]" """
+    def __init__(self, source):
+        self.source = source
+        self.items = []
+
+        pos = 0
+        for m in _COMMAND.finditer(source):
+            if m.start() > pos:
+                self.items.append(("s", source[pos:m.start()], False, 0, 0, False))
+
+            command, absolute, offset, column, regex = m.groups()
+            kind = command.lower()
+            if kind in "tm":
+                if regex is None:
+                    raise WapitiModelError("missing regexp in pattern: %s" % source)
+                regex = _wapiti_regex(regex)
+
+            self.items.append((kind, regex, command != kind, int(offset), int(column), bool(absolute)))
+            pos = m.end()
+
+        if "%" in source[pos:]:
+            raise WapitiModelError("invalid pattern: %s" % source)
+        if pos < len(source):
+            self.items.append(("s", source[pos:], False, 0, 0, False))
+
+    def apply(self, tokens, t):
+        """tokens为序列中每个位置的列，返回位置t上的观测字符串"""
+        T = len(tokens)
+        parts = []
+
+        for kind, value, caps, offset, column, absolute in self.items:
+            if kind == "s":
+                parts.append(value)
+                continue
+
+            if absolute:
+                pos = T + offset if offset < 0 else offset - 1
+            else:
+                pos = t + offset
+
+            if pos < 0:
+                text = _BEFORE[min(-pos - 1, 4)]
+            elif pos >= T:
+                text = _AFTER[min(pos - T, 4)]
+            elif column >= len(tokens[pos]):
+                raise WapitiModelError("missing tokens, cannot apply pattern: %s" % self.source)
+            else:
+                text = tokens[pos][column]
+
+            if kind == "t":
+                text = "true" if value.search(text) else "false"
+            elif kind == "m":
+                m = value.search(text)
+                text = m.group(0) if m else ""
+
+            parts.append(text.lower() if caps else text)
+
+        return "".join(parts)
+
+
+def _read_str(data, pos):
+    """读取 "长度:内容,\\n"，长度为utf-8字节数，返回 (字符串, 新的位置)"""
+    colon = data.index(b":", pos)
+    size = int(data[pos:colon])
+    start = colon + 1
+    end = start + size
+    if data[end:end + 1] != b",":
+        raise WapitiModelError("invalid string at byte %d" % pos)
+
+    pos = end + 1
+    if data[pos:pos + 1] == b"\n":
+        pos += 1
+
+    return data[start:end].decode("utf-8"), pos
+
+
+def _read_line(data, pos):
+    end = data.index(b"\n", pos)
+    return data[pos:end].decode("ascii").strip(), end + 1
+
+
+def _read_quark(data, pos):
+    header, pos = _read_line(data, pos)
+    if not header.startswith("#qrk#"):
+        raise WapitiModelError("expected #qrk# header, got %r" % header)
+
+    strings = []
+    for _ in range(int(header[5:])):
+        value, pos = _read_str(data, pos)
+        strings.append(value)
+
+    return strings, pos
+
+
+def _parse_weight(value):
+    return float.fromhex(value) if "x" in value else float(value)
+
+
+class WapitiModel:
+    """
+    wapiti训练好的CRF模型
+
+    labels: 标签名
+    patterns: 特征模板
+    observations: 观测字符串 -> 下标
+    theta: 所有特征的权重，uoff / boff为每个观测的unigram / bigram权重的起始位置(没有时为-1)
+    """
+    def __init__(self, model_type, patterns, labels, observations, theta, uoff, boff):
+        self.model_type = model_type
+        self.patterns = patterns
+        self.labels = labels
+        self.observations = observations
+        self.theta = theta
+        self.uoff = uoff
+        self.boff = boff
+
+    @classmethod
+    def load(cls, model_path):
+        with open(model_path, "rb") as f:
+            data = f.read()
+
+        header, pos = _read_line(data, 0)
+        fields = header.split("#")
+        if len(fields) == 4 and fields[1] == "mdl":
+            model_type, active = int(fields[2]), int(fields[3])
+        elif len(fields) == 3 and fields[1] == "mdl":
+            model_type, active = 0, int(fields[2])
+        else:
+            raise WapitiModelError("not a wapiti model: %s" % model_path)
+
+        if MODEL_TYPES.get(model_type) != "crf":
+            raise WapitiModelError("only crf models are supported, got %s" % MODEL_TYPES.get(model_type, model_type))
+
+        header, pos = _read_line(data, pos)
+        if not header.startswith("#rdr#"):
+            raise WapitiModelError("expected #rdr# header, got %r" % header)
+
+        counts = header[5:].split("/")
+        if len(counts) > 2 and int(counts[2]):
+            raise WapitiModelError("models trained with autouni are not supported")
+
+        patterns = []
+        for _ in range(int(counts[0])):
+            source, pos = _read_str(data, pos)
+            patterns.append(Pattern(source))
+
+        labels, pos = _read_quark(data, pos)
+        observations, pos = _read_quark(data, pos)
+
+        # 和wapiti的mdl_sync一样按观测的顺序分配特征下标
+        Y = len(labels)
+        kinds = np.array([{"u": 1, "b": 2, "*": 3}.get(o[:1].lower(), 0) for o in observations], dtype=np.int64)
+        sizes = np.where(kinds & 1, Y, 0) + np.where(kinds & 2, Y * Y, 0)
+        starts = np.cumsum(sizes) - sizes
+        uoff = np.where(kinds & 1, starts, -1)
+        boff = np.where(kinds & 2, starts + np.where(kinds & 1, Y, 0), -1)
+
+        theta = np.zeros(int(sizes.sum()), dtype=np.float64)
+        lines = data[pos:].split(b"\n")
+        if len([l for l in lines if l.strip()]) < active:
+            raise WapitiModelError("truncated model: %s" % model_path)
+
+        for line in lines[:active]:
+            idx, _, value = line.decode("ascii").partition("=")
+            theta[int(idx)] = _parse_weight(value.strip())
+
+        return cls(model_type, patterns, labels, {o: i for i, o in enumerate(observations)}, theta, uoff, boff)
+
+    def _observations(self, tokens):
+        """每个位置出现的unigram / bigram观测，返回 (位置, 权重起始位置) 的数组"""
+        unigram_pos = []
+        unigram_off = []
+        bigram_pos = []
+        bigram_off = []
+        uoff = self.uoff.tolist()
+        boff = self.boff.tolist()
+
+        for t in range(len(tokens)):
+            for pattern in self.patterns:
+                o = self.observations.get(pattern.apply(tokens, t))
+                if o is None:
+                    continue
+
+                if uoff[o] >= 0:
+                    unigram_pos.append(t)
+                    unigram_off.append(uoff[o])
+                if boff[o] >= 0:
+                    bigram_pos.append(t)
+                    bigram_off.append(boff[o])
+
+        return (np.array(unigram_pos, dtype=np.int64), np.array(unigram_off, dtype=np.int64),
+            np.array(bigram_pos, dtype=np.int64), np.array(bigram_off, dtype=np.int64))
+
+    def scores(self, tokens):
+        """psi[t, y', y]：位置t从y'转移到y的分数，位置0只有unigram分数"""
+        T = len(tokens)
+        Y = len(self.labels)
+        unigram_pos, unigram_off, bigram_pos, bigram_off = self._observations(tokens)
+
+        # np.add.at按顺序逐个累加，和wapiti逐个观测求和的顺序一致
+        unigram = np.zeros((T, Y), dtype=np.float64)
+        np.add.at(unigram, unigram_pos, self.theta[unigram_off[:, None] + np.arange(Y)])
+
+        bigram = np.zeros((T, Y * Y), dtype=np.float64)
+        keep = bigram_pos > 0
+        np.add.at(bigram, bigram_pos[keep], self.theta[bigram_off[keep][:, None] + np.arange(Y * Y)])
+
+        psi = unigram[:, None, :] + bigram.reshape(T, Y, Y)
+        psi[0] = unigram[0]
+        return psi
+
+    def viterbi(self, tokens):
+        """tokens为一个序列每个位置的列，返回标签下标"""
+        T = len(tokens)
+        if not T:
+            return []
+
+        psi = self.scores(tokens)
+        back = np.zeros((T, len(self.labels)), dtype=np.int64)
+
+        cur = psi[0, 0].copy()
+        for t in range(1, T):
+            val = cur[:, None] + psi[t]
+            back[t] = np.argmax(val, axis=0)
+            cur = val[back[t], np.arange(val.shape[1])]
+
+        path = [int(np.argmax(cur))]
+        for t in range(T - 1, 0, -1):
+            path.append(int(back[t][path[-1]]))
+        path.reverse()
+
+        return path
+
+    def label(self, rows):
+        """rows为一个序列的特征行，返回标签名"""
+        tokens = [row.split() for row in rows]
+        return [self.labels[y] for y in self.viterbi(tokens)]
+
+    def label_rows(self, rows):
+        """rows中的空行分隔序列，按非空行的顺序返回标签名"""
+        labels = []
+        sequence = []
+
+        for row in rows:
+            row = row.rstrip("\r\n")
+            if row.strip():
+                sequence.append(row)
+            elif sequence:
+                labels.extend(self.label(sequence))
+                sequence = []
+
+        if sequence:
+            labels.extend(self.label(sequence))
+
+        return labels
@@ -1,17 +1,17 @@
 import os
 
-from collections import Counter, OrderedDict
-from functools import partial 
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
 
-from bs4 import BeautifulSoup
-from english_words import english_words_set
-
-from grobid.feature_utils import token_in_forbid_zones, \
-    tokenize, get_bucket_num, capital, digital, punct, \
-    build_font_feature_map, vectorize, fullPunctuations, \
-    special_pattern_test, special_set_test, rect_contains, PUNCT_TRANS
-from grobid.cmd_utils import wapiti_infer
-from grobid.alto_file import AltoFile
+from grobid.feature_table import FeatureTable, FeatureVocab
+from grobid.feature_utils import tokenize, fullPunctuations, PUNCT_TRANS
+from grobid.geometry import block_layout, buckets, exclusive_cumsum, line_len_buckets, token_page_positions
+from grobid.lexical_features import lexical_features
+from grobid.alto_file import AltoFile, calc_main_area, page_tokens_in_zones
+from grobid.alto_document import AltoDocument, parse_alto, iter_alto_pages, iter_alto_page_range, prescan_alto
+from grobid.labels import LabelSequence
+from grobid.instrument import instrumented
 
 
 PAGE_INFO = ["PAGESTART", "PAGEIN", "PAGEEND"]
@@ -23,35 +23,99 @@ feature_cols = {
     "fulltext": ["token_text", "lower_token", "token_prefix", "token_suffix", "block_info", "line_info", "align_status", "font_type", "font_size_type", "font_bold", "font_italics", "is_captal", "is_digital", "single_char", "punct_info", "relative_document_position", "relative_page_position_characters", "bitmap_around", "calloutType", "calloutKnown", "superscript"]
     }
 
+# segment特征中跨页的字体状态：first / last为第一行和最后一行的 (字体ID, 字号)，没有特征行时为None
+SegmentFontState = namedtuple("SegmentFontState", ["first", "last"])
+
+# 不参与分类的调试信息，只在debug=True时保存在FeatureTable.debug中
+debug_cols = {
+    "segment": ["full_line", "line_id"],
+    "fulltext": ["line_id", "str_id"],
+}
+
 
 class FeatureFactory():
     """
+    feature_map中的特征为FeatureTable，debug为True时同时保存调试信息
+
+    low_memory为True时prepare()不解析整个文档，segment和fulltext特征都边读边生成，
+    同一时间只在内存中保留一页的AltoPage，文档级别只保留每个特征行的TextLine ID和block下标等紧凑的信息
+
+    sink不为空时特征文件写入sink(见grobid.output_sink)，记录名为doc_key(默认为ALTO文件名)和特征文件名，
+    dump_map和build_*_feature返回的是OutputRecord
     """
-    def __init__(self, alto_path):
+    def __init__(self, alto_path, alto_doc=None, debug=False, low_memory=False, sink=None, doc_key=None):
         self.alto_path = alto_path
+        self.alto_doc = alto_doc
+        self.debug = debug
+        self.low_memory = low_memory
+        self.sink = sink
+        self.doc_key = doc_key if doc_key is not None else os.path.splitext(os.path.basename(alto_path))[0]
         self.feature_map = {}
+        self.vocab_map = {}
         self.font_map = {}
         self.dump_map = {}
         self.valid_lines = set()
+        # segment特征行对应的TextLine ID，和segment的分类结果按下标对齐
+        self.segment_line_ids = None
+        # segment特征行所在block在文档中的下标，没有解析整个文档时用来建立block_map
+        self.segment_line_blocks = None
+        self._forbid_mask = (None, None, None)
+        self._token_positions = None
+        self._layout = None
+        self._page_token_counts = None
+        self.segment_font_state = SegmentFontState(None, None)
 
     def prepare(self):
-        with open(self.alto_path) as f:
-            self.alto_root = BeautifulSoup(f.read(), "xml")
+        if self.low_memory and self.alto_doc is None:
+            # 字体信息在读取第一页时得到，见_iter_pages
+            return
 
-        self.font_map = build_font_feature_map(self.alto_root.Styles)
+        if self.alto_doc is None:
+            self.alto_doc = parse_alto(self.alto_path)
 
-    def _dump_feature(self, feature_type, output_path):
-        feature_vectorise = partial(vectorize, feature_cols[feature_type])
-        col_feature = map(feature_vectorise, self.feature_map[feature_type])
+        self.alto_file = AltoFile(self.alto_path, self.alto_doc)
+        self.font_map = self.alto_doc.fonts
 
-        with open(output_path, "w+") as w:
-            for feature in col_feature:
-                feature_line = " ".join(feature) + "\n"
-                w.write(feature_line)
+    def _new_table(self, feature_type):
+        """同一类特征的表共用一个词表，各页的表可以直接合并"""
+        if feature_type not in self.vocab_map:
+            self.vocab_map[feature_type] = FeatureVocab(feature_cols[feature_type])
 
-        self.dump_map[feature_type] = output_path
+        return FeatureTable(self.vocab_map[feature_type], debug_cols[feature_type] if self.debug else None)
 
-    def build_fulltext_feature(self, seg_results, output_path="", extern_feature={}):
+    def iter_feature_rows(self, feature_type):
+        """逐行生成wapiti的特征行(不带换行符)，可以直接交给classify_rows"""
+        return self.feature_map[feature_type].iter_rows()
+
+    @instrumented("dump_feature",
+        lambda location, self, feature_type, output_path: {"rows": len(self.feature_map[feature_type]),
+            "bytes": location.length if self.sink is not None else os.path.getsize(output_path)},
+        lambda self, feature_type, output_path: {"model": feature_type})
+    def _dump_feature(self, feature_type, output_path):
+        """写入特征文件，有sink时写入sink中名为output_path文件名的记录，返回写入的位置"""
+        if self.sink is not None:
+            content = "".join([feature_line + "\n" for feature_line in self.iter_feature_rows(feature_type)])
+            location = self.sink.write(self.doc_key, os.path.basename(output_path), content)
+        else:
+            with open(output_path, "w+") as w:
+                for feature_line in self.iter_feature_rows(feature_type):
+                    w.write(feature_line + "\n")
+            location = output_path
+
+        self.dump_map[feature_type] = location
+        return location
+
+    @instrumented("fulltext_features",
+        lambda _, self, *args, **kwargs: {"rows": len(self.feature_map["fulltext"]),
+            "blocks": len(self.block_map.get("<body>", []))})
+    def build_fulltext_feature(self, seg_results, output_path="", extern_feature={}, dump=True, line_ids=None,
+                               line_blocks=None):
+        """
+        seg_results为segment模型的输出行，或者classify_rows返回的LabelSequence
+        line_ids为segment特征行对应的TextLine ID，默认使用本对象抽取segment特征时记录的segment_line_ids
+        line_blocks为这些行所在block的下标(segment_line_blocks)，只在没有解析整个文档时使用
+        dump为False时只在内存中生成特征，不写特征文件，返回None
+        """
         # 直接读取原始的alto.xml，build
         # self.feature_map["segment"] = self._extract_for_segment()
 
@@ -70,25 +134,20 @@ class FeatureFactory():
         #         w.write(l)
 
         # 根据segment分类结果，将文档分为不同部分
-        self.block_map = self._build_block_map(seg_results)
+        self.block_map = self._build_block_map(seg_results, line_ids, line_blocks)
 
         # 获取fulltext需要分类的部分，使用fulltext
-        fulltext_feature = []
-        extern_features = extern_feature
-        for block in self.block_map["<body>"]:
-            page_height = float(block.parent.parent.attrs["HEIGHT"])
-            extern_feature["page_height"] = page_height
-            token_features = self._extract_for_fulltext(block, extern_feature)
-            fulltext_feature.extend(token_features)
+        self.feature_map["fulltext"] = self._extract_fulltext(extern_feature)
 
-        self.feature_map["fulltext"] = fulltext_feature
+        if not dump:
+            return None
 
         fulltext_feature_path = "fulltext.feature"
 
         if output_path:
             fulltext_feature_path = os.path.join(output_path, fulltext_feature_path)
 
-        self._dump_feature("fulltext", fulltext_feature_path)
+        fulltext_feature_path = self._dump_feature("fulltext", fulltext_feature_path)
 
         # 调用分类器，获取fulltext分类结果
         # fulltext_results = wapiti_infer(wapiti_model_map["fulltext"], self.dump_map["fulltext"])
@@ -99,64 +158,192 @@ class FeatureFactory():
 
         return fulltext_feature_path
 
-    def build_segment_feature(self, output_path=""):
+    def build_segment_feature(self, output_path="", dump=True, executor=None, shards=None):
+        """
+        executor不为空时把文档的页分成shards段(默认为cpu数)，在executor(一般为ProcessPoolExecutor)中并行抽取，
+        结果和串行抽取完全相同，见_extract_for_segment_sharded
+        """
         # 直接读取原始的alto.xml，build
-        self.feature_map["segment"] = self._extract_for_segment()
+        if executor is not None:
+            self.feature_map["segment"] = self._extract_for_segment_sharded(executor, shards)
+        else:
+            self.feature_map["segment"] = self._extract_for_segment()
+
+        if not dump:
+            return None
 
         segment_feature_path = "segment.feature"
 
         if output_path:
             segment_feature_path = os.path.join(output_path, segment_feature_path)
 
-        self._dump_feature("segment", segment_feature_path)
-        return segment_feature_path
-
-    def _extract_for_segment(self):
-        doc_layout = self.alto_root.Layout
-
-        alto_file = AltoFile(self.alto_path)
-        main_area = alto_file.calc_page_main_areas()
+        return self._dump_feature("segment", segment_feature_path)
+
+    @instrumented("segment_features", lambda feature_list, self, *args: {"rows": len(feature_list)})
+    def _extract_for_segment(self, pages=None):
+        feature_table = self._new_table("segment")
+        for _, page_features in self.iter_segment_features(pages):
+            feature_table.extend(page_features)
+
+        return feature_table
+
+    @instrumented("segment_features", lambda feature_list, self, *args: {"rows": len(feature_list)},
+        lambda self, executor, shards=None: {"mode": "sharded"})
+    def _extract_for_segment_sharded(self, executor, shards=None):
+        """
+        按token数把页分成连续的几段，每段在executor中只解析自己的页并抽取特征，再按顺序合并
+
+        各页之间只有字体状态是连续的：每段第一行的 NEWFONT / SAMEFONT 和 HIGHERFONT / SAMEFONTSIZE / LOWERFONT
+        按前一段最后一行的字体重新计算；block的相对位置等文档级别的特征由_segment_layout统一算好传给每一段
+        """
+        layout = self._segment_layout()
+        shards = shards or os.cpu_count() or 1
+
+        futures = [executor.submit(_segment_shard, self.alto_path, pages, layout, self._page_token_counts, self.debug)
+                   for pages in _split_pages(self._page_token_counts, shards)]
+
+        feature_table = self._new_table("segment")
+        self.segment_line_ids = []
+        self.segment_line_blocks = array("i")
+        font, font_size = "", 0
+
+        for future in futures:
+            shard_table, line_ids, line_blocks, font_state = future.result()
+            if not len(shard_table):
+                continue
+
+            first_row = len(feature_table)
+            feature_table.extend(shard_table)
+            self.segment_line_ids.extend(line_ids)
+            self.segment_line_blocks.extend(line_blocks)
+            self.valid_lines.update(line_ids)
+
+            # 和iter_segment_features中的判断一致
+            first_font, first_size = font_state.first
+            feature_table.set(first_row, "font_type", "NEWFONT" if font != first_font else "SAMEFONT")
+            if font_size < first_size:
+                feature_table.set(first_row, "font_size_type", "HIGHERFONT")
+            elif first_size == font_size:
+                feature_table.set(first_row, "font_size_type", "SAMEFONTSIZE")
+            elif first_size < font_size:
+                feature_table.set(first_row, "font_size_type", "LOWERFONT")
+
+            font, font_size = font_state.last
+
+        self.segment_font_state = SegmentFontState(None, (font, font_size))
+        return feature_table
+
+    def _extract_fulltext(self, extern_feature={}):
+        feature_table = self._new_table("fulltext")
+        for _, page_features in self.iter_fulltext_features(extern_feature):
+            feature_table.extend(page_features)
+
+        return feature_table
+
+    def _segment_layout(self):
+        """
+        文档级别的block特征，见geometry.block_layout，没有解析整个文档时通过prescan_alto得到
+        返回 (每页第一个block的下标, (in_main_area, 相对文档位置, 相对页位置))，同一个对象只计算一次
+        """
+        if self._layout is not None:
+            return self._layout
+
+        if self.alto_doc is not None:
+            main_area = self.alto_file.calc_page_main_areas()
+            blocks = list(self.alto_doc.iter_blocks())
+            rects = [block.rect() for block in blocks]
+            block_token_counts = [block.token_count() for block in blocks]
+            page_block_counts = [len(page.blocks) for page in self.alto_doc.pages]
+            self._page_token_counts = [page.token_count() for page in self.alto_doc.pages]
+        else:
+            prescan = prescan_alto(self.alto_path)
+            main_area = calc_main_area(prescan.blocks, prescan.page_count)
+            rects = [(left, top, left + width, top + height) for _, left, top, width, height in prescan.blocks]
+            block_token_counts = prescan.block_token_counts
+            page_block_counts = prescan.page_block_counts
+            self._page_token_counts = prescan.page_token_counts
+
+        page_block_starts = exclusive_cumsum(page_block_counts).tolist()
+        self._layout = (page_block_starts, block_layout(main_area, rects, block_token_counts, page_block_counts))
+        return self._layout
+
+    def _iter_pages(self, pages=None):
+        if self.alto_doc is not None:
+            return (page for page in self.alto_doc.pages if pages is None or page.idx in pages)
+
+        stream_doc = AltoDocument(self.alto_path)
+        self.font_map = stream_doc.fonts
+
+        if isinstance(pages, range) and pages.step == 1 and len(pages):
+            # 连续的页直接从这几页的位置开始解析，不用读前面的页
+            self._segment_layout()
+            first_token = sum(self._page_token_counts[:pages.start])
+            source = iter_alto_page_range(self.alto_path, pages.start, pages.stop, stream_doc, first_token)
+        else:
+            source = iter_alto_pages(self.alto_path, stream_doc, pages)
+
+        def stream():
+            for page in source:
+                # 字体信息在第一页之前就已经解析好了
+                self.font_map = stream_doc.fonts
+                yield page
+
+        return stream()
+
+    def iter_segment_rows(self, pages=None):
+        """
+        边抽取边生成segment的特征行，可以直接交给classify_rows，前面的页可以在后面的页还在读取时开始分类
+        抽取的特征同时保存在feature_map["segment"]中
+        """
+        self.feature_map["segment"] = self._new_table("segment")
+
+        for _, page_features in self.iter_segment_features(pages):
+            self.feature_map["segment"].extend(page_features)
+            yield from page_features.iter_rows()
+
+    def iter_segment_features(self, pages=None):
+        """
+        逐页生成segment特征，yield (AltoPage, 该页的FeatureTable)
+
+        prepare()之后使用已经解析好的文档；否则边读边生成，只保留当前页，
+        文档级别的token数和正文区域由prescan_alto预先统计
+        pages为需要的页的下标(从0开始)，如range(0, 3)，处理完需要的最后一页就停止读取；
+        跨页的字体状态从第一个需要的页开始计算，第一行和最后一行的字体记录在segment_font_state中
+        """
+        page_block_starts, (in_main_areas, doc_positions, page_positions) = self._segment_layout()
+        self.segment_line_ids = []
+        self.segment_line_blocks = array("i")
 
         font = ""
         font_size = 0
-        
-        feature_list = []
-        
-        doc_token_len = len(doc_layout.find_all("String"))
-        doc_level_pos = 0
+        first_font = None
 
-        for page_zone in doc_layout:
+        for page in self._iter_pages(pages):
             page_info = PAGE_INFO[0]
-            page = page_zone.PrintSpace
-            
-            page_token_len = len(page.find_all("String"))
-            page_level_pos = 0
-
-            for text_block in page.children:
-                top = float(text_block.attrs["VPOS"])
-                left = float(text_block.attrs["HPOS"])
-                bottom = top + float(text_block.attrs["HEIGHT"])
-                right = left + float(text_block.attrs["WIDTH"])
-
-                in_main_area = rect_contains(main_area, (left, top, right, bottom))
+            feature_list = self._new_table("segment")
+            line_lens = []
+            line_blocks = []
 
+            for block_idx, text_block in enumerate(page.blocks, start=page_block_starts[page.idx]):
                 block_info = BLOCK_INFO[0]
-                max_line_len = 1
+                block_start = len(feature_list)
         
-                for text_line in text_block.children:
-                    first_token = text_line.next
-                    feature_token = first_token
-                    first_token_text = first_token.attrs["CONTENT"].strip()
+                for text_line in text_block.lines:
+                    if not text_line.tokens:
+                        continue
+
+                    first_token = text_line.tokens[0]
+                    first_token_text = first_token.content.strip()
 
                     if not first_token_text:
                         continue
                     else:
-                        self.valid_lines.add(text_line.attrs["ID"])
+                        self.valid_lines.add(text_line.id)
+                        self.segment_line_ids.append(text_line.id)
+                        self.segment_line_blocks.append(block_idx)
 
-                    if first_token.next.name == "SP":
-                        second_token_text = first_token.next.next.attrs["CONTENT"]
-                    elif first_token.next.name == "String":
-                        second_token_text = first_token.next.attrs["CONTENT"]
+                    if 1 < len(text_line.tokens):
+                        second_token_text = text_line.tokens[1].content
                     else:
                         second_token_text = first_token_text
 
@@ -164,7 +351,7 @@ class FeatureFactory():
                     second_token_text = second_token_text.strip()
 
                     # 获取字体信息
-                    cur_font = first_token.attrs["STYLEREFS"]
+                    cur_font = first_token.style
                     if font != cur_font:
                         font_style = "NEWFONT"
                         font = cur_font
@@ -181,12 +368,9 @@ class FeatureFactory():
                         font_size = self.font_map[cur_font]["fontsize"]
                         font_size_style = "LOWERFONT"
 
-                    line_token = [c for c in text_line.children if c and c.name == "String"]
-                    full_line = " ".join([t.attrs["CONTENT"] for t  in line_token])
+                    full_line = " ".join([t.content for t in text_line.tokens])
                     line_len = len(full_line)
-                    if max_line_len < line_len:
-                        max_line_len = line_len
-                    
+
                     punct_profile = "".join([c for c in full_line if c != " " and c in fullPunctuations])
                     if not punct_profile:
                         punct_profile = "no"
@@ -194,88 +378,156 @@ class FeatureFactory():
                     else:
                         punct_profile_len = len(punct_profile)
 
-                    feature_list.append({
-                        # features
-                        "token_text": first_token_text,
-                        "2nd_token_text": second_token_text,
-                        "lower_token": first_token_text.lower(),
-                        "token_prefix": [first_token_text[:i] for i in range(1, 5)],
-                        "block_info": block_info,
-                        "page_info": page_info, # 8.
-                        "font_type": font_style,
-                        "font_size_type": font_size_style, # 10.
-                        "font_bold": self.font_map[cur_font]["bold"], # 字体加粗
-                        "font_italics": self.font_map[cur_font]["italics"], # 字体变斜
-                        "is_captal": capital(first_token_text), # 大写情况
-                        "is_digital": digital(first_token_text), #
-                        "single_char": "1" if len(first_token_text)==1 else "0",
-                        "proper_name": "0", # properName
-                        "common_name": special_set_test("common", first_token_text), # 17. commonName
-                        "first_name": "0", # firstName
-                        "year": special_pattern_test("year", first_token_text), # year
-                        "mounth": special_set_test("month", first_token_text), # 20. month
-                        "email": special_pattern_test("email", first_token_text), # email
-                        "http": special_pattern_test("http", first_token_text), # http
-                        "relative_document_position": get_bucket_num(doc_level_pos, doc_token_len, 12), # relative document position
-                        "relative_page_position_characters": get_bucket_num(page_level_pos, page_token_len, 12), # relative page position characters
-                        "punct_profile": punct_profile, # 25. punctuation profile
-                        "punct_profile_len": punct_profile_len, # punctuation profile
-                        "line_len": line_len, # 27. round(10 * len(first_token_text) / max_len,  # lineLength
-                        "bitmap_around": "0", # bitmapAround
-                        "vector_around": "0", # vectorAround
-                        "repetitive_pattern": "0", # repetitivePattern
-                        "first_repetitive_pattern": "0", # firstRepetitivePattern
-                        "in_main_area": in_main_area, # inMainArea
-                        # extra info for debug
-                        "full_line": full_line,
-                        "line_id": text_line.attrs["ID"],
-                    })
+                    lexical = lexical_features(first_token_text)
+
+                    # 按feature_cols["segment"]的顺序，调试信息按debug_cols["segment"]的顺序
+                    feature_list.append((
+                        first_token_text, # token_text
+                        second_token_text, # 2nd_token_text
+                        lexical.lower, # lower_token
+                        lexical.prefix, # token_prefix
+                        block_info,
+                        page_info, # 8.
+                        font_style,
+                        font_size_style, # 10.
+                        self.font_map[cur_font]["bold"], # 字体加粗
+                        self.font_map[cur_font]["italics"], # 字体变斜
+                        lexical.capital, # 大写情况
+                        lexical.digital,
+                        lexical.single_char,
+                        "0", # properName
+                        lexical.common, # 17. commonName
+                        "0", # firstName
+                        lexical.year, # year
+                        lexical.month, # 20. month
+                        lexical.email, # email
+                        lexical.http, # http
+                        doc_positions[block_idx], # relative document position
+                        page_positions[block_idx], # relative page position characters
+                        punct_profile, # 25. punctuation profile
+                        punct_profile_len, # punctuation profile
+                        0, # 27. lineLength，整页处理完之后再按block的最长行分桶
+                        "0", # bitmapAround
+                        "0", # vectorAround
+                        "0", # repetitivePattern
+                        "0", # firstRepetitivePattern
+                        in_main_areas[block_idx], # inMainArea
+                    ), (full_line, text_line.id))
+                    line_lens.append(line_len)
+                    line_blocks.append(block_idx)
+
+                    if first_font is None:
+                        first_font = (font, font_size)
 
                     if block_info == BLOCK_INFO[0]:
                         block_info = BLOCK_INFO[1]
 
                     if page_info == PAGE_INFO[0]:
                         page_info = PAGE_INFO[1]
-                
-                for i in range(1, len(text_block)+1):
-                    line_len = feature_list[-i]["line_len"]
-                    feature_list[-i]["line_len"] = get_bucket_num(line_len, max_line_len, 10)
 
-                if 1 < len(text_block):
-                    feature_list[-1]["block_info"] = BLOCK_INFO[-1] # fix block info
-            
-                block_token_len = len(text_block.find_all("String"))
-                page_level_pos += block_token_len
-                doc_level_pos += block_token_len
+                # 只修正当前block抽取出的特征行
+                if 1 < len(text_block.lines) and block_start < len(feature_list):
+                    feature_list.set(-1, "block_info", BLOCK_INFO[-1]) # fix block info
 
-            feature_list[-1]["page_info"] = PAGE_INFO[-1] # fix page info
+            # 行长度按所在block的最长行分桶
+            feature_list.set_column("line_len", line_len_buckets(line_lens, line_blocks).tolist())
 
-        return feature_list
+            if len(feature_list):
+                feature_list.set(-1, "page_info", PAGE_INFO[-1]) # fix page info
+
+            self.segment_font_state = SegmentFontState(first_font, (font, font_size) if first_font else None)
+            yield page, feature_list
+
+    def iter_fulltext_features(self, extern_feature={}, pages=None):
+        """
+        逐页生成正文部分的fulltext特征，yield (AltoPage, 该页正文的FeatureTable)，需要先通过segment结果建立block_map
+        pages为需要的页的下标(从0开始)
+        """
+        if self.alto_doc is None:
+            yield from self._iter_fulltext_stream(extern_feature, pages)
+            return
+
+        page = None
+        page_features = None
+
+        for block in self.block_map.get("<body>", []):
+            if pages is not None and block.page.idx not in pages:
+                continue
+
+            if block.page is not page:
+                if page is not None:
+                    yield page, page_features
+                page = block.page
+                page_features = self._new_table("fulltext")
+
+            extern_feature["page_height"] = block.page.height
+            page_features.extend(self._extract_for_fulltext(block, extern_feature))
+
+        if page is not None:
+            yield page, page_features
+
+    def _iter_fulltext_stream(self, extern_feature={}, pages=None):
+        """没有解析整个文档时，block_map中为block的下标，重新逐页读取，只抽取正文block所在的页"""
+        body = set(self.block_map.get("<body>", []))
+        if not body:
+            return
+
+        page_block_starts, _ = self._segment_layout()
+        if pages is None:
+            # 最后一个正文block所在的页之后不再读取
+            pages = range(bisect_right(page_block_starts, min(body)) - 1, bisect_right(page_block_starts, max(body)))
+
+        for page in self._iter_pages(pages):
+            page_features = None
+            for block_idx, block in enumerate(page.blocks, start=page_block_starts[page.idx]):
+                if block_idx not in body:
+                    continue
+
+                if page_features is None:
+                    page_features = self._new_table("fulltext")
+
+                extern_feature["page_height"] = page.height
+                page_features.extend(self._extract_for_fulltext(block, extern_feature))
+
+            if page_features is not None:
+                yield page, page_features
 
     def _extract_for_fulltext(self, text_block, extern_feature={}):
         font = ""
         font_size = 0
         
-        feature_list = []
+        feature_list = self._new_table("fulltext")
 
         block_info = BLOCK_INFO[0]
         max_line_len = 1
 
-        forbid_zones = extern_feature.get("forbid_zones", [])
+        forbidden_tokens, forbid_offset = self._forbidden_tokens(extern_feature.get("forbid_zones"), text_block.page)
+
+        # token在页面上的相对高度，一般直接使用整个文档一起算好的结果
+        page_height = extern_feature.get("page_height", 1.0)
+        if self.alto_doc is not None and page_height == text_block.page.height:
+            y_positions = self._token_page_positions()
+            first_idx = 0
+        else:
+            y_positions = buckets([t.vpos for line in text_block.lines for t in line.tokens], page_height, 12).tolist()
+            # 第一行可能没有token，取块中第一个token的下标
+            first_idx = next((line.tokens[0].idx for line in text_block.lines if line.tokens), 0)
 
         prev_line_start = None
 
-        for text_line in text_block.children:
+        for text_line in text_block.lines:
             line_info = LINE_INFO[0]
 
-            line_tokens = text_line.find_all("String")
+            line_tokens = text_line.tokens
+            if not line_tokens:
+                continue
 
             # 根据前后两行的开始位置判断当前行是否居中
-            cur_line_start = float(text_line.attrs["HPOS"])
+            cur_line_start = text_line.hpos
             if not prev_line_start:
                 prev_line_start = cur_line_start
 
-            average_char_width = float(line_tokens[0].attrs["WIDTH"]) / len(line_tokens[0].attrs["CONTENT"])
+            average_char_width = line_tokens[0].width / len(line_tokens[0].content)
 
             indented = False
             if prev_line_start - cur_line_start > average_char_width:
@@ -287,15 +539,14 @@ class FeatureFactory():
             align_status = "LINEINDENT" if indented else "ALIGNEDLEFT"
 
             for i, token in enumerate(line_tokens, start=1):
-                # if token_in_forbid_zones(token, forbid_zones):
-                #     # To do: Skip this feature
-                #     continue
+                if forbidden_tokens is not None and forbidden_tokens[token.idx - forbid_offset]:
+                    continue
 
                 feature_token = token
-                full_token_text = token.attrs["CONTENT"]
+                full_token_text = token.content
 
                 # 获取字体信息
-                cur_font = feature_token.attrs["STYLEREFS"]
+                cur_font = feature_token.style
                 if font != cur_font:
                     font_style = "NEWFONT"
                     font = cur_font
@@ -312,41 +563,38 @@ class FeatureFactory():
                     font_size = self.font_map[cur_font]["fontsize"]
                     font_size_style = "LOWERFONT"
 
-                token_y_pos = float(feature_token.attrs["VPOS"])
-                
+                token_y_pos = y_positions[token.idx - first_idx]
+
                 tokenized_text = tokenize(full_token_text)
                 
                 for token_text in tokenized_text:
-                    a_feature = {
-                        # features
-                        "token_text": token_text,
-                        "lower_token": token_text.lower(),
-                        "token_prefix": [token_text[:i] for i in range(1, 5)],
-                        "token_suffix": [token_text[i:] for i in range(-1, -5, -1)],
-                        "block_info": block_info,
-                        "line_info": line_info,
+                    lexical = lexical_features(token_text)
+
+                    # 按feature_cols["fulltext"]的顺序，调试信息按debug_cols["fulltext"]的顺序
+                    feature_list.append((
+                        token_text,
+                        lexical.lower,
+                        lexical.prefix,
+                        lexical.suffix,
+                        block_info,
+                        line_info,
                         # "line_pos": get_bucket_num(i, len(line_tokens), 10),
-                        "align_status": align_status,
-                        "font_type": font_style,
-                        "font_size_type": font_size_style, # 10.
-                        "font_bold": self.font_map[cur_font]["bold"], # 字体加粗
-                        "font_italics": self.font_map[cur_font]["italics"], # 字体变斜
-                        "is_captal": capital(token_text), # 大写情况
-                        "is_digital": digital(token_text), #
-                        "single_char": "1" if len(token_text)==1 else "0",
-                        "punct_info": punct(token_text), # 25. punctuation type
-                        "relative_document_position": 0, # get_bucket_num(doc_level_pos, doc_token_len, 12), # relative document position
-                        "relative_page_position_characters": get_bucket_num(token_y_pos, extern_feature.get("page_height", 1.0), 12),#get_bucket_num(page_level_pos, page_token_len, 12), # relative page position characters
-                        "bitmap_around": "0", # bitmapAround
-                        "calloutType": "UNKNOWN",
-                        "calloutKnown": 0,
-                        "superscript": self.font_map[cur_font]["superscript"],
-                        # extra info for debug
-                        "line_id": token.parent.attrs["ID"],
-                        "str_id": token.attrs["ID"],
-                    }
-
-                    feature_list.append(a_feature)
+                        align_status,
+                        font_style,
+                        font_size_style, # 10.
+                        self.font_map[cur_font]["bold"], # 字体加粗
+                        self.font_map[cur_font]["italics"], # 字体变斜
+                        lexical.capital, # 大写情况
+                        lexical.digital,
+                        lexical.single_char,
+                        lexical.punct, # 25. punctuation type
+                        0, # get_bucket_num(doc_level_pos, doc_token_len, 12), # relative document position
+                        token_y_pos, #get_bucket_num(page_level_pos, page_token_len, 12), # relative page position characters
+                        "0", # bitmapAround
+                        "UNKNOWN", # calloutType
+                        0, # calloutKnown
+                        self.font_map[cur_font]["superscript"],
+                    ), (text_line.id, token.id))
 
                     if line_info == LINE_INFO[0]:
                         line_info = LINE_INFO[1]
@@ -354,55 +602,114 @@ class FeatureFactory():
                     if block_info == BLOCK_INFO[0]:
                         block_info = BLOCK_INFO[1]
 
-            if 1 < len(text_line):
-                feature_list[-1]["line_info"] = LINE_INFO[-1] # fix line info
+            if len(feature_list) and 1 < len(text_line.tokens):
+                feature_list.set(-1, "line_info", LINE_INFO[-1]) # fix line info
 
-        if 1 < len(text_block):
-            feature_list[-1]["block_info"] = BLOCK_INFO[-1] # fix block info
+        if len(feature_list) and 1 < len(text_block.lines):
+            feature_list.set(-1, "block_info", BLOCK_INFO[-1]) # fix block info
 
         return feature_list
 
-    def _build_block_map(self, features):
-        doc_layout = self.alto_root.Layout
-
-        feature_idx = 0
+    def _token_page_positions(self):
+        """所有token在所在页上的相对高度，按AltoToken.idx索引，整个文档只算一次"""
+        if self._token_positions is None:
+            pages = self.alto_doc.pages
+            self._token_positions = token_page_positions((t.vpos for t in self.alto_doc.iter_tokens()),
+                [page.height for page in pages], [page.token_count() for page in pages]).tolist()
+
+        return self._token_positions
+
+    def _forbidden_tokens(self, forbid_zones, page=None):
+        """
+        forbid_zones(图、表、页眉等区域)内的token不参与fulltext分类，返回 (bool数组, 偏移)，
+        token是否被排除为 mask[AltoToken.idx - 偏移]，没有需要排除的token时数组为None
+        解析了整个文档时同一组zones只通过空间索引计算一次；边读边处理时只计算page这一页
+        """
+        if not forbid_zones:
+            return None, 0
+
+        zones, mask_page, mask = self._forbid_mask
+        if self.alto_doc is not None:
+            if zones is not forbid_zones:
+                mask = self.alto_file.tokens_in_zones(forbid_zones)
+                self._forbid_mask = (forbid_zones, None, mask)
+
+            return mask, 0
+
+        if zones is not forbid_zones or mask_page is not page:
+            mask = page_tokens_in_zones(page, forbid_zones)
+            self._forbid_mask = (forbid_zones, page, mask)
+
+        self._segment_layout()
+        return mask, sum(self._page_token_counts[:page.idx])
+
+    def _segment_line_ids(self):
+        """没有在本对象中抽取segment特征时，按抽取的规则找出产生特征行的TextLine"""
+        return [text_line.id for text_line in self.alto_doc.iter_lines()
+            if text_line.tokens and text_line.tokens[0].content.strip()]
+
+    def _build_block_map(self, features, line_ids=None, line_blocks=None):
+        """
+        按segment的分类结果把block分到各个部分，block中所有特征行的标签相同时才归入该标签
+        分类结果按TextLine ID对应到行，再通过line.block找到block，不再遍历整个文档
+        没有解析整个文档时通过line_blocks(默认为segment_line_blocks)对应到block，block_map中为block在文档中的下标
+        """
+        if isinstance(features, LabelSequence):
+            seg_labels = features
+        else:
+            seg_labels = LabelSequence.from_lines(features)
+
+        if self.alto_doc is not None:
+            if line_ids is None:
+                line_ids = self.segment_line_ids if self.segment_line_ids is not None else self._segment_line_ids()
+            lines = self.alto_doc.lines
+            blocks = None
+        else:
+            if line_ids is None:
+                line_ids, line_blocks = self.segment_line_ids, self.segment_line_blocks
+            if line_ids is None or line_blocks is None:
+                raise ValueError("line_ids and line_blocks are required when the document is not parsed")
+            blocks = dict(zip(line_ids, line_blocks))
+
+        block_labels = {}
+        for line_id, label_id in seg_labels.by_key(line_ids).items():
+            block = lines[line_id].block if blocks is None else blocks[line_id]
+            if block in block_labels:
+                block_labels[block].add(label_id)
+            else:
+                block_labels[block] = {label_id}
+
+        # 特征行按文档顺序排列，block_labels中的block也是文档顺序
         block_map = OrderedDict()
+        for block, label_ids in block_labels.items():
+            if len(label_ids) == 1:
+                seg_type = seg_labels.vocab[label_ids.pop()]
+                if seg_type not in block_map:
+                    block_map[seg_type] = []
 
-        for page_zone in doc_layout:
-            page = page_zone.PrintSpace
-
-            for text_block in page.children:
-                line_labels = set()
-
-                # 归并相同label的特征行，经过验证，label相同的行一定属于同一个block
-                for text_line in text_block.children:
-                    first_token = text_line.next
-                    feature_token = first_token
-                    first_token_text = first_token.attrs["CONTENT"].strip()
+                block_map[seg_type].append(block)
 
-                    if not first_token_text:
-                        continue
-
-                    label = features[feature_idx].split("\t")[1]
-                    line_labels.add(label.strip().lstrip("I-"))
-                    feature_idx += 1
+        return block_map
 
-                if len(line_labels) == 1:
-                    seg_type = line_labels.pop()
-                    if seg_type not in block_map:
-                        block_map[seg_type] = []
+def _split_pages(page_token_counts, shards):
+    """按token数把页分成最多shards段连续的页，返回range列表"""
+    total = sum(page_token_counts)
+    bounds = [0]
+    seen = 0
+    for idx, count in enumerate(page_token_counts):
+        seen += count
+        if len(bounds) < shards and seen * shards >= total * len(bounds) and idx + 1 < len(page_token_counts):
+            bounds.append(idx + 1)
 
-                    if feature_idx >= len(features):
-                        feature_idx -= 1
+    bounds.append(len(page_token_counts))
+    return [range(start, stop) for start, stop in zip(bounds, bounds[1:]) if start < stop]
 
-                    line_feature = features[feature_idx].split("\t")[0].split()
-                    rel_page_pos = line_feature[27] if len(line_feature) > 30 else "0"
-                    
-                    block_map[seg_type].append(text_block)
 
-        return block_map
+def _segment_shard(alto_path, pages, layout, page_token_counts, debug=False):
+    """在子进程中抽取一段页的segment特征，layout为整个文档的_segment_layout"""
+    ff = FeatureFactory(alto_path, debug=debug)
+    ff._layout = layout
+    ff._page_token_counts = page_token_counts
+    feature_table = ff._extract_for_segment(pages)
 
-if __name__ == '__main__':
-    ff = FeatureFactor("../tests/data/2020.emnlp-main.31.xml")
-    ff.prepare()
-    ff.build_feature()
+    return feature_table, ff.segment_line_ids, ff.segment_line_blocks, ff.segment_font_state
@@ -0,0 +1,145 @@
+from array import array
+
+import numpy as np
+
+
+def render_value(value):
+    """特征值转成wapiti特征行中的文本，list / tuple展开成多个空格分隔的字段，和vectorize一致"""
+    if isinstance(value, (list, tuple)):
+        return " ".join([str(v) for v in value])
+
+    return str(value)
+
+
+class FeatureVocab:
+    """
+    每列一个intern后的词表：相同的特征值只保存一份文本，行中只记录它的下标
+    同一文档的各页、各block的FeatureTable共用一个FeatureVocab
+
+    columns: 特征名，见feature_factory.feature_cols
+    values: 每列的特征值，下标即编码；文本在第一次用到时才生成，见texts
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.column_idx = {name: i for i, name in enumerate(columns)}
+        self.index = [{} for _ in columns]
+        self.values = [[] for _ in columns]
+        self._texts = [[] for _ in columns]
+
+    def intern(self, column, value):
+        index = self.index[column]
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(self.values[column])
+            self.values[column].append(value)
+
+        return code
+
+    def texts(self, column):
+        """第column列每个编码对应的文本"""
+        values = self.values[column]
+        texts = self._texts[column]
+        if len(texts) < len(values):
+            texts.extend(map(render_value, values[len(texts):]))
+
+        return texts
+
+    def __len__(self):
+        return sum(len(values) for values in self.values)
+
+
+class FeatureTable:
+    """
+    按列编码的特征表，每行是一个wapiti特征行
+
+    codes: int32 (行数, 列数)，第i行第j列的文本为 vocab.texts(j)[codes[i, j]]
+    debug: 可选的调试信息表，{名字: 和行对齐的list}，如 line_id / full_line / str_id；不需要时为None
+    特征行文本只在iter_rows中生成
+    """
+    def __init__(self, vocab, debug_columns=None):
+        self.vocab = vocab
+        self.debug = {name: [] for name in debug_columns} if debug_columns is not None else None
+        self._codes = array("i")
+
+    @property
+    def columns(self):
+        return self.vocab.columns
+
+    def new_table(self):
+        """共用词表的空表"""
+        debug_columns = list(self.debug) if self.debug is not None else None
+        return FeatureTable(self.vocab, debug_columns)
+
+    def append(self, values, debug=None):
+        """values为按columns顺序的特征值，debug为按debug列顺序的调试信息，关闭调试信息时被忽略"""
+        # 绝大部分特征值已经在词表中，只有出现新值时才逐列intern
+        codes = list(map(dict.get, self.vocab.index, values))
+        if None in codes:
+            codes = [self.vocab.intern(i, values[i]) if code is None else code for i, code in enumerate(codes)]
+
+        self._codes.fromlist(codes)
+
+        if self.debug is not None and debug is not None:
+            for rows, value in zip(self.debug.values(), debug):
+                rows.append(value)
+
+    def set(self, row, column, value):
+        """修改一个特征值，row可以为负数，如 -1 为最后一行"""
+        if row < 0:
+            row += len(self)
+
+        col = self.vocab.column_idx[column]
+        self._codes[row * len(self.columns) + col] = self.vocab.intern(col, value)
+
+    def set_column(self, column, values, start=0):
+        """从第start行开始依次修改一列的特征值"""
+        col = self.vocab.column_idx[column]
+        width = len(self.columns)
+        first = start * width + col
+
+        codes = array("i", [self.vocab.intern(col, value) for value in values])
+        self._codes[first:first + len(codes) * width:width] = codes
+
+    def get(self, row, column):
+        """特征值的文本"""
+        if row < 0:
+            row += len(self)
+
+        col = self.vocab.column_idx[column]
+        return self.vocab.texts(col)[self._codes[row * len(self.columns) + col]]
+
+    def extend(self, other):
+        """追加other的所有行；other使用别的词表时(如在子进程中抽取的特征)按特征值重新编码"""
+        if other.vocab is self.vocab:
+            self._codes.extend(other._codes)
+        elif len(other):
+            codes = other.codes
+            for col, values in enumerate(other.vocab.values):
+                mapping = np.array([self.vocab.intern(col, value) for value in values], dtype=np.int32)
+                codes[:, col] = mapping[codes[:, col]]
+
+            self._codes.frombytes(codes.astype(np.int32).tobytes())
+
+        if self.debug is not None:
+            for name, rows in self.debug.items():
+                rows.extend(other.debug[name] if other.debug is not None else [None] * len(other))
+
+    def __len__(self):
+        return len(self._codes) // len(self.columns)
+
+    @property
+    def codes(self):
+        return np.array(self._codes, dtype=np.int32).reshape(-1, len(self.columns))
+
+    def iter_rows(self, chunk_size=4096):
+        """生成wapiti的特征行(不带换行符)，每次只展开chunk_size行的文本"""
+        if not len(self):
+            return
+
+        codes = self.codes
+        texts = [np.array(self.vocab.texts(i), dtype=object) for i in range(len(self.columns))]
+        for start in range(0, len(codes), chunk_size):
+            chunk = codes[start:start + chunk_size]
+            columns = [column_texts[chunk[:, i]] for i, column_texts in enumerate(texts)]
+            for parts in zip(*columns):
+                yield " ".join(parts)
@@ -1,41 +1,37 @@
 import re
 
-from collections import defaultdict
-from english_words import english_words_set
-from fitz import Rect
+from functools import lru_cache
+
+from grobid.lexicon import load_lexicon
 
 spliter = re.compile("[ \n\r\t]|([,:;?.!/\(\)\-\"“”‘’'`$])")
 
 fullPunctuations = "(（[ •*,:;?.!/)）-−–‐«»„\"“”‘’'`$#@]*\u2666\u2665\u2663\u2660\u00A0";
 
+# 正则在第一次使用时才编译，见_special_pattern
 SPECIAL_PATTERN = {
-    "year": re.compile("[1,2][0-9][0-9][0-9]"),
-    "http": re.compile("http(s)?"),
-    "isDigit": re.compile("^\\d+$"),
-    "email": re.compile("""^(?:[a-zA-Z0-9_'^&amp;/+-])+(?:\\.(?:[a-zA-Z0-9_'^&amp;/+-])+)*@(?:(?:\\[?(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?))\\.){3}(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\]?)|(?:[a-zA-Z0-9-]+\\.)+(?:[a-zA-Z]){2,}\\.?)$"""),
+    "year": "[1,2][0-9][0-9][0-9]",
+    "http": "http(s)?",
+    "isDigit": "^\\d+$",
+    "email": """^(?:[a-zA-Z0-9_'^&amp;/+-])+(?:\\.(?:[a-zA-Z0-9_'^&amp;/+-])+)*@(?:(?:\\[?(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?))\\.){3}(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\]?)|(?:[a-zA-Z0-9-]+\\.)+(?:[a-zA-Z]){2,}\\.?)$""",
 }
 
-SPECIAL_SET = {
-    "month": set(["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december", "jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]),
-    "common": english_words_set,
-}
+# 词表在第一次使用时才加载，优先使用grobid/data下预编译的词表，见grobid.lexicon
+SPECIAL_SET = ("month", "common")
 
 PUNCT_TRANS = str.maketrans('“”„‟’‘•‣⁃⁌⁍∙◉◘◦☙❥❧⦾⦿∗', '""""\'\'••••••••••••••*')
 
 def token_in_forbid_zones(layout_token, forbid_zones):
-    """如果token在forbid_zone范围内，那么返回True"""
+    """如果token在forbid_zone范围内，那么返回True；批量判断见AltoFile.tokens_in_zones"""
     if not forbid_zones:
         return False
 
-    x0 = float(layout_token.attrs["HPOS"])
-    y0 = float(layout_token.attrs["VPOS"])
-    x1 = x0 + float(layout_token.attrs["HEIGHT"])
-    y1 = y0 + float(layout_token.attrs["WIDTH"])
+    x0 = layout_token.hpos
+    y0 = layout_token.vpos
+    x1 = x0 + layout_token.width
+    y1 = y0 + layout_token.height
 
-    token_zone = Rect(x0, y0, x1, y1)
-    results = (fz.intersects(token_zone) for fz in forbid_zones)
-
-    return any(results)
+    return any(fz[0] < x1 and x0 < fz[2] and fz[1] < y1 and y0 < fz[3] for fz in forbid_zones)
 
 
 def tokenize(text):
@@ -64,6 +60,16 @@ def digital(s):
     else:
         return "NODIGIT"
     
+PUNCT_MAP = {
+     "(": "OPENBRACKET",
+     ")": "ENDBRACKET",
+     ".": "DOT",
+     ",": "COMMA",
+     "-": "HYPHEN",
+     "'": "QUOTE",
+     '"': "QUOTE",
+}
+
 def punct(s):
     if len(s) != 1:
         return "NOPUNCT"
@@ -71,24 +77,15 @@ def punct(s):
     if s.isalpha() or s.isdigit():
         return "NOPUNCT"
 
-    punct_map = defaultdict(lambda : "PUNCT")
-    punct_map.update({
-         "(": "OPENBRACKET",
-         ")": "ENDBRACKET",
-         ".": "DOT",
-         ",": "COMMA",
-         "-": "HYPHEN",
-         "'": "QUOTE",
-         '"': "QUOTE",
-    })
-    return punct_map[s]
+    return PUNCT_MAP.get(s, "PUNCT")
 
 
-def build_font_feature_map(style):
+def build_font_feature_map(styles):
+    """styles为TextStyle的属性字典列表"""
     font_map = {}
-    for font in style:
-        font_map[font.attrs["ID"]] = {
-            "fontsize": int(float(font.attrs["FONTSIZE"])), # HIGHERFONT / LOWERFONT
+    for font in styles:
+        font_map[font["ID"]] = {
+            "fontsize": int(float(font["FONTSIZE"])), # HIGHERFONT / LOWERFONT
             "bold": "1" if "bold" in font.get("FONTSTYLE", "") else "0",
             "italics": "1" if "italics" in font.get("FONTSTYLE", "") else "0",
             "superscript": "1" if "superscript" in font.get("FONTSTYLE", "") else "0",
@@ -99,7 +96,7 @@ def build_font_feature_map(style):
 def vectorize(feature_order, feature_dict):
     vector = []
     for key in feature_order:
-        if type(feature_dict[key]) == list:
+        if isinstance(feature_dict[key], (list, tuple)):
             vector.extend([str(value) for value in feature_dict[key]])
         else:
             vector.append(str(feature_dict[key]))
@@ -111,11 +108,15 @@ def get_pattern(text):
     pattern = NON_PATTERN.sub("", text).lower()
     return pattern
 
+@lru_cache(maxsize=None)
+def _special_pattern(entity_type):
+    return re.compile(SPECIAL_PATTERN[entity_type])
+
 def special_pattern_test(entity_type, text):
     if entity_type not in SPECIAL_PATTERN:
         return 0
 
-    matched = SPECIAL_PATTERN[entity_type].match(text)
+    matched = _special_pattern(entity_type).match(text)
     if matched:
         return 1
     else:
@@ -126,13 +127,11 @@ def special_set_test(set_type, text):
         return 0
 
     text = text.lower()
-    return 1 if text in SPECIAL_SET[set_type] else 0
+    return 1 if text in load_lexicon(set_type) else 0
 
 def rect_contains(big_rect, small_rect):
-    big_one = Rect(*big_rect)
-    small_one = Rect(*small_rect)
-
-    if big_one.contains(small_one):
+    if big_rect[0] <= small_rect[0] and big_rect[1] <= small_rect[1] \
+        and small_rect[2] <= big_rect[2] and small_rect[3] <= big_rect[3]:
         return 1
     else:
-        return 0
\ No newline at end of file
+        return 0
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FileCache:
+    """
+    以key为文件名的磁盘缓存，条目存放在 cache_dir/<key前两位>/<key><suffix>
+
+    写入先落到临时文件再os.replace，多个进程同时读写是安全的；
+    命中时更新文件的mtime，总大小超过max_bytes时按mtime淘汰最久未使用的条目(LRU)，
+    一直淘汰到 low_water * max_bytes 以下，缓存满了之后不会每次写入都重新扫描整个目录
+    """
+    suffix = ""
+    low_water = 0.9
+
+    def __init__(self, cache_dir, max_bytes=10 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+
+    def _entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(self.suffix) or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def open_entry(self, key):
+        """命中时返回条目的只读文件对象，否则返回None"""
+        entry_path = self._entry_path(key)
+        try:
+            # 先更新mtime再打开，utime失败(条目刚被其它进程淘汰)时不会留下打开的文件
+            os.utime(entry_path)
+            f = open(entry_path, "rb")
+        except FileNotFoundError:
+            self._record(False)
+            return None
+
+        self._record(True)
+        return f
+
+    def write_entry(self, key, write):
+        """write(f)负责写入条目内容"""
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as w:
+                write(w)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self.stores += 1
+            self._total_bytes += os.path.getsize(entry_path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            # 覆盖已有条目时_total_bytes会多算，扫描之后的实际大小没有超过上限
+            self._total_bytes = total
+            return
+
+        target = self.max_bytes * self.low_water
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+        self._total_bytes = total
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+            }
@@ -0,0 +1,123 @@
+"""
+版面几何计算：正文区域、是否在正文区域内、相对位置和行长度的分桶，都是对整组block / 行 / token的numpy数组运算
+"""
+from collections import namedtuple
+
+import numpy as np
+
+
+# 奇数页和偶数页的正文区域 (x0, y0, x1, y1)，没有足够的正文block时为None
+MainAreas = namedtuple("MainAreas", ["odd", "even"])
+
+
+def as_block_array(blocks):
+    """blocks为 (页码, left, top, width, height) 的序列，返回float64 (n, 5)"""
+    return np.array(list(blocks), dtype=np.float64).reshape(-1, 5)
+
+
+def calc_main_areas(blocks, page_size):
+    """
+    blocks为 (页码, left, top, width, height)，page_size为文档的页数
+    页码、页眉这样的小block不参与计算，奇偶页分开统计左右边界，上下边界共用
+    """
+    page_number, left, top, width, height = as_block_array(blocks).T
+
+    keep = (left != 0) & (height >= 20) & (width >= 20) & (height * width >= 3000)
+    even = keep & (page_number % 2 == 0)
+    odd = keep & ~even
+
+    if not even.any() or not odd.any():
+        return MainAreas(None, None)
+
+    # 和int()一样向0取整
+    lefts = np.trunc(left).astype(np.int64)
+    rights = np.trunc(left + width).astype(np.int64)
+    page_y = int(np.trunc(top[keep]).min())
+    page_y1 = int(np.trunc(top + height)[keep].max()) + 1
+
+    odd_area = (int(lefts[odd].min()), page_y, int(rights[odd].max()) + 1, page_y1)
+    if page_size > 1:
+        even_area = (int(lefts[even].min()), page_y, int(rights[even].max()) + 1, page_y1)
+    else:
+        even_area = (0, page_y, 0, page_y1)
+
+    return MainAreas(odd_area, even_area)
+
+
+def contains(area, rects):
+    """rects (n, 4) 中每个rect是否完全在area内，返回0/1的int数组；area为None时都为0"""
+    rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+    if area is None:
+        return np.zeros(len(rects), dtype=np.int64)
+
+    inside = (area[0] <= rects[:, 0]) & (area[1] <= rects[:, 1]) & \
+        (rects[:, 2] <= area[2]) & (rects[:, 3] <= area[3])
+    return inside.astype(np.int64)
+
+
+def buckets(cur, total, bucket):
+    """
+    get_bucket_num的向量版本：int(cur * bucket / total)
+    total可以是标量或者和cur等长的数组，不能为0
+    """
+    values = np.asarray(cur, dtype=np.float64) * bucket / total
+    return values.astype(np.int64)
+
+
+def exclusive_cumsum(counts):
+    """每一项之前的累计数量，如每个block之前的token数"""
+    counts = np.asarray(counts, dtype=np.int64)
+    return np.cumsum(counts) - counts
+
+
+def block_layout(main_area, rects, block_token_counts, page_block_counts):
+    """
+    整个文档的所有block一次算出segment需要的block级特征：
+        是否在正文区域内、相对文档的位置(12个桶)、相对所在页的位置(12个桶)
+    rects为每个block的 (x0, y0, x1, y1)，page_block_counts为每页的block数
+    返回三个list，按block在文档中的顺序
+    """
+    token_counts = np.asarray(block_token_counts, dtype=np.int64)
+    page_block_counts = np.asarray(page_block_counts, dtype=np.int64)
+
+    block_pages = np.repeat(np.arange(len(page_block_counts)), page_block_counts)
+    page_token_counts = np.bincount(block_pages, weights=token_counts, minlength=len(page_block_counts)).astype(np.int64)
+
+    doc_pos = exclusive_cumsum(token_counts)
+    page_pos = doc_pos - exclusive_cumsum(page_token_counts)[block_pages]
+
+    # 没有token的页和文档不会产生特征行，分母取1避免除0
+    doc_total = max(int(token_counts.sum()), 1)
+    page_total = np.maximum(page_token_counts[block_pages], 1)
+
+    return (contains(main_area, rects).tolist(),
+        buckets(doc_pos, doc_total, 12).tolist(),
+        buckets(page_pos, page_total, 12).tolist())
+
+
+def token_page_positions(ys, page_heights, page_token_counts):
+    """所有token相对所在页的高度(12个桶)，ys为token的纵坐标，按token在文档中的顺序"""
+    ys = np.fromiter(ys, dtype=np.float64)
+    heights = np.repeat(np.asarray(page_heights, dtype=np.float64), page_token_counts)
+
+    return buckets(ys, heights, 12)
+
+
+def line_len_buckets(line_lens, block_ids):
+    """
+    每行的长度按所在block的最长行分成10个桶，block_ids为每行所在的block(相同的block连续)
+    block的最长行至少为1
+    """
+    line_lens = np.asarray(line_lens, dtype=np.int64)
+    if not len(line_lens):
+        return np.zeros(0, dtype=np.int64)
+
+    block_ids = np.asarray(block_ids)
+    new_block = np.empty(len(block_ids), dtype=bool)
+    new_block[0] = True
+    np.not_equal(block_ids[1:], block_ids[:-1], out=new_block[1:])
+
+    block_max = np.maximum.reduceat(line_lens, np.flatnonzero(new_block))
+    np.maximum(block_max, 1, out=block_max)
+
+    return buckets(line_lens, block_max[np.cumsum(new_block) - 1], 10)
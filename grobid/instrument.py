@@ -0,0 +1,210 @@
+"""
+各阶段的耗时和计数
+
+没有注册sink时，被instrumented装饰的函数只多一次列表判断；注册sink之后每次调用生成一个StageEvent：
+    stage: 阶段名，如 "parse_alto" / "wapiti" / "tei"
+    seconds: 耗时
+    counts: 数量，如 tokens / lines / blocks / rows / bytes
+    labels: 字符串标签，如 model / doc
+
+sink是接收StageEvent的函数，内置了LogSink(结构化日志)和PrometheusExporter(Prometheus文本格式)
+sink只在当前进程中生效，batch的进程池中的阶段不会上报
+"""
+import threading
+import time
+
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+
+StageEvent = namedtuple("StageEvent", ["stage", "seconds", "counts", "labels"])
+
+_sinks = []
+_current_doc = ContextVar("grobid_doc", default=None)
+
+
+def add_sink(sink):
+    if sink not in _sinks:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+    return True
+
+
+def clear_sinks():
+    del _sinks[:]
+    return True
+
+
+def enabled():
+    return bool(_sinks)
+
+
+@contextmanager
+def document(doc):
+    """在with中产生的事件都带上 labels["doc"]，用于定位慢的文档"""
+    token = _current_doc.set(doc)
+    try:
+        yield
+    finally:
+        _current_doc.reset(token)
+
+
+def emit(stage, seconds, counts=None, labels=None):
+    if not _sinks:
+        return
+
+    labels = dict(labels or {})
+    doc = _current_doc.get()
+    if doc is not None:
+        labels.setdefault("doc", str(doc))
+
+    event = StageEvent(stage, seconds, counts or {}, labels)
+    for sink in list(_sinks):
+        sink(event)
+
+
+def _emit_call(stage, start, measure, labels, result, args, kwargs):
+    seconds = time.perf_counter() - start
+    emit(stage, seconds,
+        measure(result, *args, **kwargs) if measure else None,
+        labels(*args, **kwargs) if labels else None)
+
+
+def instrumented(stage, measure=None, labels=None):
+    """
+    装饰器，measure(result, *args, **kwargs)返回counts，labels(*args, **kwargs)返回标签
+    两者都只在注册了sink时才调用
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            _emit_call(stage, start, measure, labels, result, args, kwargs)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def ainstrumented(stage, measure=None, labels=None):
+    """instrumented的协程版本"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not _sinks:
+                return await func(*args, **kwargs)
+
+            start = time.perf_counter()
+            result = await func(*args, **kwargs)
+            _emit_call(stage, start, measure, labels, result, args, kwargs)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class CallbackSink:
+    """把事件交给callback，callback的参数为 (stage, seconds, counts, labels)"""
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, event):
+        self.callback(*event)
+
+
+class LogSink:
+    """每个事件输出一行json，如 grobid.stage {"stage": "tei", "seconds": 0.01, "bytes": 1024}"""
+    def __init__(self, logger=None, level=None):
+        import logging
+
+        self.logger = logger or logging.getLogger("grobid.instrument")
+        self.level = logging.INFO if level is None else level
+
+    def __call__(self, event):
+        import json
+
+        record = {"stage": event.stage, "seconds": round(event.seconds, 6)}
+        record.update(event.labels)
+        record.update(event.counts)
+        self.logger.log(self.level, "grobid.stage %s", json.dumps(record, sort_keys=True))
+
+
+# 耗时直方图的上界(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class PrometheusExporter:
+    """
+    累计每个阶段的调用次数、耗时直方图和计数，render()输出Prometheus文本格式
+    doc标签不会导出，避免标签基数过大
+    """
+    def __init__(self, prefix="grobid", buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counts = {}
+
+    def __call__(self, event):
+        key = tuple(sorted((k, v) for k, v in event.labels.items() if k != "doc"))
+        key = (("stage", event.stage),) + key
+
+        with self._lock:
+            stage = self._stages.get(key)
+            if stage is None:
+                stage = self._stages[key] = {"calls": 0, "seconds": 0.0, "max": 0.0,
+                    "buckets": [0] * len(self.buckets)}
+
+            stage["calls"] += 1
+            stage["seconds"] += event.seconds
+            stage["max"] = max(stage["max"], event.seconds)
+            for i, bound in enumerate(self.buckets):
+                if event.seconds <= bound:
+                    stage["buckets"][i] += 1
+
+            for name, value in event.counts.items():
+                count_key = key + (("item", name),)
+                self._counts[count_key] = self._counts.get(count_key, 0) + value
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+
+    def render(self):
+        p = self.prefix
+        lines = []
+
+        with self._lock:
+            lines.append("# TYPE %s_stage_seconds histogram" % p)
+            for key, stage in sorted(self._stages.items()):
+                for bound, count in zip(self.buckets, stage["buckets"]):
+                    lines.append("%s_stage_seconds_bucket%s %d" % (p, self._labels(key, [("le", repr(float(bound)))]), count))
+                lines.append("%s_stage_seconds_bucket%s %d" % (p, self._labels(key, [("le", "+Inf")]), stage["calls"]))
+                lines.append("%s_stage_seconds_sum%s %r" % (p, self._labels(key), stage["seconds"]))
+                lines.append("%s_stage_seconds_count%s %d" % (p, self._labels(key), stage["calls"]))
+
+            lines.append("# TYPE %s_stage_seconds_max gauge" % p)
+            for key, stage in sorted(self._stages.items()):
+                lines.append("%s_stage_seconds_max%s %r" % (p, self._labels(key), stage["max"]))
+
+            lines.append("# TYPE %s_stage_items_total counter" % p)
+            for key, value in sorted(self._counts.items()):
+                lines.append("%s_stage_items_total%s %s" % (p, self._labels(key), value))
+
+        return "\n".join(lines) + "\n"
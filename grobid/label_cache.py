@@ -0,0 +1,101 @@
+import hashlib
+import os
+import threading
+
+from collections import OrderedDict
+
+from grobid.file_cache import FileCache, file_digest
+from grobid.labels import LabelSequence
+
+
+_model_digests = {}
+
+def model_digest(model_path):
+    """模型文件的sha256，按(路径, 大小, mtime)缓存，模型文件被替换后会重新计算"""
+    stat = os.stat(model_path)
+    memo_key = (model_path, stat.st_size, stat.st_mtime_ns)
+
+    if memo_key not in _model_digests:
+        _model_digests[memo_key] = file_digest(model_path)
+
+    return _model_digests[memo_key]
+
+
+class LabelFileCache(FileCache):
+    """每个条目是一个标签序列，每行一个wapiti输出的标签"""
+    suffix = ".labels"
+
+
+class LabelCache:
+    """
+    分类结果缓存，key = sha256(模型文件内容 + 特征行)
+
+    内存中按LRU保留最多max_entries个序列；cache_dir不为空时同时写入磁盘，
+    重新跑语料时，特征和模型都没有变化的文档不需要再调用wapiti
+    """
+    def __init__(self, max_entries=1024, cache_dir=None, max_bytes=1024 ** 3):
+        self.max_entries = max_entries
+        self.disk = LabelFileCache(cache_dir, max_bytes) if cache_dir else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, model_path, rows):
+        h = hashlib.sha256(model_digest(model_path).encode())
+        for row in rows:
+            h.update(row.rstrip("\r\n").encode())
+            h.update(b"\n")
+        return h.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            labels = self._entries.get(key)
+            if labels is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return labels
+
+        if self.disk is not None:
+            f = self.disk.open_entry(key)
+            if f is not None:
+                with f:
+                    labels = LabelSequence.from_labels(f.read().decode().split("\n")[:-1])
+                self._remember(key, labels)
+                with self._lock:
+                    self.hits += 1
+                return labels
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, labels):
+        with self._lock:
+            self._entries[key] = labels
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key, labels):
+        self._remember(key, labels)
+
+        if self.disk is not None:
+            content = "".join(label + "\n" for label in labels.labels()).encode()
+            self.disk.write_entry(key, lambda w: w.write(content))
+
+    def invalidate(self):
+        """模型更新后调用，清空内存中的条目；磁盘上的旧条目因为模型hash变了不会再命中，按LRU淘汰"""
+        with self._lock:
+            self._entries.clear()
+        _model_digests.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,83 @@
+# label: 标签在vocab中的下标; start: wapiti输出的标签是否带 "I-" 前缀
+LABEL_DTYPE = [("label", "i2"), ("start", "?")]
+
+
+class LabelSequence:
+    """
+    wapiti的分类结果，和输入的特征行按下标一一对应
+
+    records为LABEL_DTYPE的结构化数组，vocab为标签名列表(不带 "I-" 前缀)
+    """
+    def __init__(self, records, vocab):
+        self.records = records
+        self.vocab = vocab
+
+    @classmethod
+    def from_labels(cls, labels):
+        """labels为wapiti输出的标签，如 "I-<body>" / "<body>" """
+        vocab = []
+        vocab_ids = {}
+        label_ids = []
+        starts = []
+
+        for label in labels:
+            start = label.startswith("I-")
+            name = label[2:] if start else label
+
+            label_id = vocab_ids.get(name)
+            if label_id is None:
+                label_id = vocab_ids[name] = len(vocab)
+                vocab.append(name)
+
+            label_ids.append(label_id)
+            starts.append(start)
+
+        # numpy在第一次用到时才导入，不拖慢 `import grobid`
+        import numpy as np
+
+        records = np.empty(len(label_ids), dtype=LABEL_DTYPE)
+        records["label"] = label_ids
+        records["start"] = starts
+
+        return cls(records, vocab)
+
+    @classmethod
+    def from_lines(cls, result_lines):
+        """result_lines为wapiti输出的 "特征行\\t标签" 行，空行会被跳过"""
+        labels = (l.rstrip("\r\n").rpartition("\t")[2].strip() for l in result_lines if l.strip())
+        return cls.from_labels(labels)
+
+    def __len__(self):
+        return len(self.records)
+
+    def name(self, idx):
+        """第idx行的标签名，不带 "I-" 前缀"""
+        return self.vocab[self.records["label"][idx]]
+
+    def label(self, idx):
+        """第idx行wapiti输出的原始标签"""
+        name = self.name(idx)
+        return "I-" + name if self.records["start"][idx] else name
+
+    def by_key(self, keys):
+        """
+        keys为和特征行一一对应的键(如segment特征行的TextLine ID)，返回 {键: 标签在vocab中的下标}
+        行数和标签数不一致时(如wapiti异常退出)抛出ValueError，不做错位的对齐
+        """
+        if len(keys) != len(self):
+            raise ValueError("got %d labels for %d rows" % (len(self), len(keys)))
+
+        return dict(zip(keys, self.records["label"].tolist()))
+
+    def slice(self, start, stop):
+        """第start到stop行的标签，和原序列共用vocab"""
+        return LabelSequence(self.records[start:stop], self.vocab)
+
+    def labels(self):
+        for idx in range(len(self)):
+            yield self.label(idx)
+
+    def result_lines(self, rows):
+        """还原成wapiti的输出格式，rows为输入的特征行"""
+        for row, label in zip(rows, self.labels()):
+            yield row + "\t" + label + "\n"
@@ -0,0 +1,52 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from grobid.feature_utils import capital, digital, punct, special_pattern_test, special_set_test
+
+
+# 只和token文本有关的特征，segment和fulltext共用
+LexicalFeatures = namedtuple("LexicalFeatures", [
+    "lower", "prefix", "suffix", "capital", "digital", "single_char", "punct",
+    "common", "year", "month", "email", "http",
+])
+
+LEXICAL_CACHE_SIZE = 1 << 17
+
+
+def _compute(text):
+    return LexicalFeatures(
+        lower=text.lower(),
+        prefix=tuple(text[:i] for i in range(1, 5)),
+        suffix=tuple(text[i:] for i in range(-1, -5, -1)),
+        capital=capital(text),
+        digital=digital(text),
+        single_char="1" if len(text) == 1 else "0",
+        punct=punct(text),
+        common=special_set_test("common", text),
+        year=special_pattern_test("year", text),
+        month=special_set_test("month", text),
+        email=special_pattern_test("email", text),
+        http=special_pattern_test("http", text),
+    )
+
+
+# token的频率分布是长尾的，绝大部分token在同一进程内已经算过，缓存跨文档共享
+_cached_compute = lru_cache(maxsize=LEXICAL_CACHE_SIZE)(_compute)
+
+
+def lexical_features(text):
+    """返回text的LexicalFeatures，结果有上限为LEXICAL_CACHE_SIZE的LRU缓存"""
+    return _cached_compute(text)
+
+
+def set_lexical_cache_size(size):
+    """修改缓存大小，会清空已有的缓存"""
+    global _cached_compute
+
+    _cached_compute = lru_cache(maxsize=size)(_compute)
+    return True
+
+
+def lexical_cache_info():
+    return _cached_compute.cache_info()
+
@@ -0,0 +1,97 @@
+"""
+预编译的词表，special_set_test使用
+
+词表文件格式(小端)：
+    b"GLEX1\\n" | uint32 词数n | uint32 offsets[n+1] | 按utf-8字节排序后拼接的词
+文件通过mmap只读映射，用二分查找判断是否包含，多个进程共享同一份page cache，
+不需要在每个进程里构造一个很大的python set
+
+重新生成 grobid/data/*.lex：python -m grobid.lexicon
+"""
+import mmap
+import os
+import struct
+
+from bisect import bisect_left
+from functools import lru_cache
+
+
+MAGIC = b"GLEX1\n"
+HEADER = len(MAGIC) + 4
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december", "jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+
+def _source_words(name):
+    if name == "month":
+        return MONTHS
+
+    if name == "common":
+        from english_words import english_words_set
+
+        # special_set_test查询前会转成小写，带大写字母的词永远不会命中
+        return [w for w in english_words_set if w == w.lower()]
+
+    raise KeyError(name)
+
+
+def write_lexicon(words, path):
+    encoded = sorted(set(w.encode("utf-8") for w in words))
+
+    offsets = [0]
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as w:
+        w.write(MAGIC)
+        w.write(struct.pack("<I", len(encoded)))
+        w.write(struct.pack("<%dI" % len(offsets), *offsets))
+        w.write(b"".join(encoded))
+    os.replace(tmp_path, path)
+
+
+class CompiledLexicon:
+    """mmap映射的一个词表文件，支持 in 查询"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a compiled lexicon: %s" % path)
+
+        self._size = struct.unpack_from("<I", self._mm, len(MAGIC))[0]
+        self._blob = HEADER + 4 * (self._size + 1)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, idx):
+        start, end = struct.unpack_from("<II", self._mm, HEADER + 4 * idx)
+        return self._mm[self._blob + start:self._blob + end]
+
+    def __contains__(self, word):
+        key = word.encode("utf-8")
+        idx = bisect_left(self, key)
+        return idx < self._size and self[idx] == key
+
+
+@lru_cache(maxsize=None)
+def load_lexicon(name):
+    """优先使用预编译的词表，不存在时退回到从词表来源构造set"""
+    path = os.path.join(DATA_DIR, name + ".lex")
+    if os.path.exists(path):
+        return CompiledLexicon(path)
+
+    return frozenset(_source_words(name))
+
+
+def build_all(data_dir=DATA_DIR):
+    os.makedirs(data_dir, exist_ok=True)
+    for name in ("common", "month"):
+        write_lexicon(_source_words(name), os.path.join(data_dir, name + ".lex"))
+
+
+if __name__ == '__main__':
+    build_all()
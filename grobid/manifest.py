@@ -0,0 +1,152 @@
+"""
+批量处理的完成清单：记录每个文档(按文件内容的sha256)完成了哪些阶段、输出在哪里、在哪个阶段失败
+
+每个阶段完成后把流水线的中间状态(job)保存成检查点，中断后重新运行时，
+已经完成的文档直接返回之前的输出，未完成的文档从最后一个完成的阶段之后继续，失败的阶段重新执行
+
+清单是一个SQLite文件，只在主进程中读写；检查点和pdfalto的输出放在work_dir中
+"""
+import gzip
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from grobid.file_cache import file_digest
+
+
+def save_checkpoint(path, job):
+    """先写临时文件再os.replace，中断时不会留下不完整的检查点"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", compresslevel=1, mtime=0) as w:
+            pickle.dump(job, w, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return path
+
+
+def load_checkpoint(path):
+    with gzip.open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class CorpusManifest:
+    """
+    documents: 每个文档一行，digest为文件内容的sha256，output为最终输出的位置(json)，完成之后才有
+    stages: 每个 (文档, 阶段) 一行，status为 "done" 或 "failed"，output为该阶段的检查点，error为失败原因
+
+    同一个文件换了路径仍然是同一个文档；内容变化之后作为新的文档重新处理
+    """
+    def __init__(self, path, work_dir=None):
+        self.path = path
+        self.work_dir = work_dir or path + ".work"
+        os.makedirs(self.work_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                digest TEXT PRIMARY KEY, path TEXT, output TEXT, updated REAL);
+            CREATE TABLE IF NOT EXISTS stages (
+                digest TEXT, stage TEXT, status TEXT, output TEXT, error TEXT, attempts INTEGER, updated REAL,
+                PRIMARY KEY (digest, stage));
+        """)
+        self._conn.commit()
+
+    def document_key(self, path):
+        return file_digest(path)
+
+    def register(self, digest, path):
+        with self._conn:
+            self._conn.execute("INSERT INTO documents (digest, path, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(digest) DO UPDATE SET path = excluded.path", (digest, path, time.time()))
+
+    def output(self, digest):
+        """文档的最终输出(json解码后)，还没有完成时返回None"""
+        row = self._conn.execute("SELECT output FROM documents WHERE digest = ?", (digest,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def set_output(self, digest, output):
+        with self._conn:
+            self._conn.execute("UPDATE documents SET output = ?, updated = ? WHERE digest = ?",
+                (json.dumps(output), time.time(), digest))
+
+    def stages(self, digest):
+        """{阶段名: (status, output, error)}"""
+        rows = self._conn.execute("SELECT stage, status, output, error FROM stages WHERE digest = ?", (digest,))
+        return {stage: (status, output, error) for stage, status, output, error in rows}
+
+    def _update_stage(self, digest, stage, status, output, error):
+        with self._conn:
+            self._conn.execute("INSERT INTO stages (digest, stage, status, output, error, attempts, updated) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?) ON CONFLICT(digest, stage) DO UPDATE SET status = excluded.status, "
+                "output = excluded.output, error = excluded.error, attempts = attempts + 1, updated = excluded.updated",
+                (digest, stage, status, output, error, time.time()))
+
+    def complete(self, digest, stage, output=None):
+        self._update_stage(digest, stage, "done", output, None)
+
+    def fail(self, digest, stage, error):
+        self._update_stage(digest, stage, "failed", None, "%s: %s" % (type(error).__name__, error))
+
+    def checkpoint_dir(self, digest):
+        return os.path.join(self.work_dir, digest[:2], digest)
+
+    def alto_dir(self):
+        path = os.path.join(self.work_dir, "alto")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cleanup(self, digest, keep=()):
+        """文档完成之后删除中间的检查点和pdfalto的输出，keep中的文件保留"""
+        checkpoint_dir = self.checkpoint_dir(digest)
+        if os.path.isdir(checkpoint_dir):
+            for name in os.listdir(checkpoint_dir):
+                path = os.path.join(checkpoint_dir, name)
+                if path not in keep:
+                    os.unlink(path)
+
+        alto_dir = self.alto_dir()
+        for name in os.listdir(alto_dir):
+            if name.startswith(digest):
+                os.unlink(os.path.join(alto_dir, name))
+
+    def summary(self):
+        """每个阶段完成和失败的文档数，以及已经完成的文档数"""
+        counts = {}
+        for stage, status, count in self._conn.execute("SELECT stage, status, COUNT(*) FROM stages GROUP BY stage, status"):
+            counts.setdefault(stage, {})[status] = count
+
+        finished = self._conn.execute("SELECT COUNT(*) FROM documents WHERE output IS NOT NULL").fetchone()[0]
+        total = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {"documents": total, "finished": finished, "stages": counts}
+
+    def failures(self):
+        """[(文档路径, 阶段, 错误)]，只包含当前仍然是失败状态的阶段"""
+        return self._conn.execute("SELECT documents.path, stages.stage, stages.error FROM stages "
+            "JOIN documents USING (digest) WHERE stages.status = 'failed' ORDER BY documents.path").fetchall()
+
+    def reset(self):
+        """清空清单和work_dir"""
+        with self._conn:
+            self._conn.execute("DELETE FROM stages")
+            self._conn.execute("DELETE FROM documents")
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,189 @@
+"""
+跨文档合并分类请求：多个文档同时调用classify_rows时，把它们的特征序列用空行隔开拼成一次wapiti调用，
+每个文档只多等待很短的时间，但不再每个文档都付一次启动wapiti、加载模型的固定开销
+
+一个批次在以下任一条件满足时提交：
+    文档数达到max_documents / 特征行数达到max_rows / 批次中最早的请求已经等待了max_wait秒
+
+指标通过grobid.instrument上报：
+    label_batch: 每个批次一个事件，counts为 documents / rows，seconds为分类耗时
+    label_queue_wait: 每个请求一个事件，seconds为从提交到所在批次开始分类的时间
+"""
+import threading
+import time
+
+from collections import Counter, deque
+
+from grobid.instrument import emit
+
+
+class _Request:
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = sum(1 for r in rows if r.strip())
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    label_func(rows)为实际的分类函数，返回LabelSequence；rows中的空行分隔序列，各序列独立分类
+    concurrency为同时进行的批次数，一般和每个模型的wapiti worker数相同
+    """
+    def __init__(self, label_func, max_documents=16, max_rows=20000, max_wait=0.005, concurrency=1, name=""):
+        self.label_func = label_func
+        self.max_documents = max_documents
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._pending_rows = 0
+        self._threads = []
+        self._closed = False
+
+        # 批次大小(文档数)的分布和排队时间，见stats
+        self.batch_sizes = Counter()
+        self.batches = 0
+        self.documents = 0
+        self.rows = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _start(self):
+        while len(self._threads) < self.concurrency:
+            thread = threading.Thread(target=self._run, name="grobid-batch-%s" % self.name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def label(self, rows):
+        """提交一个文档的特征行，阻塞直到所在的批次分类完成，返回该文档的LabelSequence"""
+        request = _Request(list(rows))
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("micro batcher is closed")
+
+            self._start()
+            self._pending.append(request)
+            self._pending_rows += request.count
+            self._cond.notify_all()
+
+        request.done.wait()
+
+        # 在调用者的线程中上报，带上当前文档的标签
+        emit("label_queue_wait", request.started - request.enqueued, labels={"model": self.name})
+
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def _full(self):
+        return len(self._pending) >= self.max_documents or self._pending_rows >= self.max_rows
+
+    def _take_batch(self):
+        """在锁内调用，等到批次满了或者最早的请求到期，取出一个批次"""
+        while not self._pending:
+            if self._closed:
+                return None
+            self._cond.wait()
+
+        deadline = self._pending[0].enqueued + self.max_wait
+        while self._pending and not self._full() and not self._closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+        batch = []
+        rows = 0
+        while self._pending and len(batch) < self.max_documents:
+            # 单个文档超过max_rows时独自成为一个批次
+            if batch and rows + self._pending[0].count > self.max_rows:
+                break
+
+            request = self._pending.popleft()
+            self._pending_rows -= request.count
+            rows += request.count
+            batch.append(request)
+
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+
+            if batch is None:
+                return
+            if batch:
+                self._label_batch(batch)
+
+    def _label_batch(self, batch):
+        started = time.monotonic()
+        rows = []
+        for request in batch:
+            request.started = started
+            rows.extend(request.rows)
+            rows.append("")
+
+        try:
+            labels = self.label_func(rows)
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+
+        seconds = time.monotonic() - started
+        total = sum(request.count for request in batch)
+        emit("label_batch", seconds, {"documents": len(batch), "rows": total}, {"model": self.name})
+
+        # wapiti异常退出时结果不完整，后面的文档得到的标签会少于特征行，和单独分类时一样由调用者判断
+        start = 0
+        for request in batch:
+            request.result = labels.slice(start, start + request.count)
+            start += request.count
+
+        with self._cond:
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+            self.documents += len(batch)
+            self.rows += total
+            for request in batch:
+                wait = request.started - request.enqueued
+                self.wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+        for request in batch:
+            request.done.set()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "documents": self.documents,
+                "rows": self.rows,
+                "pending": len(self._pending),
+                "batch_sizes": dict(self.batch_sizes),
+                "mean_batch_size": self.documents / self.batches if self.batches else 0.0,
+                "mean_queue_wait": self.wait_seconds / self.documents if self.documents else 0.0,
+                "max_queue_wait": self.max_wait_seconds,
+            }
+
+    def close(self):
+        """不再接收新的请求，已经提交的请求分类完之后线程退出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
@@ -0,0 +1,263 @@
+"""
+特征文件和TEI的输出位置
+
+DirectorySink: 每个输出一个文件，和原来的目录结构一致
+ShardedSink: 大量文档的输出追加写入少量的分片文件，按大小切换分片，可以压缩，适合语料规模的批量处理
+
+两者都通过 write(doc, name, data) 写入，返回OutputRecord，之后可以用 read(doc, name) 读回单个文档的输出
+"""
+import gzip
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+
+from collections import namedtuple
+
+
+# path为输出所在的文件，offset / length为记录在文件中的字节范围(压缩时为压缩后的长度)
+OutputRecord = namedtuple("OutputRecord", ["doc", "name", "path", "offset", "length"])
+
+SHARD_FORMATS = ("jsonl", "tar")
+INDEX_NAME = "index.jsonl"
+
+_SHARD_NAME = re.compile(r"^part-(\d+)\.")
+
+
+def _as_bytes(data):
+    return data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+
+class DirectorySink:
+    """
+    每个输出写入 output_dir/<doc>.<name>，doc为空时为 output_dir/<name>
+    fsync为True时每个文件写完之后fsync；syncs为已经写完(fsync为True时已经落盘)的文件数，和ShardedSink一致
+    """
+    def __init__(self, output_dir, fsync=False):
+        self.output_dir = output_dir
+        self.fsync = fsync
+        self.syncs = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _path(self, doc, name):
+        return os.path.join(self.output_dir, "%s.%s" % (doc, name) if doc else name)
+
+    def write(self, doc, name, data):
+        data = _as_bytes(data)
+        path = self._path(doc, name)
+        with open(path, "wb") as w:
+            w.write(data)
+            if self.fsync:
+                w.flush()
+                os.fsync(w.fileno())
+
+        self.syncs += 1
+        return OutputRecord(doc, name, path, 0, len(data))
+
+    def read(self, doc, name):
+        path = self._path(doc, name)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as f:
+            return f.read()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardedSink:
+    """
+    输出追加写入 output_dir/part-<序号>.<格式>，当前分片超过max_shard_bytes后切换到下一个分片
+
+    format: "jsonl" 每条记录一行 {"doc", "name", "data"}；"tar" 每条记录一个tar成员 <doc>/<name>
+    compress: 为True时每条记录单独压缩成一个gzip member(tar中为 <doc>/<name>.gz)，
+        jsonl分片整个文件仍然可以直接用zcat / gzip.open读取，同时单条记录可以按偏移解压
+    sync_every / sync_bytes: 写入这么多条记录或字节后才flush并fsync一次，
+        index.jsonl只在fsync之后追加，索引中的记录一定已经落盘
+
+    重新打开已有的目录时从下一个序号开始新的分片，不追加到可能不完整的旧分片上；
+    index.jsonl中同一个 (doc, name) 以最后一条为准
+    """
+    def __init__(self, output_dir, format="jsonl", compress=True, max_shard_bytes=256 * 1024 ** 2,
+                 sync_every=64, sync_bytes=16 * 1024 ** 2):
+        if format not in SHARD_FORMATS:
+            raise ValueError("unknown shard format: %s" % format)
+
+        self.output_dir = output_dir
+        self.format = format
+        self.compress = compress
+        self.max_shard_bytes = max_shard_bytes
+        self.sync_every = sync_every
+        self.sync_bytes = sync_bytes
+
+        self.records = 0
+        self.syncs = 0
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._tar = None
+        self._shard_path = None
+        self._shard_bytes = 0
+        self._pending = []
+        self._pending_bytes = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._index_path = os.path.join(output_dir, INDEX_NAME)
+        self.index = self._load_index()
+
+        shards = [int(m.group(1)) for m in map(_SHARD_NAME.match, os.listdir(output_dir)) if m]
+        self._next_shard = max(shards) + 1 if shards else 0
+
+    def _load_index(self):
+        index = {}
+        if not os.path.exists(self._index_path):
+            return index
+
+        with open(self._index_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 写索引时中断，最后一行不完整
+                    continue
+                index[(entry["doc"], entry["name"])] = OutputRecord(entry["doc"], entry["name"],
+                    os.path.join(self.output_dir, entry["path"]), entry["offset"], entry["length"])
+
+        return index
+
+    def _open_shard(self):
+        suffix = self.format + (".gz" if self.compress and self.format == "jsonl" else "")
+        self._shard_path = os.path.join(self.output_dir, "part-%05d.%s" % (self._next_shard, suffix))
+        self._next_shard += 1
+        self._shard_bytes = 0
+
+        self._file = open(self._shard_path, "wb", buffering=1024 ** 2)
+        if self.format == "tar":
+            self._tar = tarfile.open(fileobj=self._file, mode="w", format=tarfile.PAX_FORMAT)
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+
+        if self._tar is not None:
+            # 写入tar的结束块
+            self._tar.close()
+            self._tar = None
+
+        self._sync()
+        self._file.close()
+        self._file = None
+
+    def _encode(self, doc, name, data):
+        if self.format == "jsonl":
+            line = json.dumps({"doc": doc, "name": name, "data": data.decode("utf-8")}, ensure_ascii=False) + "\n"
+            data = line.encode("utf-8")
+
+        return gzip.compress(data, mtime=0) if self.compress else data
+
+    def _append(self, doc, name, payload):
+        """写入分片，返回payload在分片中的偏移"""
+        if self.format == "jsonl":
+            offset = self._file.tell()
+            self._file.write(payload)
+            return offset
+
+        info = tarfile.TarInfo("%s/%s%s" % (doc, name, ".gz" if self.compress else ""))
+        info.size = len(payload)
+        self._tar.addfile(info, io.BytesIO(payload))
+        # 成员的数据按512字节对齐，结束位置之前就是数据
+        return self._tar.offset - -(-len(payload) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+    def write(self, doc, name, data):
+        payload = self._encode(doc, name, _as_bytes(data))
+
+        with self._lock:
+            if self._file is not None and self._shard_bytes >= self.max_shard_bytes:
+                self._close_shard()
+            if self._file is None:
+                self._open_shard()
+
+            offset = self._append(doc, name, payload)
+            record = OutputRecord(doc, name, self._shard_path, offset, len(payload))
+
+            self._shard_bytes += len(payload)
+            self._pending.append(record)
+            self._pending_bytes += len(payload)
+            self.index[(doc, name)] = record
+            self.records += 1
+
+            if len(self._pending) >= self.sync_every or self._pending_bytes >= self.sync_bytes:
+                self._sync()
+
+        return record
+
+    def _sync(self):
+        """在锁内调用：数据落盘之后再追加索引"""
+        if not self._pending:
+            return
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        with open(self._index_path, "a") as w:
+            for record in self._pending:
+                w.write(json.dumps({"doc": record.doc, "name": record.name,
+                    "path": os.path.basename(record.path), "offset": record.offset, "length": record.length}) + "\n")
+            w.flush()
+            os.fsync(w.fileno())
+
+        self._pending = []
+        self._pending_bytes = 0
+        self.syncs += 1
+
+    def read(self, doc, name):
+        """按索引读回一条记录的原始内容，不存在时返回None"""
+        with self._lock:
+            record = self.index.get((doc, name))
+            if record is None:
+                return None
+            if record.path == self._shard_path:
+                self._file.flush()
+
+        with open(record.path, "rb") as f:
+            f.seek(record.offset)
+            payload = f.read(record.length)
+
+        if self.compress:
+            payload = gzip.decompress(payload)
+        if self.format == "jsonl":
+            payload = json.loads(payload.decode("utf-8"))["data"].encode("utf-8")
+
+        return payload
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            self._close_shard()
+
+    def stats(self):
+        with self._lock:
+            return {"records": self.records, "syncs": self.syncs, "shards": self._next_shard,
+                "indexed": len(self.index)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,406 @@
+"""
+常驻的本地HTTP服务：词表、模型和常驻的wapiti worker在启动时加载一次，之后的请求直接使用
+
+    POST /process   请求体为PDF或ALTO文件，也可以是multipart/form-data中的文件(字段名为input)，返回TEI；
+                    ?format=json 返回build_tei_json的结果
+    GET  /health    json：状态、排队和处理中的文档数
+    GET  /metrics   Prometheus文本格式，各阶段的耗时见instrument.PrometheusExporter
+
+同时处理workers个文档，最多再排队queue_size个，队列满时直接返回429(Retry-After)，请求体不再读取
+
+python -m grobid.server --port 8070 --model-path models --workers 2 --queue-size 16 --label-workers 2
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import tempfile
+import time
+
+from collections import Counter
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from grobid import aio, cmd_utils
+from grobid.instrument import PrometheusExporter, add_sink, emit, remove_sink
+
+_classifier = importlib.import_module("grobid.classifier")
+
+# 请求行和请求头的长度上限
+MAX_HEADER_BYTES = 64 * 1024
+
+OUTPUT_FORMATS = ("tei", "json")
+
+# 路径 -> 允许的方法
+ROUTES = {"/process": "POST", "/health": "GET", "/metrics": "GET"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message="", headers=()):
+        super().__init__(message or status.phrase)
+        self.status = status
+        self.headers = headers
+
+
+def warm_up():
+    """导入特征抽取和TEI模块、加载词表和模型、启动常驻的wapiti worker，第一个请求不再付这些开销"""
+    import grobid.feature_factory
+    import grobid.tei_builder
+
+    from grobid.feature_utils import SPECIAL_SET
+    from grobid.lexicon import load_lexicon
+
+    for name in SPECIAL_SET:
+        load_lexicon(name)
+
+    for model_type in _classifier.wapiti_model_map:
+        if _classifier.label_backend == "crf":
+            _classifier._get_crf_model(model_type)
+        elif _classifier.worker_pool_size > 0:
+            _classifier._get_worker_pool(model_type).start()
+
+    return True
+
+
+def _upload_content(headers, body):
+    """请求体就是文件内容，或者是multipart/form-data，取其中名为input的文件(没有时取第一个文件)"""
+    content_type = headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        return body
+
+    from email.parser import BytesParser
+    from email.policy import HTTP
+
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid multipart body")
+
+    files = [part for part in message.iter_parts() if part.get_filename() is not None]
+    for part in files:
+        if part.get_param("name", header="content-disposition") == "input":
+            return part.get_payload(decode=True)
+
+    if not files:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "no file in the multipart body")
+
+    return files[0].get_payload(decode=True)
+
+
+def _response(status, content_type, body, headers=()):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
+    head = ["HTTP/1.1 %d %s" % (status.value, status.phrase),
+            "Content-Type: %s" % content_type,
+            "Content-Length: %d" % len(body),
+            "Connection: close"]
+    head.extend("%s: %s" % header for header in headers)
+
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+class GrobidServer:
+    """
+    workers: 同时处理的文档数
+    queue_size: 排队等待处理的文档数上限，满了之后返回429，至少为1(asyncio.Queue(0)不限长度)
+    executor: 特征抽取和TEI生成的执行器，见aio.aprocess_pdf，默认为事件循环的线程池
+    low_memory: 特征抽取逐页读取ALTO，见FeatureFactory的low_memory
+    max_upload: 请求体的字节数上限，超过时返回413
+    """
+    def __init__(self, host="127.0.0.1", port=8070, workers=1, queue_size=16, executor=None,
+                 low_memory=False, max_upload=100 * 1024 ** 2):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = executor
+        self.low_memory = low_memory
+        self.max_upload = max_upload
+
+        self.metrics = PrometheusExporter()
+        self.responses = Counter()
+        self.in_flight = 0
+        self.started = None
+
+        self._queue = None
+        self._tasks = []
+        self._server = None
+        self._upload_dir = None
+
+    async def start(self):
+        await asyncio.to_thread(warm_up)
+        add_sink(self.metrics)
+
+        self._upload_dir = tempfile.TemporaryDirectory(prefix="grobid_upload_")
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_HEADER_BYTES)
+
+        # port为0时由系统分配
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started = time.monotonic()
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        remove_sink(self.metrics)
+        self._upload_dir.cleanup()
+
+    async def _worker(self):
+        while True:
+            path, output_format, future = await self._queue.get()
+            self.in_flight += 1
+            try:
+                # 调用方已经断开时(见_submit)不再处理
+                if not future.done():
+                    result = await aio.aprocess_pdf(path, executor=self.executor, low_memory=self.low_memory,
+                        output_format=output_format)
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                os.remove(path)
+                self._queue.task_done()
+
+    def _save_upload(self, content):
+        # aprocess_pdf按扩展名区分PDF和ALTO
+        suffix = ".pdf" if content.startswith(b"%PDF") else ".xml"
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self._upload_dir.name)
+        with os.fdopen(fd, "wb") as w:
+            w.write(content)
+
+        return path
+
+    def _check_queue(self):
+        if self._queue.full():
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "queue is full", [("Retry-After", "1")])
+
+    async def _handle(self, reader, writer):
+        start = time.perf_counter()
+        path = ""
+        status = None
+        try:
+            try:
+                method, url, headers = await self._read_head(reader)
+                path = url.path
+                status, content_type, body = await self._dispatch(method, url, headers, reader, writer)
+                extra = ()
+            except HTTPError as e:
+                status, content_type, body, extra = e.status, "application/json", json.dumps({"error": str(e)}), e.headers
+
+            self.responses[status.value] += 1
+            writer.write(_response(status, content_type, body, extra))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+        # 连接中断时没有状态码
+        emit("server_request", time.perf_counter() - start,
+            labels={"path": path if path in ROUTES else "other", "status": str(status.value) if status else "none"})
+
+    async def _read_head(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        return parts[0], urlsplit(parts[1]), headers
+
+    async def _read_body(self, headers, reader, writer):
+        if "transfer-encoding" in headers:
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "chunked uploads are not supported")
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+
+        if length > self.max_upload:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+
+        return await reader.readexactly(length) if length else b""
+
+    async def _dispatch(self, method, url, headers, reader, writer):
+        if url.path not in ROUTES:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        if method != ROUTES[url.path]:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, headers=[("Allow", ROUTES[url.path])])
+
+        if url.path == "/health":
+            return HTTPStatus.OK, "application/json", json.dumps(self.health())
+        if url.path == "/metrics":
+            return HTTPStatus.OK, "text/plain; version=0.0.4", self.render_metrics()
+
+        output_format = parse_qs(url.query).get("format", ["tei"])[0]
+        if output_format not in OUTPUT_FORMATS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "format must be one of %s" % ", ".join(OUTPUT_FORMATS))
+
+        # 队列满时不读取请求体，尽早拒绝
+        self._check_queue()
+        content = _upload_content(headers, await self._read_body(headers, reader, writer))
+        if not content:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "empty upload")
+
+        result = await self._submit(content, output_format, reader)
+        if output_format == "json":
+            return HTTPStatus.OK, "application/json", json.dumps(result, ensure_ascii=False)
+
+        return HTTPStatus.OK, "application/xml; charset=utf-8", result
+
+    async def _submit(self, content, output_format, reader):
+        self._check_queue()
+        path = await asyncio.to_thread(self._save_upload, content)
+        future = asyncio.get_running_loop().create_future()
+
+        try:
+            self._queue.put_nowait((path, output_format, future))
+        except asyncio.QueueFull:
+            os.remove(path)
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "queue is full", [("Retry-After", "1")])
+
+        await self._wait_done(future, reader)
+        try:
+            return future.result()
+        except Exception as e:
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "%s: %s" % (type(e).__name__, e))
+
+    async def _wait_done(self, future, reader):
+        """请求体已经读完，之后读到EOF说明客户端断开了，取消还在排队的文档"""
+        while True:
+            disconnected = asyncio.ensure_future(reader.read(1))
+            try:
+                await asyncio.wait([future, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                disconnected.cancel()
+
+            if future.done():
+                return
+            # 不是EOF时是请求之后多发的数据，忽略
+            if not disconnected.result():
+                future.cancel()
+                raise ConnectionResetError("client disconnected")
+
+    def health(self):
+        return {
+            "status": "ok",
+            "queued": self._queue.qsize(),
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "workers": self.workers,
+            "uptime": time.monotonic() - self.started,
+            "responses": {str(k): v for k, v in sorted(self.responses.items())},
+            "label_backend": _classifier.label_backend,
+            "label_workers": _classifier.worker_pool_size,
+        }
+
+    def render_metrics(self):
+        p = self.metrics.prefix
+        lines = [
+            "# TYPE %s_server_queued gauge" % p,
+            "%s_server_queued %d" % (p, self._queue.qsize()),
+            "# TYPE %s_server_in_flight gauge" % p,
+            "%s_server_in_flight %d" % (p, self.in_flight),
+            "# TYPE %s_server_responses_total counter" % p,
+        ]
+        lines.extend('%s_server_responses_total{status="%d"} %d' % (p, status, count)
+            for status, count in sorted(self.responses.items()))
+
+        return self.metrics.render() + "\n".join(lines) + "\n"
+
+
+async def serve(**kwargs):
+    server = await GrobidServer(**kwargs).start()
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def _noop():
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve PDF / ALTO to TEI conversion over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8070)
+    parser.add_argument("--model-path", help="directory of seg_model.wapiti and fulltext_model.wapiti")
+    parser.add_argument("--pdfalto", help="path of the pdfalto binary")
+    parser.add_argument("--wapiti", help="path of the wapiti binary")
+    parser.add_argument("--label-backend", choices=["wapiti", "crf"], default="wapiti")
+    parser.add_argument("--label-workers", type=int, default=1, help="resident wapiti processes per model")
+    parser.add_argument("--workers", type=int, default=1, help="documents processed at the same time")
+    parser.add_argument("--queue-size", type=int, default=16, help="documents waiting before returning 429")
+    parser.add_argument("--processes", type=int, default=0, help="run feature extraction in a process pool")
+    parser.add_argument("--low-memory", action="store_true")
+    parser.add_argument("--max-upload-mb", type=float, default=100)
+    args = parser.parse_args()
+
+    if args.pdfalto:
+        cmd_utils.alto_path = args.pdfalto
+    if args.wapiti:
+        cmd_utils.wapiti_path = args.wapiti
+    if args.model_path:
+        _classifier.set_model_path(args.model_path)
+
+    _classifier.set_label_backend(args.label_backend)
+    _classifier.set_worker_pool_size(args.label_workers)
+
+    executor = None
+    if args.processes:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=args.processes)
+        # fork方式的进程池在第一次submit时fork出全部worker，要在warm_up启动wapiti worker之前完成，
+        # 否则子进程会继承wapiti stdin的写端，关闭worker时wapiti读不到EOF
+        executor.submit(_noop).result()
+
+    try:
+        asyncio.run(serve(host=args.host, port=args.port, workers=args.workers, queue_size=args.queue_size,
+            executor=executor, low_memory=args.low_memory, max_upload=int(args.max_upload_mb * 1024 ** 2)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import numpy as np
+
+
+def as_rect_array(rects):
+    """rects可以是 (x0, y0, x1, y1) 元组或者fitz.Rect，返回float32 (n, 4)"""
+    return np.array([tuple(r) for r in rects], dtype=np.float32).reshape(-1, 4)
+
+
+class GridIndex:
+    """
+    均匀网格索引，bboxes为float32 (n, 4)
+
+    每个bbox登记到它覆盖的所有格子里，格子到bbox的映射用CSR格式存储(cell_starts, cell_items)；
+    查询时先取出候选，再用numpy做精确的相交判断
+    """
+    def __init__(self, bboxes, cells_per_side=32):
+        self.bboxes = bboxes
+        n = len(bboxes)
+
+        if n:
+            self.origin = bboxes[:, :2].min(axis=0)
+            extent = bboxes[:, 2:].max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(2, dtype=np.float32)
+            extent = np.ones(2, dtype=np.float32)
+
+        self.cell_size = np.maximum(extent / cells_per_side, 1.0)
+        self.shape = (np.floor(extent / self.cell_size).astype(np.int64) + 1)
+
+        cx0, cy0 = self._cells(bboxes[:, 0], bboxes[:, 1])
+        cx1, cy1 = self._cells(bboxes[:, 2], bboxes[:, 3])
+
+        # 把每个bbox展开成它覆盖的 (格子, bbox) 对
+        nx = cx1 - cx0 + 1
+        ny = cy1 - cy0 + 1
+        counts = nx * ny
+        items = np.repeat(np.arange(n), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = (cy0[items] + local // nx[items]) * self.shape[0] + cx0[items] + local % nx[items]
+
+        order = np.argsort(cells, kind="stable")
+        self.cell_items = items[order]
+        self.cell_starts = np.searchsorted(cells[order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def _cells(self, x, y):
+        cx = np.clip(((x - self.origin[0]) // self.cell_size[0]).astype(np.int64), 0, self.shape[0] - 1)
+        cy = np.clip(((y - self.origin[1]) // self.cell_size[1]).astype(np.int64), 0, self.shape[1] - 1)
+        return cx, cy
+
+    def _candidates(self, rect):
+        (cx0, cx1), (cy0, cy1) = self._cells(np.array([rect[0], rect[2]]), np.array([rect[1], rect[3]]))
+        chunks = []
+        for cy in range(cy0, cy1 + 1):
+            row = cy * self.shape[0]
+            chunks.append(self.cell_items[self.cell_starts[row + cx0]:self.cell_starts[row + cx1 + 1]])
+
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(chunks))
+
+    def query(self, rect):
+        """返回和rect有非空交集的bbox下标(和fitz.Rect.intersects一致，只接触边界不算)"""
+        if not len(self) or rect[0] >= rect[2] or rect[1] >= rect[3]:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = self._candidates(rect)
+        boxes = self.bboxes[candidates]
+        hit = (boxes[:, 0] < rect[2]) & (rect[0] < boxes[:, 2]) & \
+            (boxes[:, 1] < rect[3]) & (rect[1] < boxes[:, 3])
+        return candidates[hit]
+
+    def within(self, rect):
+        """返回完全落在rect内的bbox下标"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+
+        candidates = self._candidates(rect)
+        boxes = self.bboxes[candidates]
+        hit = (rect[0] <= boxes[:, 0]) & (rect[1] <= boxes[:, 1]) & \
+            (boxes[:, 2] <= rect[2]) & (boxes[:, 3] <= rect[3])
+        return candidates[hit]
+
+    def intersects_any(self, rects):
+        """批量判断：每个bbox是否和rects中任意一个相交，返回bool数组"""
+        mask = np.zeros(len(self), dtype=bool)
+        for rect in rects:
+            mask[self.query(rect)] = True
+        return mask
+
+
+class PageSpatialIndex:
+    """一页的token和行的网格索引，下标为该页内的下标，加上token_offset / line_offset即为文档内下标"""
+    def __init__(self, token_bbox, line_bbox, token_offset=0, line_offset=0):
+        self.tokens = GridIndex(token_bbox)
+        self.lines = GridIndex(line_bbox)
+        self.token_offset = token_offset
+        self.line_offset = line_offset
+
+    def tokens_in_rect(self, rect):
+        return self.tokens.query(rect) + self.token_offset
+
+    def lines_in_rect(self, rect):
+        return self.lines.query(rect) + self.line_offset
+
+    def tokens_in_zones(self, zones):
+        return self.tokens.intersects_any(zones)
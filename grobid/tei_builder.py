@@ -1,7 +1,9 @@
-import os
 import re
-from bs4 import BeautifulSoup
 from collections import namedtuple
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from grobid.instrument import instrumented
 
 Tag = namedtuple('Tag', ['Head', "Priority",'Tail'])
 
@@ -16,48 +18,35 @@ label_map = {
     "<equation_label>": Tag("<formula>", 5, "</formula>"),
 }
 
-def compose_tag(tag_words):
-    fulltext = " ".join(tag_words)
-    fulltext = fulltext.replace(" TOK_CONJ ", "").replace(" - ", "")
-    return fulltext
-
-
-def fix_head_number(root):
-    head_number = re.compile("\d+( \. \d+)?")
+TAG_PATTERN = re.compile(r'<(/?)(\w+)([^>]*)>')
+ATTR_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+HEAD_NUMBER = re.compile(r"\d+( \. \d+)?")
 
-    for head in root.find_all("head"):
-        matched = head_number.match(head.string.strip())
-
-        if not matched:
-            continue
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
 
-        matched_content = matched.group(0)
-        head.string = head.string.replace(matched_content, "")
-        head.attrs["n"] = matched_content.replace(" ", "")
 
-    return root
+@lru_cache(maxsize=None)
+def _split_tags(tag_str):
+    return tuple(("tag", m.group(0)) for m in TAG_PATTERN.finditer(tag_str))
 
 
-def build_tei_body(fulltext_result_path):
-    output_words = ["<div>"]
+def _iter_words(fulltext_result):
+    """按标签栈生成输出的标签和词，("tag", 标签) / ("word", 词)"""
+    yield from _split_tags("<div>")
 
     cur_state = ""
     stack = ["<part>"]
 
-    with open(fulltext_result_path) as f:
-        fulltext_result = f.readlines()
-
     for l in fulltext_result:
         cols = l.strip().split("\t")
         if len(cols) != 2:
-            print(cols)
             continue
 
         feature, label = cols
         feature_cols = feature.split(" ")
         token = feature_cols[0]
         conj_pos = feature_cols[11]
-        
+
         # label 标准化，如果label 不在规定范围内，就不输出
         label_start = False
         if label.startswith("I-"):
@@ -72,16 +61,13 @@ def build_tei_body(fulltext_result_path):
 
         if len(stack) == 0:
             stack.append("<part>")
-            output_words.append("<div>")
-            # output_words.append(label_map[label][0])
-
-            # stack.append(label)
+            yield from _split_tags("<div>")
         else:
             if stack[-1] == label:
                 if label_start:
-                    output_words.append(label_map[label].Tail)
-                    output_words.append(label_map[label].Head)
-                output_words.append(token)
+                    yield from _split_tags(label_map[label].Tail)
+                    yield from _split_tags(label_map[label].Head)
+                yield ("word", token)
             else:
                 # 比较优先级
                 prev_tag = label_map[stack[-1]]
@@ -90,12 +76,12 @@ def build_tei_body(fulltext_result_path):
                 if cur_tag.Priority < prev_tag.Priority:
                     stack.append(label)
 
-                    output_words.append(cur_tag.Head)
-                    output_words.append(token)
+                    yield from _split_tags(cur_tag.Head)
+                    yield ("word", token)
                 else:
                     while cur_tag.Priority > prev_tag.Priority:
                         stack.pop()
-                        output_words.append(prev_tag.Tail)
+                        yield from _split_tags(prev_tag.Tail)
 
                         if len(stack):
                             prev_tag = label_map[stack[-1]]
@@ -104,22 +90,273 @@ def build_tei_body(fulltext_result_path):
 
                     if stack and stack[-1] != label:
                         stack.append(label)
-                        output_words.append(cur_tag.Head)
+                        yield from _split_tags(cur_tag.Head)
+
+                    yield ("word", token)
+
+
+def _drop_joined(pairs, word):
+    """
+    pairs为 (前面的分隔符, atom)，去掉两边都是空格的word，以及它两边的空格
+    和 " ".join(...).replace(" %s " % word, "") 的结果一致
+    """
+    prev = None
+    for sep, atom in pairs:
+        if prev is not None:
+            if prev[0] == " " and sep == " " and prev[1] == ("word", word):
+                sep = ""
+            else:
+                yield prev
+        prev = (sep, atom)
+
+    if prev is not None:
+        yield prev
+
+
+def _iter_soup_events(pairs):
+    """
+    把标签和词转成 ("start", 标签名, 属性) / ("text", 文本) / ("end", 标签名) 事件
+    标签不一定配对，按原来BeautifulSoup(xml)的容错方式处理：结束标签和当前标签不一致时也只关闭当前标签，
+    根节点关闭后的内容丢弃
+    """
+    stack = []
+    text = []
+
+    for sep, (kind, value) in pairs:
+        text.append(sep)
+        if kind == "word":
+            text.append(value)
+            continue
+
+        text = "".join(text)
+        if text and stack:
+            yield ("text", text)
+        text = []
+
+        close, name, attrs = TAG_PATTERN.match(value).groups()
+        if close:
+            if stack:
+                yield ("end", stack.pop())
+            if not stack:
+                return
+        else:
+            stack.append(name)
+            yield ("start", name, dict(ATTR_PATTERN.findall(attrs)))
+
+    text = "".join(text)
+    if text and stack:
+        yield ("text", text)
+
+    while stack:
+        yield ("end", stack.pop())
+
+
+def _node_string(node):
+    # 和bs4的Tag.string一致：只有一个子节点时才有值
+    children = node[2]
+    if len(children) != 1:
+        return None
+
+    if isinstance(children[0], str):
+        return children[0]
+
+    return _node_string(children[0])
+
+
+def fix_head_number(head):
+    """head为 [标签名, 属性, 子节点]，把标题开头的编号移到属性n中"""
+    string = _node_string(head)
+    if string is None:
+        return head
+
+    matched = HEAD_NUMBER.match(string.strip())
+    if not matched:
+        return head
+
+    matched_content = matched.group(0)
+    head[2][:] = [string.replace(matched_content, "")]
+    head[1]["n"] = matched_content.replace(" ", "")
+
+    return head
+
+
+def _iter_node_events(node):
+    yield ("start", node[0], node[1])
+    for child in node[2]:
+        if isinstance(child, str):
+            yield ("text", child)
+        else:
+            yield from _iter_node_events(child)
+    yield ("end", node[0])
+
 
-                    output_words.append(token)
+def _fix_heads(events):
+    """只缓存当前<head>内的事件，标题结束时完成编号的标准化后再输出"""
+    events = iter(events)
+
+    for event in events:
+        if event[0] != "start" or event[1] != "head":
+            yield event
+            continue
+
+        head = [event[1], event[2], []]
+        stack = [head]
+        for event in events:
+            if event[0] == "start":
+                node = [event[1], event[2], []]
+                stack[-1][2].append(node)
+                stack.append(node)
+            elif event[0] == "text":
+                stack[-1][2].append(event[1])
+            else:
+                stack.pop()
+                if not stack:
+                    break
+
+        nodes = [head]
+        while nodes:
+            node = nodes.pop()
+            if node[0] == "head":
+                fix_head_number(node)
+            nodes.extend(reversed([c for c in node[2] if not isinstance(c, str)]))
+
+        yield from _iter_node_events(head)
+
+
+def iter_tei_events(fulltext_result):
+    """
+    fulltext_result为fulltext模型输出的行，逐行生成TEI事件：
+    ("start", 标签名, 属性) / ("text", 文本) / ("end", 标签名)
+    """
+    pairs = (("" if i == 0 else " ", atom) for i, atom in enumerate(_iter_words(fulltext_result)))
+    pairs = _drop_joined(_drop_joined(pairs, "TOK_CONJ"), "-")
+
+    return _fix_heads(_iter_soup_events(pairs))
+
+
+def _open_result(fulltext_result):
+    if isinstance(fulltext_result, str):
+        with open(fulltext_result) as f:
+            yield from f
+    else:
+        yield from fulltext_result
+
+
+def write_tei(fulltext_result, write, pretty=True):
+    """
+    边读fulltext结果边输出TEI，write为写入字符串的函数，如文件的write
+    pretty为True时和原来prettify()的格式一致，否则不缩进不换行；
+    文本中的 & < > 转义成实体，属性值还会转义双引号，输出总是合法的xml
+    """
+    newline = "\n" if pretty else ""
+    depth = 0
+    pending = None  # 还不知道是否有子节点的开始标签
+
+    write(XML_DECLARATION)
+
+    for event in iter_tei_events(_open_result(fulltext_result)):
+        indent = " " * depth if pretty else ""
+
+        if event[0] == "end":
+            depth -= 1
+            if pending is not None:
+                write(pending + "/>" + newline)
+                pending = None
+            else:
+                write(indent[:-1] + "</%s>" % event[1] + newline)
+            continue
+
+        if pending is not None:
+            write(pending + ">" + newline)
+            pending = None
+
+        if event[0] == "start":
+            attrs = "".join(' %s="%s"' % (k, escape(v, {'"': "&quot;"})) for k, v in event[2].items())
+            pending = indent + "<" + event[1] + attrs
+            depth += 1
+        else:
+            text = event[1].strip()
+            if text:
+                write(indent + escape(text) + newline)
+
+    if not pretty:
+        write("\n")
+
+
+@instrumented("tei", lambda tei, *args, **kwargs: {"bytes": len(tei)})
+def build_tei_body(fulltext_result_path, pretty=True):
+    """fulltext_result_path为fulltext模型输出文件的路径，也可以直接传入输出行"""
+    parts = []
+    write_tei(fulltext_result_path, parts.append, pretty)
+
+    return "".join(parts)
+
+
+@instrumented("tei_json", lambda result, *args: {"sections": len(result["sections"])})
+def build_tei_json(fulltext_result_path):
+    """
+    不生成xml，直接返回章节和段落：
+    {"sections": [{"head": 标题, "n": 编号, "paragraphs": [段落文本]}]}
+    不在<p>中的正文也作为段落
+    """
+    sections = []
+    section_stack = []
+    elements = []
+    head = None
+    paragraph = None
+
+    def close_paragraph():
+        if paragraph and section_stack:
+            section_stack[-1]["paragraphs"].append(" ".join(paragraph))
+        return None
+
+    for event in iter_tei_events(_open_result(fulltext_result_path)):
+        if event[0] == "start":
+            name = event[1]
+            elements.append(name)
+
+            if name in ("div", "head", "p"):
+                paragraph = close_paragraph()
+
+            if name == "div":
+                section = {"head": None, "n": None, "paragraphs": []}
+                sections.append(section)
+                section_stack.append(section)
+            elif name == "head":
+                head = []
+                if section_stack:
+                    section_stack[-1]["n"] = event[2].get("n")
+            elif name == "p":
+                paragraph = []
+        elif event[0] == "text":
+            words = event[1].split()
+            if not words:
+                continue
+
+            if head is not None:
+                head.extend(words)
+            else:
+                if paragraph is None:
+                    paragraph = []
+                paragraph.extend(words)
+        else:
+            name = elements.pop()
+            if name == "head":
+                if section_stack:
+                    section_stack[-1]["head"] = " ".join(head)
+                head = None
+            elif name in ("p", "div"):
+                paragraph = close_paragraph()
 
-    tei_content = compose_tag(output_words)
+            if name == "div":
+                section_stack.pop()
 
-    bs = BeautifulSoup(tei_content, 'xml')
-    updated_bs = fix_head_number(bs)
-    pretty_xml = updated_bs.prettify()
+    return {"sections": [s for s in sections if s["head"] is not None or s["paragraphs"]]}
 
-    return pretty_xml
 
 if __name__ == '__main__':
     import sys
     result_path = sys.argv[1]
-    xml_content = build_tei_body(result_path)
 
     with open("test.tei.xml", "w+") as w:
-        w.write(xml_content)
+        write_tei(result_path, w.write)
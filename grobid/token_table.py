@@ -0,0 +1,115 @@
+import sys
+
+import numpy as np
+
+
+class TokenTable:
+    """
+    按列存储的token表，所有token只存一份
+
+    words: 字符串已intern的object数组
+    bbox: float32 (n, 4)，x0, y0, x1, y1
+    page_ids / block_ids / line_ids: int32，block和line的原始ID见block_names / line_names
+    page_offsets: 第i页的token为 [page_offsets[i], page_offsets[i+1])
+    line_bbox / line_offsets: 行的bbox，按页的划分同上
+    """
+    def __init__(self, words, bbox, page_ids, block_ids, line_ids, block_names, line_names, page_offsets, page_sizes,
+                 line_bbox, line_offsets):
+        self.words = words
+        self.bbox = bbox
+        self.page_ids = page_ids
+        self.block_ids = block_ids
+        self.line_ids = line_ids
+        self.block_names = block_names
+        self.line_names = line_names
+        self.page_offsets = page_offsets
+        self.page_sizes = page_sizes
+        self.line_bbox = line_bbox
+        self.line_offsets = line_offsets
+        self.labels = np.full(len(words), None, dtype=object)
+
+    @classmethod
+    def from_document(cls, alto_doc):
+        return cls.from_pages(alto_doc.pages)
+
+    @classmethod
+    def from_pages(cls, pages, first_page_id=1):
+        """pages为AltoPage列表，first_page_id为第一页的页码(从1开始)"""
+        words = []
+        coords = []
+        page_ids = []
+        block_ids = []
+        line_ids = []
+        block_names = []
+        line_names = []
+        page_offsets = [0]
+        page_sizes = []
+        line_coords = []
+        line_offsets = [0]
+
+        for page_id, page in enumerate(pages, start=first_page_id):
+            for block in page.blocks:
+                block_id = len(block_names)
+                block_names.append(block.id)
+
+                for line in block.lines:
+                    line_id = len(line_names)
+                    line_names.append(line.id)
+                    line_coords.extend(line.rect())
+
+                    for token in line.tokens:
+                        words.append(sys.intern(token.content))
+                        coords.extend((token.hpos, token.vpos, token.hpos + token.width, token.vpos + token.height))
+                        page_ids.append(page_id)
+                        block_ids.append(block_id)
+                        line_ids.append(line_id)
+
+            page_offsets.append(len(words))
+            line_offsets.append(len(line_names))
+            page_sizes.append((page.width, page.height))
+
+        word_array = np.empty(len(words), dtype=object)
+        word_array[:] = words
+
+        return cls(
+            words=word_array,
+            bbox=np.array(coords, dtype=np.float32).reshape(-1, 4),
+            page_ids=np.array(page_ids, dtype=np.int32),
+            block_ids=np.array(block_ids, dtype=np.int32),
+            line_ids=np.array(line_ids, dtype=np.int32),
+            block_names=block_names,
+            line_names=line_names,
+            page_offsets=np.array(page_offsets, dtype=np.int64),
+            page_sizes=np.array(page_sizes, dtype=np.float32).reshape(-1, 2),
+            line_bbox=np.array(line_coords, dtype=np.float32).reshape(-1, 4),
+            line_offsets=np.array(line_offsets, dtype=np.int64),
+        )
+
+    def __len__(self):
+        return len(self.words)
+
+    def page_count(self):
+        return len(self.page_offsets) - 1
+
+    def page_slice(self, page_idx):
+        """page_idx从0开始"""
+        return slice(int(self.page_offsets[page_idx]), int(self.page_offsets[page_idx + 1]))
+
+    def line_slice(self, page_idx):
+        return slice(int(self.line_offsets[page_idx]), int(self.line_offsets[page_idx + 1]))
+
+    def page(self, page_idx):
+        """返回某一页的列视图，不拷贝数据"""
+        s = self.page_slice(page_idx)
+        return {
+            'words': self.words[s],
+            'bbox': self.bbox[s],
+            'block_ids': self.block_ids[s],
+            'line_ids': self.line_ids[s],
+            'page_id': self.page_ids[s],
+            'labels': self.labels[s],
+        }
+
+    def pages(self):
+        for page_idx in range(self.page_count()):
+            yield self.page(page_idx)
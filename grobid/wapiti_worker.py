@@ -0,0 +1,154 @@
+import os
+import queue
+import subprocess
+import threading
+
+from grobid import cmd_utils
+from grobid.instrument import instrumented
+
+
+class WapitiError(RuntimeError):
+    pass
+
+
+def split_sequences(lines):
+    """wapiti用空行分隔不同的序列"""
+    sequence = []
+    for l in lines:
+        row = l.rstrip("\r\n")
+        if row.strip():
+            sequence.append(row)
+        elif sequence:
+            yield sequence
+            sequence = []
+
+    if sequence:
+        yield sequence
+
+
+class WapitiWorker:
+    """
+    常驻的 `wapiti label -m model` 进程，模型只加载一次
+
+    协议和wapiti的文本格式一致：向stdin写入一个序列(每行一个特征行，空行结束)，
+    从stdout读回同样行数的 "特征行\\t标签"，以及一个结束序列的空行
+    """
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._proc = subprocess.Popen(
+            [cmd_utils.wapiti_path, "label", "-m", self.model_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            encoding="utf-8",
+        )
+
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def close(self):
+        if self._proc is None:
+            return
+
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+            proc.wait()
+
+    def _label_once(self, rows):
+        if not self.alive():
+            self.start()
+
+        self._proc.stdin.write("\n".join(rows) + "\n\n")
+        self._proc.stdin.flush()
+
+        results = []
+        for _ in rows:
+            result_line = self._proc.stdout.readline()
+            if not result_line:
+                raise WapitiError("wapiti worker exited while labeling (model: %s)" % self.model_path)
+            results.append(result_line)
+
+        # 序列结束的空行
+        self._proc.stdout.readline()
+
+        return results
+
+    @instrumented("wapiti_worker", lambda results, self, rows: {"rows": len(results)},
+        lambda self, rows: {"model": os.path.basename(self.model_path)})
+    def label(self, rows):
+        """rows为一个序列的特征行，返回wapiti的输出行。进程崩溃时重启并重试一次"""
+        if not rows:
+            return []
+
+        with self._lock:
+            try:
+                return self._label_once(rows)
+            except (OSError, WapitiError):
+                self.close()
+
+            try:
+                return self._label_once(rows)
+            except (OSError, WapitiError):
+                self.close()
+                raise
+
+
+class WapitiPool:
+    """同一个模型的多个常驻worker，按需启动，最多size个"""
+    def __init__(self, model_path, size=1):
+        self.model_path = model_path
+        self.size = size
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._workers) < self.size:
+                worker = WapitiWorker(self.model_path)
+                self._workers.append(worker)
+                return worker
+
+        return self._idle.get()
+
+    def start(self):
+        """预先启动全部worker，第一次分类时不再等待wapiti启动和加载模型"""
+        with self._lock:
+            while len(self._workers) < self.size:
+                worker = WapitiWorker(self.model_path)
+                worker.start()
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+    def label(self, rows):
+        worker = self._acquire()
+        try:
+            return worker.label(rows)
+        finally:
+            self._idle.put(worker)
+
+    def label_lines(self, lines):
+        results = []
+        for sequence in split_sequences(lines):
+            results.extend(self.label(sequence))
+
+        return results
+
+    def close(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.close()
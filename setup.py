@@ -6,7 +6,8 @@ setup(
         description='GROBID is a machine learning library for extracting, parsing and re-structuring raw documents such as PDF into structured XML/TEI encoded documents with a particular focus on technical and scientific publications.',   # 简单描述
         author='moonscar',
         install_requires=[
-                "bs4",
-                "english-words==1.1.0"],
+                "english-words==1.1.0",
+                "numpy"],
         packages=["grobid"],
+        package_data={"grobid": ["data/*.lex"]},
 )
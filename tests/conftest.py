@@ -0,0 +1,48 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from grobid import cmd_utils
+
+from benchmarks import synthetic_alto
+
+
+# grobid.classifier这个名字在grobid包中是classifier函数
+classifier = importlib.import_module("grobid.classifier")
+
+STUB_DIR = os.path.join(ROOT, "tests", "stubs")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: 运行时间较长，可以用 -m \"not slow\" 跳过")
+
+
+@pytest.fixture
+def stub_tools(tmp_path, monkeypatch):
+    """pdfalto和wapiti换成tests/stubs中的脚本，模型文件为空文件，返回模型目录"""
+    monkeypatch.setattr(cmd_utils, "alto_path", os.path.join(STUB_DIR, "pdfalto"))
+    monkeypatch.setattr(cmd_utils, "wapiti_path", os.path.join(STUB_DIR, "wapiti"))
+
+    model_dir = tmp_path / "models"
+    model_dir.mkdir()
+    for model_type, model_name in list(classifier.wapiti_model_map.items()):
+        (model_dir / os.path.basename(model_name)).write_bytes(b"")
+        monkeypatch.setitem(classifier.wapiti_model_map, model_type, model_name)
+
+    classifier.set_model_path(str(model_dir))
+    yield model_dir
+    classifier.close_worker_pools()
+
+
+@pytest.fixture
+def alto_docs(tmp_path):
+    """几个不同的合成ALTO文档，文件名以 .pdf 结尾，经过stub pdfalto"""
+    doc_dir = tmp_path / "docs"
+    doc_dir.mkdir()
+    return [synthetic_alto.write_alto(str(doc_dir / ("doc%d.pdf" % seed)), pages=2, blocks=3, lines=3, seed=seed)
+        for seed in range(4)]
@@ -0,0 +1,20 @@
+import os
+import shutil
+
+from grobid.batch import process_corpus
+
+
+def test_output_dir_same_file_names(stub_tools, alto_docs, tmp_path):
+    """a/paper.pdf 和 b/paper.pdf 写入同一个output_dir，不会互相覆盖"""
+    paths = []
+    for sub, src in zip("ab", alto_docs):
+        os.makedirs(str(tmp_path / sub))
+        paths.append(shutil.copy(src, str(tmp_path / sub / "paper.pdf")))
+
+    plain = [r.tei for r in process_corpus(paths, workers=1)]
+    assert plain[0] != plain[1]
+
+    results = list(process_corpus(paths, output_dir=str(tmp_path / "out"), workers=1))
+    assert results[0].tei != results[1].tei
+    assert all(os.path.basename(r.tei).startswith("paper-") for r in results)
+    assert [open(r.tei).read() for r in results] == plain
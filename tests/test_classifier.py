@@ -0,0 +1,95 @@
+import importlib
+
+from grobid import instrument
+
+from benchmarks.stub_labeler import label_segment
+
+
+classifier = importlib.import_module("grobid.classifier")
+
+ROWS = ["Table a b", "The c d", "Figure e f"]
+
+
+def test_classifier_emits_one_event(stub_tools, tmp_path, monkeypatch):
+    # 开启缓存时classifier委托给classify_rows
+    monkeypatch.setattr(classifier, "label_cache", None)
+    classifier.set_label_cache(max_entries=16)
+    feature_path = tmp_path / "doc.segment.feature"
+    feature_path.write_text("\n".join(ROWS) + "\n")
+
+    events = []
+    sink = events.append
+    instrument.add_sink(sink)
+    try:
+        assert classifier.classifier("segment", str(feature_path)) == label_segment(ROWS)
+        classifier_events = [e for e in events if e.stage == "classifier"]
+        assert len(classifier_events) == 1
+        assert classifier_events[0].counts["rows"] == len(ROWS)
+
+        del events[:]
+        assert list(classifier.classify_rows("segment", ROWS).labels()) == \
+            [l.rstrip("\n").split("\t")[1] for l in label_segment(ROWS)]
+        assert [e.stage for e in events if e.stage == "classifier"] == ["classifier"]
+    finally:
+        instrument.remove_sink(sink)
+
+
+def test_label_cache_key(stub_tools):
+    from grobid.label_cache import LabelCache
+
+    cache = LabelCache()
+    model_path = str(stub_tools / "seg_model.wapiti")
+
+    key = cache.key(model_path, ROWS)
+    assert cache.key(model_path, [r + "\n" for r in ROWS]) == key
+    assert cache.key(model_path, ROWS[:2]) != key
+    assert cache.key(model_path, ROWS[1:] + ROWS[:1]) != key
+
+    # 模型文件的内容变化之后key也变化
+    with open(model_path, "wb") as w:
+        w.write(b"retrained")
+    assert cache.key(model_path, ROWS) != key
+
+
+def test_label_cache_invalidated_by_set_model_path(stub_tools, tmp_path, monkeypatch):
+    log_file = tmp_path / "starts"
+    monkeypatch.setenv("STUB_WAPITI_LOG", str(log_file))
+    monkeypatch.setattr(classifier, "label_cache", None)
+    cache = classifier.set_label_cache(max_entries=16)
+
+    def wapiti_runs():
+        return len(log_file.read_text().split()) if log_file.exists() else 0
+
+    expected = list(classifier.classify_rows("segment", ROWS).labels())
+    assert wapiti_runs() == 1
+    assert list(classifier.classify_rows("segment", ROWS).labels()) == expected
+    assert wapiti_runs() == 1
+    assert cache.stats()["hits"] == 1
+
+    other_dir = tmp_path / "other_models"
+    other_dir.mkdir()
+    for name in ("seg_model.wapiti", "fulltext_model.wapiti"):
+        (other_dir / name).write_bytes(b"other model")
+    classifier.set_model_path(str(other_dir))
+
+    assert cache.stats()["entries"] == 0
+    assert list(classifier.classify_rows("segment", ROWS).labels()) == expected
+    assert wapiti_runs() == 2
+
+
+def test_label_cache_disk_roundtrip(stub_tools, tmp_path):
+    from grobid.label_cache import LabelCache
+    from grobid.labels import LabelSequence
+
+    labels = LabelSequence.from_labels(["I-<header>", "<header>", "I-<body>"])
+    cache = LabelCache(cache_dir=str(tmp_path / "labels"))
+    key = cache.key(str(stub_tools / "seg_model.wapiti"), ROWS)
+    cache.put(key, labels)
+
+    # 新的缓存对象只能从磁盘读到
+    reopened = LabelCache(cache_dir=str(tmp_path / "labels"))
+    restored = reopened.get(key)
+    assert list(restored.labels()) == list(labels.labels())
+    assert reopened.stats()["hits"] == 1 and reopened.stats()["entries"] == 1
+    assert reopened.get("0" * 64) is None
+    assert reopened.stats()["misses"] == 1
@@ -0,0 +1,86 @@
+import itertools
+
+import pytest
+
+from grobid.crf import Pattern, WapitiModel, WapitiModelError
+
+
+def _str(value):
+    return "%d:%s,\n" % (len(value.encode("utf-8")), value)
+
+
+def write_model(path, weights):
+    """两个标签A / B，unigram模板 u:%x[0,0] 和bigram模板 b，weights为 {特征下标: 权重}"""
+    observations = ["u:x", "u:y", "b"]
+    lines = ["#mdl#2#%d\n" % len(weights), "#rdr#2/1/0\n", _str("u:%x[0,0]"), _str("b"),
+        "#qrk#2\n", _str("A"), _str("B"), "#qrk#%d\n" % len(observations)] + [_str(o) for o in observations]
+    # 权重和wapiti一样用%a十六进制浮点数
+    lines += ["%d=%s\n" % (idx, float(w).hex()) for idx, w in sorted(weights.items())]
+    path.write_text("".join(lines))
+    return str(path)
+
+
+# 特征下标：u:x -> 0(A) 1(B)，u:y -> 2(A) 3(B)，b -> 4 + y' * 2 + y
+WEIGHTS = {0: 1.0, 3: 0.5, 5: -2.0}
+
+
+def brute_force(weights, tokens):
+    """枚举所有标签序列，返回分数最高的(和viterbi一样取第一个最大值)"""
+    unigram = {"x": 0, "y": 2}
+
+    def score(path):
+        s = sum(weights.get(unigram[tok] + y, 0.0) for tok, y in zip(tokens, path))
+        s += sum(weights.get(4 + a * 2 + b, 0.0) for a, b in zip(path, path[1:]))
+        return s
+
+    paths = list(itertools.product(range(2), repeat=len(tokens)))
+    best = max(score(p) for p in paths)
+    return [p for p in paths if score(p) == best][0]
+
+
+def test_load(tmp_path):
+    model = WapitiModel.load(write_model(tmp_path / "tiny.wapiti", WEIGHTS))
+
+    assert model.labels == ["A", "B"]
+    assert model.uoff.tolist() == [0, 2, -1]
+    assert model.boff.tolist() == [-1, -1, 4]
+    assert model.theta.tolist() == [1.0, 0.0, 0.0, 0.5, 0.0, -2.0, 0.0, 0.0]
+
+
+def test_viterbi_uses_transitions(tmp_path):
+    model = WapitiModel.load(write_model(tmp_path / "tiny.wapiti", WEIGHTS))
+
+    # 逐个位置取最大是 A B A，A -> B 的转移代价让整条路径为 A A A
+    assert model.label(["x", "y", "x"]) == ["A", "A", "A"]
+    assert model.label(["y", "y"]) == ["B", "B"]
+    assert model.label(["y"]) == ["B"]
+    assert model.label([]) == []
+
+
+def test_label_rows_splits_sequences(tmp_path):
+    model = WapitiModel.load(write_model(tmp_path / "tiny.wapiti", WEIGHTS))
+    rows = ["x f", "y f", "x f", "", "y f", "y f\n", "\n"]
+    assert model.label_rows(rows) == ["A", "A", "A", "B", "B"]
+
+
+@pytest.mark.parametrize("tokens", ["xyx", "yxy", "xxyyx", "yyyxy", "x"])
+def test_viterbi_matches_brute_force(tmp_path, tokens):
+    weights = {0: 0.3, 1: 0.1, 2: -0.4, 3: 0.7, 4: 0.2, 5: -0.6, 6: 0.5, 7: -0.1}
+    model = WapitiModel.load(write_model(tmp_path / "tiny.wapiti", weights))
+    assert tuple(model.viterbi([[t] for t in tokens])) == brute_force(weights, tokens)
+
+
+def test_pattern_out_of_range():
+    tokens = [["a", "1"], ["b", "2"]]
+    assert Pattern("U:%x[-1,0]/%x[0,1]").apply(tokens, 0) == "U:_x-1/1"
+    assert Pattern("U:%x[1,0]").apply(tokens, 1) == "U:_x+1"
+    assert Pattern("U:%t[0,0,\"^\\d\"]").apply(tokens, 0) == "U:false"
+
+
+def test_rejects_truncated_model(tmp_path):
+    path = tmp_path / "tiny.wapiti"
+    write_model(path, WEIGHTS)
+    path.write_text(path.read_text().rsplit("\n", 2)[0] + "\n")
+
+    with pytest.raises(WapitiModelError):
+        WapitiModel.load(str(path))
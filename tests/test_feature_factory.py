@@ -0,0 +1,97 @@
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from grobid.feature_factory import FeatureFactory, _split_pages
+
+from benchmarks import synthetic_alto
+from benchmarks.stub_labeler import label_segment
+
+
+DOC = dict(pages=3, blocks=4, lines=4, tokens=6, fonts=3, seed=5)
+
+
+def _rows(alto_path, low_memory=False):
+    ff = FeatureFactory(alto_path, low_memory=low_memory)
+    ff.prepare()
+    ff.build_segment_feature(dump=False)
+    segment = list(ff.iter_feature_rows("segment"))
+    ff.build_fulltext_feature(label_segment(segment), dump=False)
+    return segment, list(ff.iter_feature_rows("fulltext"))
+
+
+@pytest.fixture
+def alto_pair(tmp_path):
+    """
+    同一个合成文档，第二个文件中多行的TextBlock都以一个空的TextLine开头
+    单行的块不加，空行也算块的行数，会改变BLOCKSTART/BLOCKEND
+    """
+    text = "".join(synthetic_alto.iter_alto(**DOC))
+    empty_line = '<TextLine ID="empty" HPOS="10.000" VPOS="10.000" HEIGHT="10.000" WIDTH="10.000"></TextLine>'
+
+    def add_empty_line(m):
+        if m.group(2).count("<TextLine ") < 2:
+            return m.group(0)
+        return m.group(1) + empty_line + m.group(2)
+
+    patched = re.sub(r"(<TextBlock [^>]*>)(.*?</TextBlock>)", add_empty_line, text)
+    assert patched.count(empty_line) > 1
+
+    plain_path = tmp_path / "plain.xml"
+    plain_path.write_text(text)
+    patched_path = tmp_path / "patched.xml"
+    patched_path.write_text(patched)
+    return str(plain_path), str(patched_path)
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_block_starting_with_empty_line(alto_pair, low_memory):
+    plain_path, patched_path = alto_pair
+    segment, fulltext = _rows(plain_path, low_memory)
+
+    assert fulltext
+    assert _rows(patched_path, low_memory) == (segment, fulltext)
+
+
+@pytest.fixture(scope="module")
+def process_pool():
+    with ProcessPoolExecutor(4) as pool:
+        yield pool
+
+
+def _segment_state(ff):
+    return list(ff.iter_feature_rows("segment")), list(ff.segment_line_ids), list(ff.segment_line_blocks)
+
+
+@pytest.mark.parametrize("shards", [1, 2, 3, 5, 9, 20])
+def test_sharded_segment_matches_serial(tmp_path, process_pool, shards):
+    # 字体多，分段的边界上NEWFONT / HIGHERFONT等字体状态需要按前一段重新计算
+    alto_path = synthetic_alto.write_alto(str(tmp_path / "doc.xml"), pages=12, blocks=5, lines=4, tokens=6,
+        fonts=6, seed=11)
+
+    serial = FeatureFactory(alto_path)
+    serial.prepare()
+    serial.build_segment_feature(dump=False)
+    segment = list(serial.iter_feature_rows("segment"))
+
+    sharded = FeatureFactory(alto_path)
+    sharded.prepare()
+    sharded.build_segment_feature(dump=False, executor=process_pool, shards=shards)
+
+    assert _segment_state(sharded) == _segment_state(serial)
+
+    labels = label_segment(segment)
+    serial.build_fulltext_feature(labels, dump=False)
+    sharded.build_fulltext_feature(labels, dump=False)
+    assert list(sharded.iter_feature_rows("fulltext")) == list(serial.iter_feature_rows("fulltext"))
+
+
+@pytest.mark.parametrize("shards", [1, 2, 3, 5, 9, 20])
+def test_split_pages(shards):
+    counts = [30, 0, 5, 120, 40, 40, 0, 7, 60, 1, 90, 22]
+    ranges = _split_pages(counts, shards)
+
+    assert len(ranges) <= shards
+    assert [page for r in ranges for page in r] == list(range(len(counts)))
@@ -0,0 +1,41 @@
+import os
+
+from grobid.file_cache import FileCache
+
+
+def _put(cache, key, size):
+    cache.write_entry(key, lambda w: w.write(b"x" * size))
+
+
+def test_evicts_down_to_low_water(tmp_path, monkeypatch):
+    cache = FileCache(str(tmp_path), max_bytes=1000)
+    for i in range(10):
+        _put(cache, "%02d" % i + "k" * 30, 100)
+        os.utime(cache._entry_path("%02d" % i + "k" * 30), (i, i))
+
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+
+    _put(cache, "10" + "k" * 30, 100)
+    assert len(scans) == 1
+    assert cache.stats()["bytes"] <= 900
+    # 最旧的条目先被淘汰，新写入的保留
+    assert not os.path.exists(cache._entry_path("00" + "k" * 30))
+    assert os.path.exists(cache._entry_path("10" + "k" * 30))
+
+    # 淘汰到低水位之后，下一次写入不需要扫描
+    _put(cache, "11" + "k" * 30, 50)
+    assert len(scans) == 1
+
+
+def test_open_entry_miss_after_eviction(tmp_path):
+    cache = FileCache(str(tmp_path))
+    _put(cache, "ab" + "k" * 30, 10)
+
+    with cache.open_entry("ab" + "k" * 30) as f:
+        assert f.read() == b"x" * 10
+
+    os.unlink(cache._entry_path("ab" + "k" * 30))
+    assert cache.open_entry("ab" + "k" * 30) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
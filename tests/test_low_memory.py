@@ -0,0 +1,37 @@
+import pytest
+
+from grobid.feature_factory import FeatureFactory
+
+from benchmarks import synthetic_alto
+from benchmarks.memory_ceiling import measure
+from benchmarks.stub_labeler import label_segment
+
+
+def _rows(alto_path, low_memory):
+    ff = FeatureFactory(alto_path, low_memory=low_memory)
+    ff.prepare()
+    ff.build_segment_feature(dump=False)
+    segment = list(ff.iter_feature_rows("segment"))
+    ff.build_fulltext_feature(label_segment(segment), dump=False)
+    return segment, list(ff.iter_feature_rows("fulltext"))
+
+
+@pytest.mark.parametrize("seed", [0, 7])
+def test_low_memory_matches_parsed(tmp_path, seed):
+    alto_path = synthetic_alto.write_alto(str(tmp_path / "doc.xml"), pages=6, blocks=5, lines=4, tokens=8,
+        fonts=5, seed=seed)
+
+    segment, fulltext = _rows(alto_path, low_memory=False)
+
+    assert segment and fulltext
+    assert _rows(alto_path, low_memory=True) == (segment, fulltext)
+
+
+@pytest.mark.slow
+def test_low_memory_peak_ceiling(tmp_path):
+    alto_path = synthetic_alto.write_alto(str(tmp_path / "doc.xml"), pages=2000)
+
+    peak, _, rows = measure(alto_path, low_memory=True)
+
+    assert rows > 0
+    assert peak < 64 * 1024 ** 2
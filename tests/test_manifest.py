@@ -0,0 +1,146 @@
+import importlib
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import textwrap
+
+from grobid import batch
+from grobid.batch import process_corpus
+from grobid.manifest import CorpusManifest, load_checkpoint, save_checkpoint
+from grobid.output_sink import ShardedSink
+
+from conftest import ROOT, STUB_DIR
+
+
+classifier = importlib.import_module("grobid.classifier")
+
+
+def _attempts(manifest):
+    return dict(manifest._conn.execute("SELECT stage, SUM(attempts) FROM stages GROUP BY stage"))
+
+
+def test_checkpoint_roundtrip(tmp_path):
+    path = save_checkpoint(str(tmp_path / "a" / "tei.pkl.gz"), {"tei": "<tei/>", "idx": 3})
+    assert load_checkpoint(path) == {"tei": "<tei/>", "idx": 3}
+    assert os.listdir(str(tmp_path / "a")) == ["tei.pkl.gz"]
+
+
+def test_finished_documents_are_not_processed_again(stub_tools, alto_docs, tmp_path):
+    plain = [r.tei for r in process_corpus(alto_docs, workers=1)]
+
+    with CorpusManifest(str(tmp_path / "manifest.db")) as manifest:
+        assert [r.tei for r in process_corpus(alto_docs, workers=1, manifest=manifest)] == plain
+        assert [r.tei for r in process_corpus(alto_docs, workers=1, manifest=manifest)] == plain
+        assert set(_attempts(manifest).values()) == {len(alto_docs)}
+        assert manifest.summary()["finished"] == len(alto_docs)
+
+
+def test_failed_stage_is_retried(stub_tools, alto_docs, tmp_path, monkeypatch):
+    plain = [r.tei for r in process_corpus(alto_docs, workers=2)]
+    manifest = CorpusManifest(str(tmp_path / "manifest.db"))
+
+    # 第一个分类的wapiti进程异常退出
+    crash_file = tmp_path / "crash"
+    crash_file.write_text("")
+    monkeypatch.setenv("STUB_WAPITI_CRASH", str(crash_file))
+    results = list(process_corpus(alto_docs, workers=2, manifest=manifest))
+    failed = [r.path for r in results if r.error is not None]
+    assert len(failed) == 1
+    assert [(path, stage) for path, stage, _ in manifest.failures()] == [(failed[0], "segment_labels")]
+
+    # 重新运行时第一个执行的是线程池中的分类阶段，进程池的worker必须已经fork好了
+    children = []
+    label_segment = batch.STAGE_FUNCS["segment_labels"]
+
+    def record_children(job):
+        children.append(len(multiprocessing.active_children()))
+        return label_segment(job)
+
+    monkeypatch.setitem(batch.STAGE_FUNCS, "segment_labels", record_children)
+    results = list(process_corpus(alto_docs, workers=2, manifest=manifest))
+    assert [r.tei for r in results] == plain
+    assert children and children[0] >= 2
+
+    assert manifest.failures() == []
+    attempts = _attempts(manifest)
+    assert attempts["segment_features"] == len(alto_docs)
+    assert attempts["segment_labels"] == len(alto_docs) + 1
+    manifest.close()
+
+
+KILLED_RUN = textwrap.dedent("""
+    import importlib, os, signal, sys
+    sys.path.insert(0, {root!r})
+    from grobid import cmd_utils
+    from grobid.batch import process_corpus
+    from grobid.manifest import CorpusManifest
+    from grobid.output_sink import ShardedSink
+
+    cmd_utils.alto_path = os.path.join({stubs!r}, "pdfalto")
+    cmd_utils.wapiti_path = os.path.join({stubs!r}, "wapiti")
+    importlib.import_module("grobid.classifier").set_model_path({models!r})
+
+    # 所有阶段都已经完成，在记录第一个输出之前被终止
+    CorpusManifest.set_output = lambda *args: os.kill(os.getpid(), signal.SIGKILL)
+
+    manifest = CorpusManifest({manifest!r})
+    sink = ShardedSink({shards!r}, sync_every=1000) if {use_sink!r} else None
+    for result in process_corpus({paths!r}, workers=1, manifest=manifest, sink=sink):
+        pass
+""")
+
+
+def _killed_run(tmp_path, models, paths, use_sink):
+    script = KILLED_RUN.format(root=ROOT, stubs=STUB_DIR, models=str(models), manifest=str(tmp_path / "manifest.db"),
+        shards=str(tmp_path / "shards"), use_sink=use_sink, paths=paths)
+    proc = subprocess.run([sys.executable, "-c", script], timeout=300)
+    assert proc.returncode == -signal.SIGKILL
+
+
+def test_resume_after_kill(stub_tools, alto_docs, tmp_path):
+    plain = [r.tei for r in process_corpus(alto_docs, workers=1)]
+
+    _killed_run(tmp_path, stub_tools, alto_docs, use_sink=False)
+    with CorpusManifest(str(tmp_path / "manifest.db")) as manifest:
+        assert manifest.summary()["finished"] == 0
+        assert manifest.summary()["stages"]["tei"]["done"] >= 1
+
+        results = list(process_corpus(alto_docs, workers=1, manifest=manifest))
+        assert [r.error for r in results] == [None] * len(alto_docs)
+        assert [r.tei for r in results] == plain
+
+        # 只重新执行了tei阶段
+        attempts = _attempts(manifest)
+        assert attempts["fulltext_labels"] == len(alto_docs)
+        assert attempts["tei"] > len(alto_docs)
+
+
+def test_resume_after_kill_before_sink_sync(stub_tools, alto_docs, tmp_path):
+    plain = [r.tei for r in process_corpus(alto_docs, workers=1)]
+
+    _killed_run(tmp_path, stub_tools, alto_docs, use_sink=True)
+    with CorpusManifest(str(tmp_path / "manifest.db")) as manifest, ShardedSink(str(tmp_path / "shards")) as sink:
+        assert manifest.summary()["stages"]["tei"]["done"] == len(alto_docs)
+
+        results = list(process_corpus(alto_docs, workers=1, manifest=manifest, sink=sink))
+        assert [r.error for r in results] == [None] * len(alto_docs)
+        assert [sink.read(r.tei.doc, "tei.xml").decode("utf-8") for r in results] == plain
+        assert _attempts(manifest)["fulltext_labels"] == len(alto_docs)
+
+
+def test_duplicate_content_is_processed_once(stub_tools, alto_docs, tmp_path):
+    os.makedirs(str(tmp_path / "copy"))
+    copy = shutil.copy(alto_docs[0], str(tmp_path / "copy" / os.path.basename(alto_docs[0])))
+    paths = [alto_docs[0], alto_docs[1], copy, alto_docs[2]]
+    plain = [r.tei for r in process_corpus(alto_docs[:3], workers=1)]
+
+    for ordered in (True, False):
+        with CorpusManifest(str(tmp_path / ("manifest%d.db" % ordered))) as manifest:
+            results = {r.path: r for r in process_corpus(paths, workers=2, ordered=ordered, manifest=manifest)}
+            assert [results[p].error for p in paths] == [None] * len(paths)
+            assert [results[p].tei for p in paths] == [plain[0], plain[1], plain[0], plain[2]]
+            assert _attempts(manifest)["tei"] == 3
+            assert manifest.summary()["documents"] == 3
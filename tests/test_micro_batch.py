@@ -0,0 +1,149 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from grobid.labels import LabelSequence
+from grobid.micro_batch import MicroBatcher
+
+
+class FakeLabeler:
+    """每个非空行的标签为该行的第一列，记录每次调用收到的行"""
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self._lock = threading.Lock()
+
+    def __call__(self, rows):
+        with self._lock:
+            self.calls.append(list(rows))
+        if self.error is not None:
+            raise self.error
+        return LabelSequence.from_labels([r.split(" ")[0] for r in rows if r.strip()])
+
+    def documents_per_call(self):
+        return [sum(1 for r in rows if not r.strip()) for rows in self.calls]
+
+
+def doc_rows(doc, n):
+    return ["d%d_r%d x y" % (doc, i) for i in range(n)]
+
+
+def expected_labels(rows):
+    return [r.split(" ")[0] for r in rows if r.strip()]
+
+
+def label_all(batcher, docs):
+    with ThreadPoolExecutor(len(docs)) as pool:
+        futures = [pool.submit(batcher.label, rows) for rows in docs]
+        return [f.result(timeout=10) for f in futures]
+
+
+def wait_pending(batcher, n):
+    deadline = time.monotonic() + 5
+    while batcher.stats()["pending"] < n:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def make_batcher():
+    batchers = []
+
+    def make(label_func, **kwargs):
+        batcher = MicroBatcher(label_func, name="test", **kwargs)
+        batchers.append(batcher)
+        return batcher
+
+    yield make
+
+    for batcher in batchers:
+        batcher.close()
+
+
+def test_max_documents_triggers_batch(make_batcher):
+    labeler = FakeLabeler()
+    batcher = make_batcher(labeler, max_documents=3, max_rows=10 ** 6, max_wait=30)
+
+    started = time.monotonic()
+    label_all(batcher, [doc_rows(i, 2) for i in range(3)])
+
+    # 不等到max_wait，文档数满了立即提交
+    assert time.monotonic() - started < 10
+    assert labeler.documents_per_call() == [3]
+
+
+def test_max_rows_triggers_batch(make_batcher):
+    labeler = FakeLabeler()
+    batcher = make_batcher(labeler, max_documents=100, max_rows=6, max_wait=30)
+
+    started = time.monotonic()
+    label_all(batcher, [doc_rows(0, 3), doc_rows(1, 3)])
+    # 单个文档超过max_rows时独自成为一个批次
+    batcher.label(doc_rows(2, 8))
+
+    assert time.monotonic() - started < 10
+    assert labeler.documents_per_call() == [2, 1]
+
+
+def test_max_wait_triggers_batch(make_batcher):
+    labeler = FakeLabeler()
+    batcher = make_batcher(labeler, max_documents=100, max_rows=10 ** 6, max_wait=0.05)
+
+    started = time.monotonic()
+    labels = batcher.label(doc_rows(0, 2))
+
+    assert time.monotonic() - started >= 0.05
+    assert list(labels.labels()) == expected_labels(doc_rows(0, 2))
+    assert labeler.documents_per_call() == [1]
+
+
+def test_each_caller_gets_its_own_slice(make_batcher):
+    labeler = FakeLabeler()
+    batcher = make_batcher(labeler, max_documents=4, max_rows=40, max_wait=0.02, concurrency=2)
+
+    docs = [doc_rows(i, 1 + (i * 7) % 13) for i in range(24)]
+    # 文档内部的空行分隔多个序列，不计入行数
+    docs[5] = doc_rows(5, 3) + [""] + doc_rows(105, 2)
+
+    results = label_all(batcher, docs)
+
+    for rows, labels in zip(docs, results):
+        assert list(labels.labels()) == expected_labels(rows)
+    assert max(len(call) for call in labeler.calls) > max(len(rows) for rows in docs) + 1
+    assert batcher.stats()["documents"] == len(docs)
+
+
+def test_labeler_error_reaches_every_caller(make_batcher):
+    error = ValueError("wapiti failed")
+    labeler = FakeLabeler(error)
+    batcher = make_batcher(labeler, max_documents=3, max_rows=10 ** 6, max_wait=30)
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(batcher.label, doc_rows(i, 2)) for i in range(3)]
+        for f in futures:
+            assert f.exception(timeout=10) is error
+
+    assert labeler.documents_per_call() == [3]
+
+
+def test_close_flushes_pending_and_rejects_new(make_batcher):
+    labeler = FakeLabeler()
+    batcher = make_batcher(labeler, max_documents=100, max_rows=10 ** 6, max_wait=30)
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(batcher.label, doc_rows(i, 3)) for i in range(2)]
+        wait_pending(batcher, 2)
+
+        started = time.monotonic()
+        batcher.close()
+        results = [f.result(timeout=10) for f in futures]
+
+    assert time.monotonic() - started < 10
+    assert [list(labels.labels()) for labels in results] == [expected_labels(doc_rows(i, 3)) for i in range(2)]
+    assert labeler.documents_per_call() == [2]
+
+    with pytest.raises(RuntimeError):
+        batcher.label(doc_rows(9, 1))
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+from grobid.batch import process_corpus
+from grobid.manifest import CorpusManifest
+from grobid.output_sink import DirectorySink, ShardedSink
+
+
+def _same_name_docs(alto_docs, tmp_path):
+    """a/paper.pdf 和 b/paper.pdf：文件名相同，内容不同"""
+    paths = []
+    for sub, src in zip("ab", alto_docs):
+        os.makedirs(str(tmp_path / sub))
+        paths.append(shutil.copy(src, str(tmp_path / sub / "paper.pdf")))
+    return paths
+
+
+def test_sharded_sink_roundtrip(tmp_path):
+    with ShardedSink(str(tmp_path / "shards"), sync_every=2, max_shard_bytes=64) as sink:
+        records = [sink.write("doc%d" % i, "tei.xml", "<tei n='%d'/>" % i) for i in range(5)]
+        assert sink.read("doc3", "tei.xml") == b"<tei n='3'/>"
+
+    # 重新打开时从索引读回，写入新的分片
+    with ShardedSink(str(tmp_path / "shards")) as sink:
+        assert [sink.read(r.doc, r.name) for r in records] == [b"<tei n='%d'/>" % i for i in range(5)]
+        assert sink.write("doc0", "tei.xml", "<new/>").path not in {r.path for r in records}
+        assert sink.read("doc0", "tei.xml") == b"<new/>"
+
+
+def test_directory_sink_counts_syncs(tmp_path):
+    sink = DirectorySink(str(tmp_path), fsync=True)
+    sink.write("doc", "tei.xml", "<tei/>")
+    assert sink.syncs == 1
+    assert sink.read("doc", "tei.xml") == b"<tei/>"
+
+
+def test_same_file_names_do_not_collide(stub_tools, alto_docs, tmp_path):
+    paths = _same_name_docs(alto_docs, tmp_path)
+    plain = [r.tei for r in process_corpus(paths, workers=1)]
+    assert plain[0] != plain[1]
+
+    for sink in (DirectorySink(str(tmp_path / "dir")), ShardedSink(str(tmp_path / "shards"))):
+        with sink:
+            results = list(process_corpus(paths, workers=1, sink=sink))
+            assert results[0].tei.doc != results[1].tei.doc
+            assert [sink.read(r.tei.doc, "tei.xml").decode("utf-8") for r in results] == plain
+
+
+def test_directory_sink_outputs_recorded_per_document(stub_tools, alto_docs, tmp_path):
+    manifest = CorpusManifest(str(tmp_path / "manifest.db"))
+    sink = DirectorySink(str(tmp_path / "out"))
+
+    results = process_corpus(alto_docs, workers=1, sink=sink, manifest=manifest)
+    first = next(results)
+    # 不等到整个语料结束，写入之后立即记录
+    assert manifest.output(manifest.document_key(first.path)) == {"record": list(first.tei)}
+    results.close()
+
+    # 已经记录的输出文件被删掉之后重新处理
+    os.remove(first.tei.path)
+    rerun = list(process_corpus(alto_docs[:1], workers=1, sink=sink, manifest=manifest))
+    assert rerun[0].error is None and os.path.exists(rerun[0].tei.path)
+    manifest.close()
@@ -0,0 +1,201 @@
+import asyncio
+import importlib
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from grobid import aio, server
+from grobid.server import GrobidServer
+
+
+classifier = importlib.import_module("grobid.classifier")
+
+
+@pytest.fixture
+def resident_workers(stub_tools, monkeypatch):
+    """常驻的stub wapiti worker，每个模型一个"""
+    monkeypatch.setattr(classifier, "worker_pool_size", 1)
+    yield
+    classifier.close_worker_pools()
+
+
+async def request(port, method, path, body=b"", headers=()):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = ["%s %s HTTP/1.1" % (method, path), "Host: localhost", "Content-Length: %d" % len(body)]
+    head.extend("%s: %s" % h for h in headers)
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    head, _, content = response.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    response_headers = dict((k.lower(), v.strip()) for k, _, v in (l.partition(":") for l in lines[1:]))
+    return int(lines[0].split(" ")[1]), response_headers, content
+
+
+def run_server(coro_func, **kwargs):
+    async def main():
+        grobid_server = await GrobidServer(port=0, **kwargs).start()
+        try:
+            return await coro_func(grobid_server)
+        finally:
+            await grobid_server.close()
+
+    return asyncio.run(main())
+
+
+def test_rejects_unbounded_queue():
+    with pytest.raises(ValueError):
+        GrobidServer(queue_size=0)
+    with pytest.raises(ValueError):
+        GrobidServer(workers=0)
+
+
+def test_health_and_metrics(resident_workers):
+    async def check(grobid_server):
+        status, headers, body = await request(grobid_server.port, "GET", "/health")
+        assert status == 200
+        health = json.loads(body)
+        assert health["status"] == "ok" and health["queued"] == 0 and health["label_workers"] == 1
+
+        status, _, body = await request(grobid_server.port, "GET", "/metrics")
+        assert status == 200
+        assert b'grobid_server_responses_total{status="200"} 1' in body
+
+        assert (await request(grobid_server.port, "GET", "/missing"))[0] == 404
+        assert (await request(grobid_server.port, "GET", "/process"))[0] == 405
+
+    run_server(check)
+
+
+def test_process_tei_and_json(resident_workers, alto_docs):
+    with open(alto_docs[0], "rb") as f:
+        content = f.read()
+
+    expected_tei = asyncio.run(aio.aprocess_pdf(alto_docs[0]))
+    expected_json = asyncio.run(aio.aprocess_pdf(alto_docs[0], output_format="json"))
+
+    async def check(grobid_server):
+        status, headers, body = await request(grobid_server.port, "POST", "/process", content)
+        assert status == 200
+        assert headers["content-type"].startswith("application/xml")
+        assert body.decode("utf-8") == expected_tei
+        ET.fromstring(body)
+
+        status, headers, body = await request(grobid_server.port, "POST", "/process?format=json", content)
+        assert status == 200
+        assert json.loads(body) == expected_json
+
+        boundary = "grobidtest"
+        multipart = ("--%s\r\nContent-Disposition: form-data; name=\"input\"; filename=\"doc.xml\"\r\n"
+            "Content-Type: application/xml\r\n\r\n" % boundary).encode() + content + ("\r\n--%s--\r\n" % boundary).encode()
+        status, _, body = await request(grobid_server.port, "POST", "/process", multipart,
+            [("Content-Type", "multipart/form-data; boundary=%s" % boundary)])
+        assert status == 200
+        assert body.decode("utf-8") == expected_tei
+
+        assert (await request(grobid_server.port, "POST", "/process?format=pdf", content))[0] == 400
+
+    run_server(check)
+
+
+def test_upload_too_large(resident_workers):
+    async def check(grobid_server):
+        status, _, body = await request(grobid_server.port, "POST", "/process", b"x" * 2048)
+        assert status == 413
+        assert grobid_server.responses[413] == 1
+
+    run_server(check, max_upload=1024)
+
+
+def test_queue_full(resident_workers, monkeypatch):
+    release = None
+    started = []
+
+    async def slow_process(path, **kwargs):
+        started.append(path)
+        await release.wait()
+        return "<tei/>"
+
+    monkeypatch.setattr(server.aio, "aprocess_pdf", slow_process)
+
+    async def check(grobid_server):
+        nonlocal release
+        release = asyncio.Event()
+        port = grobid_server.port
+
+        # 第一个文档在处理中，第二个在排队，队列已满
+        first = asyncio.ensure_future(request(port, "POST", "/process", b"<alto/>"))
+        while grobid_server.in_flight < 1:
+            await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(request(port, "POST", "/process", b"<alto/>"))
+        while grobid_server._queue.qsize() < 1:
+            await asyncio.sleep(0.01)
+
+        status, headers, _ = await request(port, "POST", "/process", b"<alto/>")
+        assert status == 429
+        assert headers["retry-after"] == "1"
+
+        release.set()
+        assert (await first)[0] == 200
+        assert (await second)[0] == 200
+        assert len(started) == 2
+
+    run_server(check, workers=1, queue_size=1)
+
+
+def test_disconnected_client_is_skipped(resident_workers, monkeypatch):
+    release = None
+    started = []
+
+    async def slow_process(path, **kwargs):
+        started.append(path)
+        await release.wait()
+        return "<tei/>"
+
+    monkeypatch.setattr(server.aio, "aprocess_pdf", slow_process)
+
+    async def check(grobid_server):
+        nonlocal release
+        release = asyncio.Event()
+        port = grobid_server.port
+
+        first = asyncio.ensure_future(request(port, "POST", "/process", b"<alto/>"))
+        while grobid_server.in_flight < 1:
+            await asyncio.sleep(0.01)
+
+        # 排队中的请求断开之后，不再处理这个文档
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /process HTTP/1.1\r\nContent-Length: 7\r\n\r\n<alto/>")
+        await writer.drain()
+        while grobid_server._queue.qsize() < 1:
+            await asyncio.sleep(0.01)
+        writer.close()
+        await asyncio.sleep(0.1)
+
+        release.set()
+        assert (await first)[0] == 200
+        await grobid_server._queue.join()
+        assert len(started) == 1
+
+    run_server(check, workers=1, queue_size=1)
+
+
+def test_main_starts_process_pool_before_warm_up(monkeypatch):
+    # warm_up在serve中启动wapiti worker，进程池的worker要在这之前全部fork出来
+    monkeypatch.setattr(classifier, "label_backend", classifier.label_backend)
+    monkeypatch.setattr(classifier, "worker_pool_size", classifier.worker_pool_size)
+    monkeypatch.setattr("sys.argv", ["grobid-server", "--processes", "2", "--label-workers", "0"])
+
+    started = []
+
+    async def fake_serve(executor=None, **kwargs):
+        started.append(len(executor._processes))
+
+    monkeypatch.setattr(server, "serve", fake_serve)
+    server.main()
+
+    assert started == [2]
@@ -0,0 +1,144 @@
+import re
+
+import numpy as np
+import pytest
+
+from grobid.alto_document import iter_alto_pages
+from grobid.alto_file import AltoFile, page_tokens_in_zones
+from grobid.geometry import contains
+from grobid.spatial_index import GridIndex, PageSpatialIndex, as_rect_array
+
+from benchmarks import synthetic_alto
+
+
+def brute_intersects(bboxes, rect):
+    """和fitz.Rect.intersects一致：空的rect不和任何bbox相交，只接触边界不算"""
+    if rect[0] >= rect[2] or rect[1] >= rect[3]:
+        return np.empty(0, dtype=np.int64)
+    hit = (bboxes[:, 0] < rect[2]) & (rect[0] < bboxes[:, 2]) & (bboxes[:, 1] < rect[3]) & (rect[1] < bboxes[:, 3])
+    return np.flatnonzero(hit)
+
+
+def random_boxes(seed, n=300, size=600.0):
+    r = np.random.RandomState(seed)
+    xy = r.uniform(0, size, (n, 2))
+    wh = r.uniform(0, 60, (n, 2))
+    # 一部分是宽或高为0的bbox
+    wh[r.rand(n) < 0.1, 0] = 0
+    wh[r.rand(n) < 0.1, 1] = 0
+    return np.hstack([xy, xy + wh]).astype(np.float32)
+
+
+def query_rects(index, seed):
+    r = np.random.RandomState(seed)
+    ox, oy = index.origin
+    cw, ch = index.cell_size
+    rects = []
+    for _ in range(100):
+        x0, y0 = r.uniform(-20, 620, 2)
+        w, h = r.uniform(0, 300, 2)
+        rects.append((x0, y0, x0 + w, y0 + h))
+    # 边界正好在格子边界上的rect，以及跨很多格子的rect
+    for k in range(0, 10):
+        rects.append((ox + k * cw, oy + k * ch, ox + (k + 1) * cw, oy + (k + 3) * ch))
+        rects.append((ox + k * cw, oy, ox + k * cw + 1e-3, oy + 600))
+    rects.append((-1000, -1000, 1000, 1000))
+    # 面积为0的rect
+    rects.append((100, 100, 100, 200))
+    rects.append((100, 100, 200, 100))
+    return [tuple(np.float32(v) for v in rect) for rect in rects]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_query_matches_brute_force(seed):
+    bboxes = random_boxes(seed)
+    index = GridIndex(bboxes, cells_per_side=16)
+
+    for rect in query_rects(index, seed):
+        assert sorted(index.query(rect).tolist()) == brute_intersects(bboxes, rect).tolist(), rect
+        expected_within = np.flatnonzero(contains(rect, bboxes)).tolist()
+        assert sorted(index.within(rect).tolist()) == expected_within, rect
+
+
+def test_boxes_on_cell_boundaries():
+    # 每个bbox的边都在格子边界上，包括宽高为0的
+    edges = np.arange(0, 101, 10, dtype=np.float32)
+    bboxes = np.array([(x, y, x + 10, y + 10) for x in edges[:-1] for y in edges[:-1]]
+        + [(x, 0, x, 100) for x in edges] + [(0, y, 100, y) for y in edges], dtype=np.float32)
+    index = GridIndex(bboxes, cells_per_side=10)
+
+    for rect in [(10, 10, 20, 20), (0, 0, 100, 100), (9.5, 9.5, 10.5, 10.5), (30, 0, 30.001, 100), (50, 50, 50, 50)]:
+        rect = tuple(np.float32(v) for v in rect)
+        assert sorted(index.query(rect).tolist()) == brute_intersects(bboxes, rect).tolist(), rect
+        assert sorted(index.within(rect).tolist()) == np.flatnonzero(contains(rect, bboxes)).tolist(), rect
+
+
+def test_intersects_any():
+    bboxes = random_boxes(7)
+    zones = as_rect_array([(0, 0, 50, 600), (300, 300, 420, 310), (200, 200, 200, 400)])
+    expected = np.zeros(len(bboxes), dtype=bool)
+    for zone in zones:
+        expected[brute_intersects(bboxes, zone)] = True
+
+    assert (GridIndex(bboxes).intersects_any(zones) == expected).all()
+
+
+def test_empty_index():
+    index = GridIndex(np.empty((0, 4), dtype=np.float32))
+    assert len(index) == 0
+    assert index.query((0, 0, 10, 10)).tolist() == []
+    assert index.within((0, 0, 10, 10)).tolist() == []
+    assert index.intersects_any(as_rect_array([(0, 0, 10, 10)])).tolist() == []
+
+    page = PageSpatialIndex(np.empty((0, 4), dtype=np.float32), np.empty((0, 4), dtype=np.float32), 5, 3)
+    assert page.tokens_in_rect((0, 0, 10, 10)).tolist() == []
+    assert page.lines_in_rect((0, 0, 10, 10)).tolist() == []
+
+
+def test_page_index_offsets():
+    bboxes = random_boxes(3, n=50)
+    page = PageSpatialIndex(bboxes, bboxes[:10], token_offset=100, line_offset=20)
+    rect = (100, 100, 400, 400)
+    assert sorted(page.tokens_in_rect(rect).tolist()) == (brute_intersects(bboxes, rect) + 100).tolist()
+    assert sorted(page.lines_in_rect(rect).tolist()) == (brute_intersects(bboxes[:10], rect) + 20).tolist()
+
+
+@pytest.fixture
+def alto_with_empty_page(tmp_path):
+    """三页的合成ALTO，第二页没有任何内容"""
+    text = "".join(synthetic_alto.iter_alto(pages=3, blocks=4, lines=4, seed=3))
+    text = re.sub(r'(<Page ID="Page2"[^>]*><PrintSpace>).*?(</PrintSpace></Page>)', r"\1\2", text)
+    path = tmp_path / "empty_page.xml"
+    path.write_text(text)
+    return str(path)
+
+
+def test_tokens_in_zones_matches_brute_force(alto_with_empty_page):
+    alto_file = AltoFile(alto_with_empty_page)
+    zones = {1: [(72, 60, 300, 200), (0, 0, 600, 30)], 2: [(0, 0, 600, 800)], 3: [(250, 100, 250, 500), (80, 300, 500, 420)]}
+
+    mask = alto_file.tokens_in_zones(zones)
+    table = alto_file.pdf_data
+    assert table.page_slice(1).stop == table.page_slice(1).start
+
+    expected = np.zeros(len(table), dtype=bool)
+    for page_idx in range(table.page_count()):
+        page = table.page_slice(page_idx)
+        for zone in as_rect_array(zones.get(page_idx + 1, [])):
+            expected[page.start + brute_intersects(table.bbox[page], zone)] = True
+
+    assert expected.any()
+    assert (mask == expected).all()
+
+    # 流式处理时逐页计算的结果和整个文档的一致
+    for page in iter_alto_pages(alto_with_empty_page):
+        page_mask = page_tokens_in_zones(page, zones)
+        assert (page_mask == mask[table.page_slice(page.idx)]).all()
+
+    # 同一组zone作用于每一页
+    shared = [(72, 60, 300, 200)]
+    expected = np.zeros(len(table), dtype=bool)
+    for page_idx in range(table.page_count()):
+        page = table.page_slice(page_idx)
+        expected[page.start + brute_intersects(table.bbox[page], as_rect_array(shared)[0])] = True
+    assert (alto_file.tokens_in_zones(shared) == expected).all()
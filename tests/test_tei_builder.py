@@ -0,0 +1,43 @@
+import json
+import xml.etree.ElementTree as ET
+
+from grobid.tei_builder import build_tei_body, build_tei_json
+
+
+def _row(token, label, pos="LINEIN"):
+    # fulltext特征行：token在第0列，第11列为行内位置
+    cols = [token] + ["x"] * 10 + [pos] + ["0"] * 4
+    return " ".join(cols) + "\t" + label + "\n"
+
+
+ROWS = [
+    _row("R&D", "I-<paragraph>", "LINESTART"),
+    _row("<x>", "<paragraph>"),
+    _row("a>b", "<paragraph>", "LINEEND"),
+    "malformed row without label\n",
+]
+
+
+def test_tei_escapes_text():
+    tei = build_tei_body(ROWS)
+
+    assert "R&amp;D" in tei
+    assert "&lt;x&gt;" in tei
+    assert "a&gt;b" in tei
+
+    root = ET.fromstring(tei.encode("utf-8"))
+    text = " ".join(t.strip() for t in root.itertext() if t.strip())
+    assert "R&D <x> a>b" in text
+
+
+def test_tei_compact_matches_pretty():
+    pretty = ET.fromstring(build_tei_body(ROWS).encode("utf-8"))
+    compact = ET.fromstring(build_tei_body(ROWS, pretty=False).encode("utf-8"))
+    assert [t.strip() for t in pretty.itertext() if t.strip()] == [t.strip() for t in compact.itertext() if t.strip()]
+
+
+def test_json_keeps_raw_text():
+    result = build_tei_json(ROWS)
+    json.dumps(result)
+    paragraphs = [p for section in result["sections"] for p in section["paragraphs"]]
+    assert "R&D <x> a>b" in paragraphs
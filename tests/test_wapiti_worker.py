@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from grobid.wapiti_worker import WapitiError, WapitiPool, WapitiWorker, split_sequences
+
+from benchmarks.stub_labeler import label_fulltext
+
+
+ROWS = ["Section a b", "3 c d", "The e f", "( g h", "Table i j"]
+
+
+def test_split_sequences():
+    lines = ["a 1\n", "b 2\n", "\n", "\n", "c 3\n", "   \n", "d 4"]
+    assert list(split_sequences(lines)) == [["a 1", "b 2"], ["c 3"], ["d 4"]]
+
+
+def test_worker_aligns_labels_with_rows(stub_tools):
+    worker = WapitiWorker(str(stub_tools / "fulltext_model.wapiti"))
+    try:
+        assert worker.label(ROWS) == label_fulltext(ROWS)
+        # 同一个进程处理下一个序列，空行分隔的序列之间不会错位
+        proc = worker._proc
+        assert worker.label(ROWS[2:]) == label_fulltext(ROWS[2:])
+        assert worker.label(ROWS[:1]) == label_fulltext(ROWS[:1])
+        assert worker._proc is proc
+        assert worker.label([]) == []
+    finally:
+        worker.close()
+
+
+def test_worker_retries_once_after_crash(stub_tools, tmp_path, monkeypatch):
+    crash_file = tmp_path / "crash"
+    log_file = tmp_path / "starts"
+    monkeypatch.setenv("STUB_WAPITI_CRASH", str(crash_file))
+    monkeypatch.setenv("STUB_WAPITI_LOG", str(log_file))
+
+    worker = WapitiWorker(str(stub_tools / "fulltext_model.wapiti"))
+    try:
+        worker.start()
+        crash_file.write_text("")
+        assert worker.label(ROWS) == label_fulltext(ROWS)
+        # 崩溃之后重启了一次
+        assert len(log_file.read_text().split()) == 2
+    finally:
+        worker.close()
+
+
+def test_worker_raises_when_retry_fails(stub_tools, tmp_path, monkeypatch):
+    monkeypatch.setattr("grobid.cmd_utils.wapiti_path", str(tmp_path / "missing"))
+    worker = WapitiWorker(str(stub_tools / "fulltext_model.wapiti"))
+
+    with pytest.raises(OSError):
+        worker.label(ROWS)
+    assert not worker.alive()
+
+
+def test_worker_raises_on_repeated_crash(stub_tools, tmp_path, monkeypatch):
+    stub = tmp_path / "wapiti"
+    stub.write_text("#!/bin/sh\nread line\nexit 3\n")
+    os.chmod(str(stub), 0o755)
+    monkeypatch.setattr("grobid.cmd_utils.wapiti_path", str(stub))
+
+    worker = WapitiWorker(str(stub_tools / "fulltext_model.wapiti"))
+    # 写入时进程可能已经退出(BrokenPipeError)，也可能在读取结果时发现
+    with pytest.raises((OSError, WapitiError)):
+        worker.label(ROWS)
+    assert not worker.alive()
+
+
+def test_pool_label_lines(stub_tools):
+    pool = WapitiPool(str(stub_tools / "fulltext_model.wapiti"), size=2)
+    try:
+        pool.start()
+        lines = [r + "\n" for r in ROWS[:2]] + ["\n"] + [r + "\n" for r in ROWS[2:]]
+        assert pool.label_lines(lines) == label_fulltext(ROWS[:2]) + label_fulltext(ROWS[2:])
+    finally:
+        pool.close()